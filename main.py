@@ -1,5 +1,5 @@
 import customtkinter as ctk
-from tkinter import filedialog, scrolledtext, messagebox
+from tkinter import filedialog, scrolledtext, messagebox, ttk
 import tkinter as tk
 import subprocess
 import threading
@@ -8,13 +8,3915 @@ import sys
 import requests
 import platform
 import shutil
+import logging
+import json
+import sqlite3
+import hashlib
+import tempfile
+import zipfile
+import queue
+import random
+import mmap
+import re
+import time
+import itertools
+import difflib
+import heapq
+import struct
+import shlex
+import zlib
+import datetime
+import urllib.parse
+import ast
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# gallery-dl as a library is optional; without it only the subprocess engine is available
+try:
+    import gallery_dl
+    from gallery_dl import config as gdl_config
+    from gallery_dl.downloader import common as gdl_downloader_common
+    from gallery_dl import exception as gdl_exception
+    from gallery_dl import extractor as gdl_extractor
+    from gallery_dl.extractor import common as gdl_extractor_common
+    from gallery_dl import job as gdl_job
+    from gallery_dl import option as gdl_option
+    from gallery_dl import util as gdl_util
+except ImportError:
+    gallery_dl = None
+
+# Pillow is optional; without it the Gallery tab shows placeholders instead of thumbnails
+try:
+    from PIL import Image, ImageTk
+except ImportError:
+    Image = None
 
 # Set appearance mode and color theme
 ctk.set_appearance_mode("system")  # Modes: "System", "Dark", "Light"
 ctk.set_default_color_theme("blue")  # Themes: "blue", "green", "dark-blue"
 
-# Debug flag - set to True to force download dialog even if gallery-dl is found
-FORCE_DOWNLOAD_DIALOG = False
+# Debug flag - set to True to force download dialog even if gallery-dl is found
+FORCE_DOWNLOAD_DIALOG = False
+
+# Console pump - worker threads queue lines, the Tk main loop drains them on a timer
+CONSOLE_POLL_MS = 50
+CONSOLE_MAX_LINES_PER_TICK = 500
+
+# Console keeps only the last N lines; the full output goes to a per-job log file
+CONSOLE_MAX_LINES = 5000
+LOG_MAX_BYTES = 64 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+def get_data_dir(*parts):
+    """Return (and create) a directory for files the UI keeps between runs."""
+    if getattr(sys, "frozen", False):
+        base_dir = os.path.dirname(sys.executable)
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    path = os.path.join(base_dir, "gallery-ui-data", *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class JobLog:
+    """Append-only log file for one job, rotated once it grows past max_bytes."""
+    
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8", errors="replace")
+    
+    def write(self, line):
+        with self.lock:
+            if self.file is None:
+                return
+            self.file.write(line + "\n")
+            if self.file.tell() >= self.max_bytes:
+                self._rotate()
+    
+    def _rotate(self):
+        # job.log -> job.log.1 -> job.log.2 ..., dropping the oldest
+        self.file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "a", encoding="utf-8", errors="replace")
+    
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+class MappedLog:
+    """Read-only view of a log file through mmap with a line-offset index."""
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        # offsets[i] is the byte offset where line i starts
+        self.offsets = array("Q", [0])
+    
+    def build_index(self):
+        """Scan the mapping once for newlines. Slow for huge files, so run it off the UI thread."""
+        if self.mm is None:
+            return
+        offsets = array("Q", [0])
+        find = self.mm.find
+        pos = 0
+        while True:
+            pos = find(b"\n", pos)
+            if pos == -1:
+                break
+            pos += 1
+            offsets.append(pos)
+        self.offsets = offsets
+    
+    def line_count(self):
+        count = len(self.offsets)
+        if count and self.offsets[-1] >= self.size:
+            count -= 1  # file ends with a newline, no trailing partial line
+        return count
+    
+    def get_lines(self, start, count):
+        total = self.line_count()
+        end = min(start + count, total)
+        if self.mm is None or start >= end:
+            return []
+        begin = self.offsets[start]
+        stop = self.offsets[end] if end < len(self.offsets) else self.size
+        data = self.mm[begin:stop].decode("utf-8", errors="replace")
+        return data.rstrip("\n").split("\n")
+    
+    def search(self, pattern, start_line=0):
+        """Return the first line at or after start_line matching the regex, or None."""
+        if self.mm is None or start_line >= self.line_count():
+            return None
+        regex = re.compile(pattern.encode("utf-8"))
+        match = regex.search(self.mm, self.offsets[start_line])
+        if not match:
+            return None
+        return bisect_right(self.offsets, match.start()) - 1
+    
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.file.close()
+
+# Parallel downloads - how many gallery-dl processes run at once, overall and per site
+DEFAULT_MAX_JOBS = 4
+DEFAULT_MAX_JOBS_PER_HOST = 2
+JOB_TABLE_REFRESH_MS = 500
+
+ENGINE_SUBPROCESS = "Subprocess"
+ENGINE_LIBRARY = "In-process (library)"
+ENGINE_WARM_POOL = "Warm worker pool"
+# Options decided per job at launch, and the gallery-dl config keys they set. In-process runs
+# give them to the job's own extractor and downloader so gallery-dl's shared config (and a
+# standby process's command line) stays the same for every job.
+LAUNCH_OPTION_KEYS = {"--sleep": "sleep", "-r": "rate", "--proxy": "proxy"}
+
+# Queue order - job costs are the wall time of the URL's last run, or else the average
+# of the host's URLs of the same kind (single post or not), or else these defaults
+SCHEDULE_MANUAL = "Manual (drag queued jobs)"
+SCHEDULE_SHORTEST = "Shortest job first"
+SCHEDULE_FAIR = "Fair share per host"
+HISTORY_POST_SECONDS = 10.0
+HISTORY_DEFAULT_SECONDS = 300.0
+
+# Adaptive rate control - per-host limits grow while downloads are clean and halve on trouble
+ADAPTIVE_MAX_JOBS_PER_HOST = 8
+ADAPTIVE_MAX_SLEEP = 60.0
+ADAPTIVE_SLEEP_STEP = 0.25
+ADAPTIVE_CLEAN_FILES = 20
+ADAPTIVE_BACKOFF_COOLDOWN = 10.0
+ADAPTIVE_SAVE_INTERVAL = 5.0
+
+# Global bandwidth budget - shares are re-checked periodically; a subprocess job whose
+# share moved by more than BANDWIDTH_RESTART_FACTOR is restarted with its new -r value
+BANDWIDTH_REBALANCE_SECONDS = 30.0
+BANDWIDTH_WARMUP_SECONDS = 15.0
+BANDWIDTH_MIN_RUN_SECONDS = 60.0
+BANDWIDTH_RESTART_FACTOR = 2.0
+BANDWIDTH_MIN_SHARE = 64 * 1024
+
+# Proxy pool - every proxy is probed each PROXY_CHECK_INTERVAL seconds; latency and error rate
+# are moving averages, and PROXY_EJECT_FAILURES failures in a row take a proxy out of rotation
+PROXY_CHECK_URL = "https://www.gstatic.com/generate_204"
+PROXY_CHECK_INTERVAL = 60.0
+PROXY_CHECK_TIMEOUT = 10.0
+PROXY_CHECK_WORKERS = 8
+PROXY_SMOOTHING = 0.3
+PROXY_EJECT_FAILURES = 3
+PROXY_DEFAULT_LATENCY = 1.0
+PROXY_TABLE_REFRESH_MS = 2000
+PROXY_ERROR_PATTERN = re.compile(r"ProxyError|connect to proxy|Tunnel connection failed|SOCKS", re.IGNORECASE)
+
+# Job journal - state changes are written in batched transactions
+JOURNAL_FLUSH_SECONDS = 1.0
+JOURNAL_BATCH_SIZE = 500
+JOB_STATES_UNFINISHED = ("queued", "running")
+
+# Failed URLs wait RETRY_BASE_DELAY * 2^(attempt - 1) seconds (with jitter, capped) before they
+# run again; a host's URLs that come due within RETRY_GROUP_WINDOW are retried together
+RETRY_BASE_DELAY = 30.0
+RETRY_MAX_DELAY = 30 * 60.0
+RETRY_MAX_ATTEMPTS = 4
+RETRY_GROUP_WINDOW = 60.0
+# gallery-dl exit code bits that another attempt will not fix: auth, format/input, unsupported URL
+RETRY_PERMANENT_CODES = 16 | 32 | 64
+
+# Watch list - each subscription is checked every interval (give or take WATCH_JITTER of it),
+# at most WATCH_MAX_CHECKS at a time; a check stops at a file the last one downloaded
+# or after WATCH_ABORT_SKIPS files that are already known
+WATCH_DEFAULT_HOURS = 24.0
+WATCH_JITTER = 0.1
+WATCH_MAX_CHECKS = 4
+WATCH_ABORT_SKIPS = 3
+WATCH_MARK_SIZE = 5
+WATCH_POLL_MS = 30 * 1000
+
+# URL import - large lists are queued in per-host chunks, and a job with more than
+# ARGV_URL_LIMIT URLs gets them through a temporary -i input file instead of argv
+IMPORT_CHUNK_SIZE = 100
+IMPORT_PROGRESS_LINES = 50000
+ARGV_URL_LIMIT = 20
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "igshid", "mc_cid", "mc_eid", "ref", "ref_src", "si"}
+KEMONO_HOSTS = re.compile(r"^(?:kemono|coomer)\.[a-z]+$")
+KEMONO_PATH = re.compile(r"^(?:/api/v1)?/([^/]+)/user/([^/]+)(?:/post/([^/]+))?", re.IGNORECASE)
+
+# Shared download archive - URLs matching these patterns point at a single post whose
+# content does not change, so once fully downloaded they are skipped before dispatch
+SINGLE_POST_PATTERNS = re.compile(
+    r"/post/[^/?#]+/?$|/posts/\d+|/art/[^/?#]+|/view/\d+|/post/show/\d+|[?&]page=post&s=view&id=\d+"
+)
+# Modes in which a finished job did not actually download anything
+NO_DOWNLOAD_OPTIONS = ("-s", "--simulate", "-g", "--get-urls", "-j", "--dump-json", "--no-download")
+SQLITE_IN_BATCH = 500
+
+# Metadata cache for previewing --filter, --range and size limits without crawling the site again
+METADATA_CACHE_TTL = 24 * 3600
+METADATA_PREVIEW_DELAY_MS = 250
+# Decoded cache entries kept in memory, least recently used dropped first
+METADATA_MEMORY_URLS = 200
+# Options that are evaluated locally from the cache instead of during the -j pass
+METADATA_LOCAL_OPTIONS = ("--filter", "--range", "--filesize-min", "--filesize-max", "-i")
+# Longer --range lists are not worth it; the job then runs with the user's own options
+METADATA_RANGE_MAX_CHARS = 8000
+# -j writes datetimes as plain strings
+METADATA_DATETIME = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d(?:\.\d+)?$")
+METADATA_SIZE_KEYS = ("filesize", "file_size", "size")
+MESSAGE_URL = 3
+MESSAGE_QUEUE = 6
+MESSAGE_ERROR = -1
+
+# Filter optimizer: relative evaluation cost of calls, used to put cheap clauses first
+FILTER_CALL_COSTS = {"re": 20, "contains": 8}
+FILTER_DEFAULT_CALL_COST = 5
+# Calls with side effects; clauses are never moved across them
+FILTER_CONTROL_CALLS = {"abort", "error", "terminate", "restart"}
+FILTER_BENCH_REPEAT = 5
+BENCH_FILTER_FLAG = "--bench-filter"
+
+# Full-text index of write-metadata sidecars
+SEARCH_INDEX_WORKERS = 8
+SEARCH_INDEX_BATCH_SIZE = 1000
+SEARCH_RESULT_LIMIT = 1000
+SEARCH_TEXT_MAX_CHARS = 10000
+SEARCH_ARTIST_KEYS = ("artist", "author", "creator", "uploader", "username", "user", "owner")
+SEARCH_TEXT_KEYS = ("title", "description", "content", "caption")
+# Tag autocomplete in the filter builder
+TAG_COMPLETIONS = 6
+TAG_COMPLETION_SCAN = 200000
+TAG_SUGGESTIONS = 3
+TAG_SUGGESTION_CANDIDATES = 5000
+TAG_SUGGESTION_CUTOFF = 0.75
+
+# Post-processing commands run by the UI instead of one gallery-dl --exec shell per file
+EXEC_PER_FILE = "Per file (gallery-dl --exec)"
+EXEC_BATCHED = "Batched (worker pool)"
+EXEC_STDIN = "Persistent helper (paths on stdin)"
+EXEC_WORKERS = min(os.cpu_count() or 4, 8)
+EXEC_QUEUE_SIZE = 1000
+EXEC_BATCH_SIZE = 200
+EXEC_BATCH_MAX_CHARS = 7000
+EXEC_BATCH_LINGER = 2.0
+
+# ZIP/CBZ archiving done by the UI instead of gallery-dl's single-threaded --zip/--cbz
+ARCHIVE_STORED_EXTENSIONS = frozenset((
+    ".jpg", ".jpeg", ".jpe", ".jfif", ".png", ".apng", ".gif", ".webp", ".avif", ".heic", ".heif", ".jxl",
+    ".mp4", ".m4v", ".webm", ".mkv", ".mov", ".avi", ".flv", ".ts", ".mp3", ".m4a", ".aac", ".ogg", ".opus",
+    ".flac", ".zip", ".cbz", ".rar", ".cbr", ".7z", ".gz", ".bz2", ".xz", ".zst", ".pdf", ".epub",
+))
+ARCHIVE_WORKERS = min(os.cpu_count() or 4, 8)
+ARCHIVE_QUEUE_SIZE = 200
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+ARCHIVE_SPOOL_SIZE = 16 * 1024 * 1024
+ARCHIVE_DEFLATE_LEVEL = 6
+# Archives kept open at once; past this the least recently used one is closed (central directory written)
+ARCHIVE_OPEN_LIMIT = 64
+# Entries deflated by the workers are appended through zipfile internals checked against these
+# CPython versions; elsewhere zipfile deflates them itself, under the archive's lock
+ARCHIVE_RAW_DEFLATE = platform.python_implementation() == "CPython" and (3, 8) <= sys.version_info[:2] <= (3, 13)
+
+# Integrity checks of finished downloads
+VERIFY_WORKERS = min(os.cpu_count() or 4, 4)
+VERIFY_QUEUE_SIZE = 1000
+VERIFY_TAIL_BYTES = 64 * 1024
+VERIFY_MAX_ATTEMPTS = 2
+VERIFY_HEADERS_KEY = "_ui_http_headers"
+# Given to in-process runs only while verifying: the http downloader keeps each response's headers
+# for the size check, and an empty "metadata-http" stops an extra HEAD request per file to get them.
+# They come first so a user's own -o settings still win.
+VERIFY_HEADER_OPTIONS = ["-o", f"http-metadata={VERIFY_HEADERS_KEY}", "-o", "metadata-http="]
+VERIFY_VIDEO_EXTENSIONS = frozenset((".mp4", ".m4v", ".mov", ".webm", ".mkv", ".avi", ".flv", ".ts"))
+VERIFY_MP4_BOXES = frozenset((b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pnot", b"uuid", b"moof", b"styp"))
+# Options of the original job that do not apply to re-downloading one file
+VERIFY_RETRY_STRIP_OPTIONS = (
+    ("-d", True), ("--filter", True), ("--range", True), ("-i", True), ("--download-archive", True),
+    ("--exec-after", True), ("--write-metadata", False), ("--write-tags", False)
+)
+
+# Thumbnail gallery of the destination
+GALLERY_EXTENSIONS = frozenset((".jpg", ".jpeg", ".jpe", ".jfif", ".png", ".gif", ".webp", ".bmp", ".tif", ".tiff"))
+GALLERY_THUMB_SIZE = 160
+GALLERY_CELL_SIZE = GALLERY_THUMB_SIZE + 16
+GALLERY_BACKGROUND = "#212121"
+GALLERY_DECODE_WORKERS = min(os.cpu_count() or 4, 4)
+GALLERY_MEMORY_BUDGET = 256 * 1024 * 1024
+GALLERY_PREFETCH_ROWS = 3
+GALLERY_KEY_BYTES = 64 * 1024
+GALLERY_SCROLL_STEP = 60
+GALLERY_NEWEST = "Newest first"
+GALLERY_NAME = "By name"
+
+# Content-hash de-duplication of the destination directory
+DEDUP_HASH_WORKERS = 8
+DEDUP_READ_SIZE = 1024 * 1024
+DEDUP_MMAP_THRESHOLD = 64 * 1024 * 1024
+DEDUP_PROGRESS_FILES = 1000
+DEDUP_REPORT = "Report only"
+DEDUP_HARDLINK = "Hardlink duplicates"
+DEDUP_DELETE = "Delete duplicates"
+
+# Destination index: directories modified this recently are listed again on the next refresh,
+# since a file created within the same mtime tick would not change the directory's mtime
+DEST_INDEX_SETTLE_SECONDS = 2.0
+DEST_INDEX_BATCH_SIZE = 1000
+
+# Command line flag that turns this script into a warm worker process
+WARM_WORKER_FLAG = "--worker"
+
+# Options added to every gallery-dl process so its output can be parsed into events: a custom
+# output mode prints downloaded files as "+ path" and skipped ones as "# path" behind OUTPUT_MARK,
+# which no log line or other output starts with, and no progress lines
+OUTPUT_MARK = "\x1f"
+OUTPUT_FILE_PREFIX = OUTPUT_MARK + "+ "
+OUTPUT_SKIP_PREFIX = OUTPUT_MARK + "# "
+MACHINE_OUTPUT_OPTIONS = [
+    "-o", "output.mode=" + json.dumps({"start": "", "success": OUTPUT_FILE_PREFIX + "{}\n", "skip": OUTPUT_SKIP_PREFIX + "{}\n"}),
+    "-o", "output.shorten=false",
+    "-o", "downloader.progress=null",
+]
+
+# Dashboard rates are smoothed over roughly this many seconds
+DASHBOARD_SMOOTHING_SECONDS = 5.0
+
+EVENT_FILE = "file"
+EVENT_SKIP = "skip"
+EVENT_ERROR = "error"
+EVENT_RETRY = "retry"
+EVENT_RATE_LIMITED = "rate-limited"
+EVENT_LOG = "log"
+
+# url and expected (the size announced by the server) are only known for in-process runs
+DownloadEvent = namedtuple(
+    "DownloadEvent", ["kind", "path", "message", "size", "url", "expected"], defaults=(None, None, 0, None, None)
+)
+
+LOG_LINE_PATTERN = re.compile(r"^\[([^\]]+)\]\[(\w+)\] (.*)$")
+RETRY_PATTERN = re.compile(r"\(\d+/\d+\)$")
+RATE_LIMIT_PATTERN = re.compile(r"\b429\b|Too Many Requests")
+SERVER_TROUBLE_PATTERN = re.compile(r"\b5\d\d\b|timed? ?out|timeout", re.IGNORECASE)
+
+def parse_output_line(line):
+    """Turn one line of gallery-dl output (run with MACHINE_OUTPUT_OPTIONS) into a DownloadEvent."""
+    if line.startswith(OUTPUT_FILE_PREFIX):
+        path = line[len(OUTPUT_FILE_PREFIX):]
+        return DownloadEvent(EVENT_FILE, path=path, size=get_file_size(path))
+    if line.startswith(OUTPUT_SKIP_PREFIX):
+        return DownloadEvent(EVENT_SKIP, path=line[len(OUTPUT_SKIP_PREFIX):])
+    match = LOG_LINE_PATTERN.match(line)
+    if match:
+        name, level, message = match.groups()
+        if RATE_LIMIT_PATTERN.search(message):
+            return DownloadEvent(EVENT_RATE_LIMITED, message=message)
+        if RETRY_PATTERN.search(message) and level in ("warning", "debug"):
+            return DownloadEvent(EVENT_RETRY, message=message)
+        if level in ("error", "critical"):
+            return DownloadEvent(EVENT_ERROR, message=message)
+        return DownloadEvent(EVENT_LOG, message=message)
+    # Anything else is other output, such as URLs from -g or JSON from -j
+    return DownloadEvent(EVENT_LOG, message=line)
+
+def parse_byte_rate(text):
+    """Parse a gallery-dl style rate such as "500k" or "2.5M" into bytes per second."""
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)b?\s*$", text or "", re.IGNORECASE)
+    if not match:
+        return None
+    number, suffix = match.groups()
+    return int(float(number) * 1024 ** " kmg".index(suffix.lower() or " "))
+
+def format_byte_rate(rate):
+    """Format bytes per second as a gallery-dl -r value."""
+    return f"{max(int(rate / 1024), 1)}k"
+
+def get_file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+def get_host(url):
+    """Host name of a URL without a leading "www.", used to group jobs per site."""
+    host = urllib.parse.urlsplit(url.strip()).hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    return host or "unknown"
+
+def remove_option(options, flag, takes_value=True):
+    """Return a copy of a gallery-dl argument list without flag (and its value)."""
+    result = []
+    skip_next = False
+    for arg in options:
+        if skip_next:
+            skip_next = False
+        elif arg == flag:
+            skip_next = takes_value
+        else:
+            result.append(arg)
+    return result
+
+def format_command(args):
+    """Join a command line for the console and job logs, with the password and proxy credentials masked."""
+    masked = list(args)
+    for index in range(len(masked) - 1):
+        if masked[index] == "-p":
+            masked[index + 1] = "********"
+        elif masked[index] == "--proxy":
+            masked[index + 1] = proxy_label(masked[index + 1])
+    return " ".join(masked)
+
+def set_option(options, flag, value):
+    """Return a copy of a gallery-dl argument list with flag set to value."""
+    return remove_option(options, flag) + [flag, str(value)]
+
+def get_option(options, flag):
+    """Value of flag in a gallery-dl argument list (the last one if repeated), or None."""
+    value = None
+    for arg, next_arg in zip(options, options[1:]):
+        if arg == flag:
+            value = next_arg
+    return value
+
+def normalize_url(url):
+    """Canonical form of a URL for de-duplication, or None if it is not an http(s) URL.
+    
+    Drops fragments and tracking parameters, lower-cases scheme and host, and
+    reduces Kemono/Coomer creator and post URLs to /service/user/id[/post/id].
+    """
+    try:
+        parts = urllib.parse.urlsplit(url.strip())
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname
+    if host.startswith("www."):
+        host = host[4:]
+    netloc = host if parts.port is None else f"{host}:{parts.port}"
+    
+    params = urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+    kept = [
+        (key, value) for key, value in params
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    ]
+    # Only re-encode the query when something was removed from it
+    query = parts.query if len(kept) == len(params) else urllib.parse.urlencode(kept)
+    path = parts.path or "/"
+    
+    if KEMONO_HOSTS.match(host):
+        match = KEMONO_PATH.match(path)
+        if match:
+            service, user, post = match.groups()
+            path = f"/{service.lower()}/user/{user}" + (f"/post/{post}" if post else "")
+            scheme = "https"
+    
+    return urllib.parse.urlunsplit((scheme, netloc, path, query, ""))
+
+class UrlImporter:
+    """Streams a URL list file, normalizing and de-duplicating it into per-host lists.
+    
+    Only an 8-byte digest of every URL seen is kept for de-duplication.
+    """
+    
+    def __init__(self):
+        self.seen = set()
+        self.by_host = {}
+        self.count = 0
+        self.duplicates = 0
+        self.invalid = 0
+    
+    def add(self, line):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return
+        url = normalize_url(line)
+        if url is None:
+            self.invalid += 1
+            return
+        digest = hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+        if digest in self.seen:
+            self.duplicates += 1
+            return
+        self.seen.add(digest)
+        self.by_host.setdefault(get_host(url), []).append(url)
+        self.count += 1
+    
+    def import_file(self, path, progress=None):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line_number, line in enumerate(f, 1):
+                self.add(line)
+                if progress is not None and line_number % IMPORT_PROGRESS_LINES == 0:
+                    progress(line_number)
+    
+    def chunks(self):
+        """Yield lists of up to IMPORT_CHUNK_SIZE URLs, each from a single host."""
+        for urls in self.by_host.values():
+            for start in range(0, len(urls), IMPORT_CHUNK_SIZE):
+                yield urls[start:start + IMPORT_CHUNK_SIZE]
+    
+    def summary(self):
+        return (
+            f"{self.count:,} URLs from {len(self.by_host):,} host(s) "
+            f"({self.duplicates:,} duplicates and {self.invalid:,} invalid lines removed)"
+        )
+
+class Job:
+    """One gallery-dl run over one or more URLs, with its live status."""
+    
+    def __init__(self, job_id, urls, options):
+        self.id = job_id
+        self.urls = list(urls)
+        self.host = get_host(self.urls[0]) if self.urls else "input file"
+        self.options = list(options)
+        self.engine = ENGINE_SUBPROCESS
+        self.status = "queued"
+        self.returncode = None
+        self.process = None
+        self.cancelled = False
+        self.log_path = None
+        self.started = None
+        self.launched = None
+        self.finished = None
+        # Bandwidth cap (bytes/s) the current run was started with, and restart requests
+        self.rate_limit = None
+        self.restart_requested = False
+        # DestinationIndex database that in-process runs may answer "file exists" checks from
+        self.skip_index = None
+        # Event counters, updated from the job's thread and read by the dashboard
+        self.files = 0
+        self.skipped = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.bytes = 0
+        self.last_error = None
+        # Expected wall time and file count from earlier runs, and when the job was queued
+        self.cost = None
+        self.expected_files = None
+        self.queued_at = None
+        # Proxy from the pool that the current run uses
+        self.proxy = None
+        # Per-run options such as --sleep, -r and --proxy, kept apart from options (see LAUNCH_OPTION_KEYS)
+        self.launch_options = []
+        # Exit status per URL, reported by in-process runs
+        self.url_status = {}
+        # Set whenever the job changes so the job table knows which rows to redraw
+        self.changed = True
+        # Optional fn(job) called after every status change
+        self.on_status = None
+    
+    def set_status(self, status):
+        self.status = status
+        self.changed = True
+        if self.on_status is not None:
+            self.on_status(self)
+    
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+    
+    def record_event(self, event):
+        if event.kind == EVENT_FILE:
+            self.files += 1
+            self.bytes += event.size
+        elif event.kind == EVENT_SKIP:
+            self.skipped += 1
+        elif event.kind == EVENT_ERROR:
+            self.errors += 1
+            self.last_error = event.message
+        elif event.kind == EVENT_RETRY:
+            self.retries += 1
+        elif event.kind == EVENT_RATE_LIMITED:
+            self.rate_limited += 1
+    
+    def describe(self):
+        if not self.urls:
+            return "(input file)"
+        if len(self.urls) == 1:
+            return self.urls[0]
+        return f"{self.urls[0]} (+{len(self.urls) - 1} more)"
+
+def job_cost(job):
+    return job.cost if job.cost is not None else HISTORY_DEFAULT_SECONDS
+
+class JobHistory:
+    """Wall time, file count and size of each URL's last complete run, used to estimate job costs."""
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                "url TEXT PRIMARY KEY, host TEXT NOT NULL, post INTEGER NOT NULL, "
+                "seconds REAL NOT NULL, files INTEGER NOT NULL, bytes INTEGER NOT NULL, time REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS history_host ON history (host, post)")
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def record(self, url, seconds, files, size):
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO history (url, host, post, seconds, files, bytes, time) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, get_host(url), bool(SINGLE_POST_PATTERNS.search(url)), seconds, files, size, time.time())
+            )
+    
+    def estimate(self, jobs):
+        """Set cost (seconds) and expected_files (None if unknown) on each job."""
+        urls = list({url for job in jobs for url in job.urls})
+        known = {}
+        with self.connect() as db:
+            for start in range(0, len(urls), SQLITE_IN_BATCH):
+                batch = urls[start:start + SQLITE_IN_BATCH]
+                known.update(
+                    (url, (seconds, files)) for url, seconds, files in db.execute(
+                        f"SELECT url, seconds, files FROM history WHERE url IN ({', '.join('?' * len(batch))})", batch
+                    )
+                )
+            averages = {
+                (host, bool(post)): seconds
+                for host, post, seconds in db.execute("SELECT host, post, AVG(seconds) FROM history GROUP BY host, post")
+            }
+        for job in jobs:
+            if not job.urls:
+                continue
+            cost = 0.0
+            files = 0
+            for url in job.urls:
+                if url in known:
+                    seconds, url_files = known[url]
+                    cost += seconds
+                    files = None if files is None else files + url_files
+                else:
+                    post = bool(SINGLE_POST_PATTERNS.search(url))
+                    cost += averages.get((get_host(url), post), HISTORY_POST_SECONDS if post else HISTORY_DEFAULT_SECONDS)
+                    files = None
+            job.cost = cost
+            job.expected_files = files
+
+RetryItem = namedtuple("RetryItem", ["url", "host", "options", "engine", "attempt", "due", "reason"])
+
+class RetryQueue:
+    """Failed URLs waiting for another attempt, with exponential backoff and jitter.
+    
+    Each URL's delay doubles with every failed attempt. Items are released per
+    host: once one of a host's URLs is due, its others that come due within
+    RETRY_GROUP_WINDOW go with it. Items with no due time (permanent errors or
+    too many attempts) only run when retried by hand.
+    """
+    
+    def __init__(self, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, max_attempts=RETRY_MAX_ATTEMPTS):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.items = {}
+        self.attempts = Counter()
+    
+    def add(self, url, options, engine, code, reason=None, now=None):
+        """Queue a failed URL; returns its RetryItem."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.attempts[url] += 1
+            attempt = self.attempts[url]
+            due = None
+            if not code & RETRY_PERMANENT_CODES and attempt <= self.max_attempts:
+                delay = min(self.base_delay * 2 ** (attempt - 1), self.max_delay)
+                # Jitter spreads out URLs that failed together; keeping half the delay
+                # stops a site that is down from being hit again right away
+                due = now + delay / 2 + random.uniform(0, delay / 2)
+            item = self.items[url] = RetryItem(url, get_host(url), list(options), engine, attempt, due, reason)
+            return item
+    
+    def succeeded(self, url):
+        with self.lock:
+            self.items.pop(url, None)
+            self.attempts.pop(url, None)
+    
+    def next_due(self):
+        with self.lock:
+            return min((item.due for item in self.items.values() if item.due is not None), default=None)
+    
+    def pop_due(self, now=None):
+        """Remove and return the items of every host that has one due."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            hosts = {item.host for item in self.items.values() if item.due is not None and item.due <= now}
+            due = [
+                item for item in self.items.values()
+                if item.host in hosts and item.due is not None and item.due <= now + RETRY_GROUP_WINDOW
+            ]
+            for item in due:
+                del self.items[item.url]
+            return due
+    
+    def pop_all(self):
+        with self.lock:
+            items = list(self.items.values())
+            self.items.clear()
+            return items
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
+
+class JobScheduler:
+    """Runs jobs on at most max_jobs threads, with at most per_host_limit per host.
+    
+    The policy decides which eligible job goes next: the queue order (which the
+    user can change), the lowest queued time + estimated cost (shortest first,
+    but a long job is not passed over forever), or the same within the host
+    that has been given the least estimated work so far.
+    """
+    
+    def __init__(self, run_job, max_jobs=DEFAULT_MAX_JOBS, per_host_limit=DEFAULT_MAX_JOBS_PER_HOST):
+        self.run_job = run_job
+        self.max_jobs = max_jobs
+        self.per_host_limit = per_host_limit
+        self.policy = SCHEDULE_MANUAL
+        # Optional fn(host) -> int that replaces per_host_limit, e.g. adaptive limits
+        self.host_limit_provider = None
+        self.condition = threading.Condition()
+        self.pending = []
+        self.running = set()
+        self.host_counts = Counter()
+        # Estimated seconds of work dispatched per host, for fair share
+        self.host_served = Counter()
+        self.dispatcher = None
+    
+    def submit(self, jobs):
+        now = time.monotonic()
+        with self.condition:
+            for job in jobs:
+                job.queued_at = now
+                # A host that joins late starts level with the others instead of far behind them
+                if job.host not in self.host_served:
+                    self.host_served[job.host] = min(self.host_served.values(), default=0)
+            self.pending.extend(jobs)
+            if self.dispatcher is None:
+                self.dispatcher = threading.Thread(target=self.dispatch_loop, daemon=True)
+                self.dispatcher.start()
+            self.condition.notify_all()
+    
+    def host_limit(self, host):
+        if self.host_limit_provider is not None:
+            return self.host_limit_provider(host)
+        return self.per_host_limit
+    
+    def wake(self):
+        """Re-check pending jobs, e.g. after a host limit went up."""
+        with self.condition:
+            self.condition.notify_all()
+    
+    def next_job(self):
+        """Pop the pending job the policy picks among those whose host has a free slot. Caller holds the lock."""
+        if self.policy == SCHEDULE_MANUAL:
+            for index, job in enumerate(self.pending):
+                if self.host_counts[job.host] < self.host_limit(job.host):
+                    return self.pending.pop(index)
+            return None
+        
+        has_slot = {}
+        best = None
+        for index, job in enumerate(self.pending):
+            if job.host not in has_slot:
+                has_slot[job.host] = self.host_counts[job.host] < self.host_limit(job.host)
+            if not has_slot[job.host]:
+                continue
+            key = job.queued_at + job_cost(job)
+            if self.policy == SCHEDULE_FAIR:
+                key = (self.host_served[job.host], key)
+            if best is None or key < best[0]:
+                best = (key, index)
+        if best is None:
+            return None
+        job = self.pending.pop(best[1])
+        self.host_served[job.host] += job_cost(job)
+        return job
+    
+    def move(self, job, target):
+        """Move a pending job to the place of another pending one; False if either has left the queue."""
+        with self.condition:
+            if job not in self.pending or target not in self.pending:
+                return False
+            index = self.pending.index(target)
+            self.pending.remove(job)
+            self.pending.insert(index, job)
+            return True
+    
+    def dispatch_loop(self):
+        while True:
+            with self.condition:
+                job = None
+                while job is None:
+                    if len(self.running) < self.max_jobs:
+                        job = self.next_job()
+                    if job is None:
+                        self.condition.wait()
+                self.running.add(job)
+                self.host_counts[job.host] += 1
+            threading.Thread(target=self.job_worker, args=(job,), daemon=True).start()
+    
+    def job_worker(self, job):
+        try:
+            self.run_job(job)
+        finally:
+            with self.condition:
+                self.running.discard(job)
+                self.host_counts[job.host] -= 1
+                if not self.pending and not self.running:
+                    self.host_served.clear()
+                self.condition.notify_all()
+    
+    def cancel_all(self):
+        """Drop queued jobs and terminate the running ones."""
+        with self.condition:
+            for job in self.pending:
+                job.set_status("cancelled")
+            self.pending.clear()
+            running = list(self.running)
+        for job in running:
+            job.cancelled = True
+            if job.process is not None and job.process.poll() is None:
+                job.process.terminate()
+    
+    def is_busy(self):
+        with self.condition:
+            return bool(self.pending or self.running)
+    
+    def has_pending(self, options):
+        """True if a queued job has exactly these options."""
+        with self.condition:
+            return any(job.options == options for job in self.pending)
+    
+    def pending_count(self):
+        with self.condition:
+            return len(self.pending)
+
+class LibraryEngine:
+    """Runs jobs through gallery-dl's Python API on the scheduler's threads.
+    
+    The interpreter, the imported extractors and gallery-dl's connection pools
+    stay alive between jobs. gallery-dl keeps its configuration in one global,
+    so jobs with different option sets take turns instead of overlapping.
+    """
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.active = 0
+        self.applied_options = None
+        # Log records are routed to whichever job owns the emitting thread
+        self.handlers = {}
+        handler = logging.Handler()
+        handler.emit = self.route_log_record
+        logging.getLogger().addHandler(handler)
+        # gallery-dl imports extractor modules lazily through one shared generator, which raises
+        # "generator already executing" when two jobs look up their first URL at the same time
+        gdl_extractor.extractors()
+        # Downloaders pick up their job's launch options through the extractor they are made for
+        if self.supports_launch_options():
+            base = gdl_downloader_common.DownloaderBase
+            if not hasattr(base._extractor_config, "launch_options"):
+                base._extractor_config = with_launch_options(base._extractor_config)
+    
+    @staticmethod
+    def available():
+        return gallery_dl is not None
+    
+    @staticmethod
+    def supports_launch_options():
+        """True if this gallery-dl has the hooks launch options are layered in through.
+        
+        gallery-dl keeps one global config, so there is no public per-job
+        scope; the job's values are given to its extractors and downloaders
+        through Extractor.config and DownloaderBase._extractor_config, which
+        this was written against (gallery-dl 1.26 to 1.32). Without them jobs
+        that have launch options run as subprocesses instead.
+        """
+        return (gallery_dl is not None
+                and callable(getattr(gdl_extractor_common.Extractor, "config", None))
+                and callable(getattr(gdl_downloader_common.DownloaderBase, "_extractor_config", None))
+                and callable(getattr(gdl_downloader_common.DownloaderBase, "config_opts", None)))
+    
+    def route_log_record(self, record):
+        on_event = self.handlers.get(record.thread)
+        if on_event is not None:
+            on_event("log", f"[{record.name}][{record.levelname.lower()}] {record.getMessage()}")
+    
+    def apply_options(self, options):
+        """Parse the same argv the subprocess engine gets and load it into gallery-dl's config."""
+        # A fresh parser each time: gallery-dl's parser appends "-o"-style options to a shared default list
+        args = gdl_option.build_parser().parse_args(options)
+        gdl_config.clear()
+        if getattr(args, "config_load", True):
+            gdl_config.load()
+        if args.filename:
+            gdl_config.set((), "filename", args.filename)
+        if args.directory is not None:
+            gdl_config.set((), "base-directory", args.directory)
+            gdl_config.set((), "directory", ())
+        if getattr(args, "postprocessors", None):
+            gdl_config.set((), "postprocessors", args.postprocessors)
+        if getattr(args, "abort", None):
+            gdl_config.set((), "skip", "abort:" + str(args.abort))
+        for opts in args.options:
+            gdl_config.set(*opts)
+        logging.getLogger().setLevel(args.loglevel)
+        return args
+    
+    def acquire(self, options):
+        key = tuple(options)
+        with self.condition:
+            while self.active and self.applied_options != key:
+                self.condition.wait()
+            if self.applied_options != key:
+                self.args = self.apply_options(options)
+                self.applied_options = key
+            self.active += 1
+            return self.args
+    
+    def release(self):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+    
+    def read_input_files(self, args):
+        urls = []
+        for entry in getattr(args, "input_files", None) or ():
+            path = entry[0] if isinstance(entry, tuple) else entry
+            with open(path, encoding="utf-8") as f:
+                # Per-URL "-option=value" lines are not supported in-process
+                urls.extend(line.strip() for line in f if line.strip() and line[0] not in "#-")
+        return urls
+    
+    def run(self, job, on_event):
+        """Run job in the calling thread; on_event(kind, value[, info]) gets "file", "skip", "status" and "log" events."""
+        # The UI's own value of a launch option would otherwise win over the job's
+        options = job.options
+        for flag in job.launch_options[::2]:
+            options = remove_option(options, flag)
+        args = self.acquire(options)
+        thread_id = threading.get_ident()
+        self.handlers[thread_id] = on_event
+        known_files = KnownFiles(job.skip_index) if job.skip_index else None
+        try:
+            job_class = make_library_job_class(
+                getattr(args, "jobtype", None) or gdl_job.DownloadJob, job, on_event, known_files,
+                launch_config(job.launch_options)
+            )
+            status = 0
+            for url in job.urls + self.read_input_files(args):
+                if job.cancelled:
+                    break
+                try:
+                    url_status = job_class(url).run()
+                except gdl_exception.NoExtractorError:
+                    on_event("log", f"[gallery-dl][error] Unsupported URL '{url}'")
+                    url_status = 64
+                on_event("status", url, {"status": url_status})
+                status |= url_status
+            return status
+        finally:
+            if known_files is not None:
+                known_files.close()
+            self.handlers.pop(thread_id, None)
+            self.release()
+
+def launch_config(launch_options):
+    """Map launch options (["--sleep", "2", ...]) to {gallery-dl config key: value}."""
+    return {LAUNCH_OPTION_KEYS[flag]: value for flag, value in zip(launch_options[::2], launch_options[1::2])}
+
+def with_launch_options(extractor_config):
+    """Wrap gallery-dl's lookup of per-extractor downloader options to add the job's launch options."""
+    def _extractor_config(self, extractor):
+        opts = extractor_config(self, extractor)
+        local = getattr(extractor, "launch_config", None)
+        if local:
+            opts = dict(opts or (), **local)
+        return opts
+    _extractor_config.launch_options = True
+    return _extractor_config
+
+def engine_runs_in_process(engine):
+    """True if jobs on engine run through gallery-dl's Python API rather than a gallery-dl binary."""
+    return engine == ENGINE_LIBRARY or (engine == ENGINE_WARM_POOL and LibraryEngine.available())
+
+def get_worker_command():
+    """Command that starts this script (or the frozen app) as a warm worker."""
+    if getattr(sys, "frozen", False):
+        return [sys.executable, WARM_WORKER_FLAG]
+    return [sys.executable, os.path.abspath(__file__), WARM_WORKER_FLAG]
+
+def run_worker():
+    """Warm worker entry point: run jobs read as JSON lines from stdin until it closes.
+    
+    Each request is {"id", "urls", "options", "launch_options", "skip_index"}; the worker answers with
+    {"event": "file"|"skip"|"status"|"log", "value", "info"} lines and a final {"event": "done", "status"}.
+    """
+    # stdout carries the protocol only, anything else printed goes to stderr
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+    engine = LibraryEngine()
+    
+    def send(message):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+    
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        job = Job(request["id"], request["urls"], request["options"])
+        job.skip_index = request.get("skip_index")
+        job.launch_options = request.get("launch_options", [])
+        try:
+            status = engine.run(job, lambda kind, value, info=None: send({"event": kind, "value": value, "info": info}))
+        except Exception as e:
+            send({"event": "log", "value": f"[worker][error] {e}"})
+            status = 1
+        send({"event": "done", "status": status})
+
+class WarmWorker:
+    """Long-lived child process that keeps gallery-dl imported between jobs."""
+    
+    def __init__(self):
+        self.process = subprocess.Popen(
+            get_worker_command(),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+    
+    def is_alive(self):
+        return self.process.poll() is None
+    
+    def run(self, job, on_event):
+        request = {
+            "id": job.id, "urls": job.urls, "options": job.options,
+            "launch_options": job.launch_options, "skip_index": job.skip_index
+        }
+        self.process.stdin.write(json.dumps(request) + "\n")
+        self.process.stdin.flush()
+        for line in self.process.stdout:
+            message = json.loads(line)
+            if message["event"] == "done":
+                return message["status"]
+            on_event(message["event"], message["value"], message.get("info"))
+        raise RuntimeError(f"warm worker exited with code {self.process.wait()}")
+    
+    def close(self):
+        if self.is_alive():
+            self.process.stdin.close()
+
+class WarmWorkerPool:
+    """Hands jobs to idle warm workers, starting new ones when none are free."""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = []
+    
+    def acquire(self):
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.is_alive():
+                    return worker
+        return WarmWorker()
+    
+    def release(self, worker):
+        if worker.is_alive():
+            with self.lock:
+                self.idle.append(worker)
+    
+    def prewarm(self, count):
+        """Start workers in the background until count of them are idle."""
+        def start_workers():
+            with self.lock:
+                missing = count - len(self.idle)
+            for _ in range(missing):
+                self.release(WarmWorker())
+        threading.Thread(target=start_workers, daemon=True).start()
+
+class StandbyProcessPool:
+    """gallery-dl processes started ahead of time that wait for their URLs on stdin.
+    
+    A frozen gallery-dl binary cannot be kept alive between jobs, but it can be
+    started with "-i -" before it is needed: unpacking, interpreter start-up and
+    option parsing happen while it blocks reading stdin, and a job only has to
+    write its URLs and close the pipe.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.standby = {}
+    
+    def spawn(self, command):
+        return subprocess.Popen(
+            list(command) + ["-i", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            universal_newlines=True
+        )
+    
+    def fill(self, command, count):
+        """Keep count processes ready for command, discarding ones started for other options."""
+        key = tuple(command)
+        with self.lock:
+            for other_key in [k for k in self.standby if k != key]:
+                for process in self.standby.pop(other_key):
+                    process.kill()
+            ready = [p for p in self.standby.get(key, []) if p.poll() is None]
+            for _ in range(count - len(ready)):
+                ready.append(self.spawn(command))
+            self.standby[key] = ready
+    
+    def take(self, command, refill=True):
+        """Return a ready process for command (or None), optionally starting its replacement."""
+        key = tuple(command)
+        with self.lock:
+            ready = self.standby.get(key, [])
+            while ready:
+                process = ready.pop(0)
+                if process.poll() is None:
+                    if refill:
+                        ready.append(self.spawn(command))
+                    return process
+        return None
+
+class LibraryJobOutput:
+    """Stands in for gallery-dl's output module and forwards file events to the UI."""
+    
+    def __init__(self, job, on_event, gdl_job=None):
+        self.job = job
+        self.on_event = on_event
+        self.gdl_job = gdl_job
+    
+    def start(self, path):
+        if self.job.cancelled:
+            raise gdl_exception.StopExtraction()
+    
+    def skip(self, path):
+        self.on_event("skip", path)
+        if self.job.cancelled:
+            raise gdl_exception.StopExtraction()
+    
+    def success(self, path, *args):
+        pathfmt = getattr(self.gdl_job, "pathfmt", None)
+        kwdict = pathfmt.kwdict if pathfmt is not None else {}
+        self.on_event("file", path, {"url": kwdict.get("_url"), "expected": expected_file_size(kwdict.get(VERIFY_HEADERS_KEY))})
+    
+    def progress(self, bytes_total, bytes_downloaded, bytes_per_second):
+        pass
+
+def make_library_job_class(base_class, job, on_event, known_files=None, local_config=None):
+    """Subclass a gallery-dl job type so it (and its child jobs) report to on_event.
+    
+    With known_files, existing-file checks are answered from the destination
+    index and only fall back to the disk for directories it does not cover.
+    local_config ({key: value}) overrides gallery-dl's config for this job's
+    extractors and downloaders only.
+    """
+    class UIJob(base_class):
+        def __init__(self, url, parent=None):
+            base_class.__init__(self, url, parent)
+            self.out = LibraryJobOutput(job, on_event, self)
+            if local_config:
+                extractor = self.extractor
+                shared_config = extractor.config
+                extractor.config = lambda key, default=None: (
+                    local_config[key] if key in local_config else shared_config(key, default)
+                )
+                extractor.launch_config = local_config
+        
+        def initialize(self, kwdict=None):
+            base_class.initialize(self, kwdict)
+            pathfmt = getattr(self, "pathfmt", None)
+            # gallery-dl replaces exists() on the instance itself when skipping is off
+            if known_files is None or pathfmt is None or "exists" in vars(pathfmt):
+                return
+            disk_exists = pathfmt.exists
+            
+            def exists():
+                if not pathfmt.extension:
+                    return False
+                kwdict = pathfmt.kwdict
+                expected = next((kwdict[key] for key in METADATA_SIZE_KEYS if isinstance(kwdict.get(key), int)), None)
+                found = known_files.exists(pathfmt.realpath, expected)
+                if found is None:
+                    return disk_exists()
+                return found and pathfmt.check_file()
+            pathfmt.exists = exists
+    return UIJob
+
+class HostRateController:
+    """AIMD control of per-host parallelism and --sleep, persisted between sessions.
+    
+    Every ADAPTIVE_CLEAN_FILES clean downloads a host gets one more parallel job
+    and ADAPTIVE_SLEEP_STEP seconds less sleep; a 429, 5xx or timeout halves its
+    parallelism and doubles its sleep (at most once per ADAPTIVE_BACKOFF_COOLDOWN).
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.enabled = False
+        self.default_limit = DEFAULT_MAX_JOBS_PER_HOST
+        self.default_sleep = 0.0
+        self.on_change = None
+        self.last_save = 0.0
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.hosts = json.load(f)
+        except (OSError, ValueError):
+            self.hosts = {}
+    
+    def state(self, host):
+        """Limits for host, starting from the UI settings the first time it is seen. Caller holds the lock."""
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = {"limit": float(self.default_limit), "sleep": self.default_sleep}
+        state.setdefault("clean", 0)
+        state.setdefault("backoff_time", 0.0)
+        return state
+    
+    def job_limit(self, host):
+        with self.lock:
+            return max(int(self.state(host)["limit"]), 1)
+    
+    def job_sleep(self, host):
+        with self.lock:
+            return round(self.state(host)["sleep"], 2)
+    
+    def on_event(self, job, event):
+        if not self.enabled:
+            return
+        trouble = event.kind == EVENT_RATE_LIMITED or (
+            event.kind in (EVENT_RETRY, EVENT_ERROR) and SERVER_TROUBLE_PATTERN.search(event.message or "")
+        )
+        if event.kind != EVENT_FILE and not trouble:
+            return
+        
+        with self.lock:
+            state = self.state(job.host)
+            now = time.time()
+            if trouble:
+                state["clean"] = 0
+                if now - state["backoff_time"] < ADAPTIVE_BACKOFF_COOLDOWN:
+                    return
+                state["backoff_time"] = now
+                state["limit"] = max(state["limit"] / 2, 1.0)
+                state["sleep"] = min(max(state["sleep"] * 2, 1.0), ADAPTIVE_MAX_SLEEP)
+            else:
+                state["clean"] += 1
+                if state["clean"] < ADAPTIVE_CLEAN_FILES:
+                    return
+                state["clean"] = 0
+                state["limit"] = min(state["limit"] + 1, ADAPTIVE_MAX_JOBS_PER_HOST)
+                state["sleep"] = max(state["sleep"] - ADAPTIVE_SLEEP_STEP, 0.0)
+            message = (
+                f"{job.host}: {'backing off' if trouble else 'speeding up'} to "
+                f"{int(state['limit'])} job(s), --sleep {state['sleep']:.2f}"
+            )
+        
+        if self.on_change is not None:
+            self.on_change(message)
+        if now - self.last_save >= ADAPTIVE_SAVE_INTERVAL:
+            self.save()
+    
+    def save(self):
+        with self.lock:
+            data = json.dumps(self.hosts, indent=2)
+            self.last_save = time.time()
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+def proxy_label(proxy):
+    """A proxy URL without its credentials, for logs and the proxy table."""
+    parts = urllib.parse.urlsplit(proxy)
+    if parts.password is None and parts.username is None:
+        return proxy
+    netloc = parts.hostname + (f":{parts.port}" if parts.port else "")
+    return urllib.parse.urlunsplit(parts._replace(netloc=netloc))
+
+class ProxyPool:
+    """Proxies shared by all jobs, health-checked in the background.
+    
+    A checker thread requests check_url through every proxy each
+    PROXY_CHECK_INTERVAL. A proxy is ejected after PROXY_EJECT_FAILURES failures
+    in a row (probes, or proxy errors in jobs) and comes back after its next good
+    probe. Jobs get a healthy proxy at random, weighted by (1 - error rate) /
+    latency / (1 + jobs already using it); with sticky hosts, every job of a host
+    keeps the host's proxy while it stays healthy.
+    """
+    
+    def __init__(self, log):
+        self.log = log
+        self.lock = threading.Lock()
+        # proxy URL -> {"latency", "error_rate", "failures", "ejected", "in_use"}
+        self.proxies = {}
+        self.host_proxies = {}
+        self.sticky_hosts = False
+        self.check_url = PROXY_CHECK_URL
+        self.wakeup = threading.Event()
+        self.checker = None
+    
+    def configure(self, proxies, check_url=None, sticky_hosts=False):
+        """Set the pool's proxies, keeping the statistics of ones already in it."""
+        with self.lock:
+            changed = list(self.proxies) != list(proxies) or (check_url or PROXY_CHECK_URL) != self.check_url
+            self.proxies = {
+                proxy: self.proxies.get(proxy) or {"latency": None, "error_rate": 0.0, "failures": 0, "ejected": False, "in_use": 0}
+                for proxy in proxies
+            }
+            self.host_proxies = {host: proxy for host, proxy in self.host_proxies.items() if proxy in self.proxies}
+            self.check_url = check_url or PROXY_CHECK_URL
+            self.sticky_hosts = sticky_hosts
+        if self.proxies and self.checker is None:
+            self.checker = threading.Thread(target=self.checker_loop, daemon=True)
+            self.checker.start()
+        if changed:
+            self.check_now()
+    
+    def check_now(self):
+        self.wakeup.set()
+    
+    def checker_loop(self):
+        while True:
+            self.wakeup.wait(PROXY_CHECK_INTERVAL)
+            self.wakeup.clear()
+            with self.lock:
+                proxies = list(self.proxies)
+                check_url = self.check_url
+            if not proxies:
+                continue
+            with ThreadPoolExecutor(max_workers=PROXY_CHECK_WORKERS) as pool:
+                for proxy, latency in zip(proxies, pool.map(lambda proxy: self.probe(proxy, check_url), proxies)):
+                    self.record(proxy, latency)
+    
+    @staticmethod
+    def probe(proxy, check_url):
+        """Seconds until check_url answered through proxy, or None if it failed."""
+        started = time.monotonic()
+        try:
+            response = requests.get(
+                check_url, proxies={"http": proxy, "https": proxy}, timeout=PROXY_CHECK_TIMEOUT, stream=True
+            )
+            response.close()
+        except requests.RequestException:
+            return None
+        # Any answer from the site means the proxy works, but not the proxy's own errors
+        if response.status_code == 407 or response.status_code >= 500:
+            return None
+        return time.monotonic() - started
+    
+    def record(self, proxy, latency):
+        """Add one probe or job result; latency None means it failed."""
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if stats is None:
+                return
+            failed = latency is None
+            stats["error_rate"] += PROXY_SMOOTHING * (failed - stats["error_rate"])
+            if failed:
+                stats["failures"] += 1
+                if stats["ejected"] or stats["failures"] < PROXY_EJECT_FAILURES:
+                    return
+                stats["ejected"] = True
+                message = f"Proxy {proxy_label(proxy)} ejected after {stats['failures']} failures in a row"
+            else:
+                previous = stats["latency"]
+                stats["latency"] = latency if previous is None else previous + PROXY_SMOOTHING * (latency - previous)
+                stats["failures"] = 0
+                if not stats["ejected"]:
+                    return
+                stats["ejected"] = False
+                message = f"Proxy {proxy_label(proxy)} is back ({latency * 1000:.0f} ms)"
+        self.log(message)
+    
+    def on_event(self, job, event):
+        if job.proxy is None:
+            return
+        if event.kind == EVENT_FILE:
+            with self.lock:
+                stats = self.proxies.get(job.proxy)
+                if stats is not None and not stats["ejected"]:
+                    stats["failures"] = 0
+        elif event.kind in (EVENT_ERROR, EVENT_RETRY) and PROXY_ERROR_PATTERN.search(event.message or ""):
+            self.record(job.proxy, None)
+    
+    @staticmethod
+    def weight(stats):
+        latency = stats["latency"] if stats["latency"] is not None else PROXY_DEFAULT_LATENCY
+        return max(1 - stats["error_rate"], 0.05) / max(latency, 0.01) / (1 + stats["in_use"])
+    
+    def acquire(self, host):
+        """Pick a proxy for a job on host and count it as in use; None if the pool is empty."""
+        with self.lock:
+            if not self.proxies:
+                return None
+            healthy = [proxy for proxy, stats in self.proxies.items() if not stats["ejected"]]
+            proxy = self.host_proxies.get(host) if self.sticky_hosts else None
+            if proxy not in healthy:
+                # With every proxy ejected, jobs still go through one rather than connect directly
+                candidates = healthy or list(self.proxies)
+                proxy = random.choices(candidates, [self.weight(self.proxies[proxy]) for proxy in candidates])[0]
+                if self.sticky_hosts:
+                    self.host_proxies[host] = proxy
+            self.proxies[proxy]["in_use"] += 1
+            return proxy
+    
+    def release(self, proxy):
+        with self.lock:
+            stats = self.proxies.get(proxy)
+            if stats is not None and stats["in_use"]:
+                stats["in_use"] -= 1
+    
+    def rows(self):
+        """Return [(label, latency ms, error rate, jobs, state)] for the proxy table."""
+        with self.lock:
+            return [
+                (
+                    proxy_label(proxy), "-" if stats["latency"] is None else f"{stats['latency'] * 1000:.0f}",
+                    f"{stats['error_rate']:.0%}", stats["in_use"], "ejected" if stats["ejected"] else "ok"
+                )
+                for proxy, stats in self.proxies.items()
+            ]
+
+class BandwidthBudget:
+    """Splits one bandwidth budget over the running jobs with max-min fairness.
+    
+    A job that stays well below its share after warming up is limited elsewhere
+    (the server, a stall), so it only gets a little more than it uses and the
+    rest is shared among the others.
+    """
+    
+    def __init__(self, total=None, per_job_cap=None):
+        self.total = total
+        self.per_job_cap = per_job_cap
+    
+    def demand(self, job, measured_rate, now):
+        """Bandwidth job can use, or None if it would take all it gets."""
+        if job.rate_limit is None or job.launched is None or now - job.launched < BANDWIDTH_WARMUP_SECONDS:
+            return self.per_job_cap
+        if measured_rate < 0.8 * job.rate_limit:
+            demand = max(measured_rate * 1.25, BANDWIDTH_MIN_SHARE)
+            return min(demand, self.per_job_cap) if self.per_job_cap else demand
+        return self.per_job_cap
+    
+    def allocate(self, demands):
+        """Water-filling over {key: demand or None}; returns {key: bytes per second}."""
+        shares = {}
+        remaining = float(self.total)
+        unsettled = dict(demands)
+        while unsettled:
+            share = remaining / len(unsettled)
+            settled = {key: demand for key, demand in unsettled.items() if demand is not None and demand <= share}
+            if not settled:
+                for key in unsettled:
+                    shares[key] = share
+                break
+            for key, demand in settled.items():
+                shares[key] = demand
+                remaining -= demand
+                del unsettled[key]
+        return {key: max(share, BANDWIDTH_MIN_SHARE) for key, share in shares.items()}
+
+class JobJournal:
+    """Append-only SQLite journal (WAL mode) of every URL's state, for resuming after a crash.
+    
+    record() only queues a row; a writer thread commits queued rows in one
+    transaction every JOURNAL_FLUSH_SECONDS. The latest row per URL is its state.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.rows = queue.Queue()
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, state TEXT NOT NULL, "
+                "options TEXT NOT NULL, time REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS journal_url ON journal (url, seq)")
+        threading.Thread(target=self.writer_loop, daemon=True).start()
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+    
+    def record(self, urls, state, options):
+        # Never persist the password; a resumed job gets the one currently entered
+        stored_options = json.dumps(remove_option(options, "-p"))
+        now = time.time()
+        for url in urls:
+            self.rows.put((url, state, stored_options, now))
+    
+    def writer_loop(self):
+        db = self.connect()
+        while True:
+            batch = [self.rows.get()]
+            deadline = time.monotonic() + JOURNAL_FLUSH_SECONDS
+            while len(batch) < JOURNAL_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.rows.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            with db:
+                db.executemany("INSERT INTO journal (url, state, options, time) VALUES (?, ?, ?, ?)", batch)
+    
+    def unfinished(self):
+        """Return [(url, options)] for URLs whose latest state is queued or running."""
+        with self.connect() as db:
+            rows = db.execute(
+                "SELECT url, options FROM journal WHERE seq IN (SELECT MAX(seq) FROM journal GROUP BY url) "
+                f"AND state IN ({', '.join('?' * len(JOB_STATES_UNFINISHED))}) ORDER BY seq",
+                JOB_STATES_UNFINISHED
+            ).fetchall()
+        return [(url, json.loads(options)) for url, options in rows]
+    
+    def compact(self):
+        """Drop rows superseded by a later state of the same URL."""
+        with self.connect() as db:
+            db.execute("DELETE FROM journal WHERE seq NOT IN (SELECT MAX(seq) FROM journal GROUP BY url)")
+
+def watch_check_options(options, mark):
+    """Options for an incremental check of a subscription.
+    
+    The crawl aborts at the first file URL in mark (the newest files of the last
+    check) and otherwise after WATCH_ABORT_SKIPS files that are already on disk
+    or in the download archive, instead of walking the whole post history.
+    """
+    options = remove_option(options, "--no-skip", takes_value=False)
+    if get_option(options, "-A") is None:
+        options = set_option(options, "-A", WATCH_ABORT_SKIPS)
+    if mark:
+        clause = f"_url not in {tuple(mark)!r} or abort()"
+        user_filter = get_option(options, "--filter")
+        options = set_option(options, "--filter", f"({clause}) and ({user_filter})" if user_filter else clause)
+    return options
+
+class WatchList:
+    """Subscribed URLs with their check schedule and high-water mark, kept in SQLite.
+    
+    The mark is the URLs of the newest files the last check downloaded. Times
+    are wall-clock so schedules survive restarts.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS subscriptions ("
+                "url TEXT PRIMARY KEY, options TEXT NOT NULL, interval REAL NOT NULL, next_check REAL NOT NULL, "
+                "last_check REAL, last_status TEXT, last_files INTEGER, mark TEXT NOT NULL DEFAULT '[]')"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS subscriptions_due ON subscriptions (next_check)")
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    @staticmethod
+    def next_check(interval, now):
+        return now + interval * (1 + random.uniform(-WATCH_JITTER, WATCH_JITTER))
+    
+    def add(self, urls, options, interval, now=None):
+        """Subscribe to urls; returns how many were new. First checks are spread over one interval."""
+        now = time.time() if now is None else now
+        # Never persist the password; checks get the one currently entered
+        stored_options = json.dumps(remove_option(options, "-p"))
+        with self.connect() as db:
+            before = db.total_changes
+            db.executemany(
+                "INSERT OR IGNORE INTO subscriptions (url, options, interval, next_check) VALUES (?, ?, ?, ?)",
+                [(url, stored_options, interval, now + random.uniform(0, interval)) for url in urls]
+            )
+            return db.total_changes - before
+    
+    def remove(self, urls):
+        with self.connect() as db:
+            db.executemany("DELETE FROM subscriptions WHERE url = ?", [(url,) for url in urls])
+    
+    def set_interval(self, urls, interval, now=None):
+        now = time.time() if now is None else now
+        with self.connect() as db:
+            db.executemany(
+                "UPDATE subscriptions SET interval = ?, next_check = MIN(next_check, ?) WHERE url = ?",
+                [(interval, self.next_check(interval, now), url) for url in urls]
+            )
+    
+    def check_now(self, urls, now=None):
+        now = time.time() if now is None else now
+        with self.connect() as db:
+            db.executemany("UPDATE subscriptions SET next_check = ? WHERE url = ?", [(now, url) for url in urls])
+    
+    def due(self, limit, exclude=(), now=None):
+        """Return [(url, options, mark)] for up to limit subscriptions due by now, oldest first."""
+        now = time.time() if now is None else now
+        result = []
+        with self.connect() as db:
+            for url, options, mark in db.execute(
+                "SELECT url, options, mark FROM subscriptions WHERE next_check <= ? ORDER BY next_check", (now,)
+            ):
+                if len(result) >= limit:
+                    break
+                if url not in exclude:
+                    result.append((url, json.loads(options), json.loads(mark)))
+        return result
+    
+    def checked(self, url, status, files, mark, now=None):
+        """Record a finished check and schedule the next one; mark is the newest file URLs it downloaded."""
+        now = time.time() if now is None else now
+        with self.connect() as db:
+            row = db.execute("SELECT interval, mark FROM subscriptions WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return
+            # Older marks stay behind the new ones in case the newest posts get deleted
+            mark = (mark + [old for old in json.loads(row[1]) if old not in mark])[:WATCH_MARK_SIZE]
+            db.execute(
+                "UPDATE subscriptions SET next_check = ?, last_check = ?, last_status = ?, last_files = ?, mark = ? "
+                "WHERE url = ?",
+                (self.next_check(row[0], now), now, status, files, json.dumps(mark), url)
+            )
+    
+    def rows(self):
+        """Return [(url, interval, next_check, last_check, last_status, last_files)] ordered by next check."""
+        with self.connect() as db:
+            return db.execute(
+                "SELECT url, interval, next_check, last_check, last_status, last_files FROM subscriptions ORDER BY next_check"
+            ).fetchall()
+
+class DownloadArchiveDB:
+    """The SQLite download archive shared by all jobs, and the UI's table of finished URLs.
+    
+    gallery-dl writes its own entries to the "archive" table. The file is kept in
+    WAL mode so several gallery-dl processes can write to it at once.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            # Same schema gallery-dl creates, so either side may create the file
+            db.execute("CREATE TABLE IF NOT EXISTS archive (entry TEXT PRIMARY KEY) WITHOUT ROWID")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS completed_urls "
+                "(url TEXT PRIMARY KEY, files INTEGER, finished REAL) WITHOUT ROWID"
+            )
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def completed(self, urls):
+        """Return the subset of urls recorded as fully downloaded."""
+        urls = list(urls)
+        found = set()
+        with self.connect() as db:
+            for start in range(0, len(urls), SQLITE_IN_BATCH):
+                batch = urls[start:start + SQLITE_IN_BATCH]
+                rows = db.execute(
+                    f"SELECT url FROM completed_urls WHERE url IN ({', '.join('?' * len(batch))})", batch
+                )
+                found.update(url for url, in rows)
+        return found
+    
+    def mark_completed(self, urls, files):
+        with self.connect() as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO completed_urls (url, files, finished) VALUES (?, ?, ?)",
+                [(url, files, time.time()) for url in urls]
+            )
+    
+    def counts(self):
+        with self.connect() as db:
+            entries = db.execute("SELECT COUNT(*) FROM archive").fetchone()[0]
+            urls = db.execute("SELECT COUNT(*) FROM completed_urls").fetchone()[0]
+        return entries, urls
+    
+    def compact(self):
+        db = self.connect()
+        try:
+            db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            db.execute("VACUUM")
+            db.execute("PRAGMA optimize")
+        finally:
+            db.close()
+    
+    def merge(self, other_path):
+        """Add the entries of another archive (e.g. from another machine); returns how many were new."""
+        before = self.counts()
+        db = self.connect()
+        try:
+            db.execute("ATTACH DATABASE ? AS other", (other_path,))
+            tables = {name for name, in db.execute("SELECT name FROM other.sqlite_master WHERE type='table'")}
+            with db:
+                if "archive" in tables:
+                    db.execute("INSERT OR IGNORE INTO archive (entry) SELECT entry FROM other.archive")
+                if "completed_urls" in tables:
+                    db.execute(
+                        "INSERT OR IGNORE INTO completed_urls (url, files, finished) "
+                        "SELECT url, files, finished FROM other.completed_urls"
+                    )
+            db.execute("DETACH DATABASE other")
+        finally:
+            db.close()
+        after = self.counts()
+        return after[0] - before[0], after[1] - before[1]
+
+FileEntry = namedtuple("FileEntry", ["path", "key", "size", "mtime"])
+
+def file_key(path, st):
+    """Identity of a file's current contents: (device, inode, size, mtime_ns)."""
+    inode = st.st_ino
+    if not inode:
+        # Some network filesystems report no inode numbers; fall back to the path
+        inode = -int.from_bytes(hashlib.blake2b(path.encode("utf-8", "surrogateescape"), digest_size=7).digest(), "big")
+    return (st.st_dev, inode, st.st_size, st.st_mtime_ns)
+
+def is_within(path, root):
+    """True if path is root or below it."""
+    path, root = DestinationIndex.dir_key(path), DestinationIndex.dir_key(root)
+    try:
+        return os.path.commonpath([path, root]) == root
+    except ValueError:
+        return False
+
+def iter_files(root):
+    """Yield FileEntry for every regular file below root, using os.scandir."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            st = entry.stat(follow_symlinks=False)
+                            yield FileEntry(entry.path, file_key(entry.path, st), st.st_size, st.st_mtime)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def hash_file(path):
+    """BLAKE2b digest of a file; large files are read through mmap, others in big buffered chunks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= DEDUP_MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                for offset in range(0, size, DEDUP_READ_SIZE):
+                    digest.update(view[offset:offset + DEDUP_READ_SIZE])
+                view.release()
+        else:
+            for chunk in iter(lambda: f.read(DEDUP_READ_SIZE), b""):
+                digest.update(chunk)
+    return digest.digest()
+
+class HashIndex:
+    """SQLite cache of content hashes keyed by (device, inode, size, mtime_ns).
+    
+    A file whose key is unchanged is never read again, so repeated passes only
+    hash new or modified files.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes (dev INTEGER, inode INTEGER, size INTEGER, "
+                "mtime_ns INTEGER, digest BLOB, PRIMARY KEY (dev, inode, size, mtime_ns)) WITHOUT ROWID"
+            )
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def lookup(self, db, key):
+        row = db.execute(
+            "SELECT digest FROM hashes WHERE dev=? AND inode=? AND size=? AND mtime_ns=?", key
+        ).fetchone()
+        return row[0] if row else None
+    
+    def store(self, db, rows):
+        db.executemany("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)", [key + (digest,) for key, digest in rows])
+
+class Deduplicator:
+    """Finds files with identical content below a directory and hardlinks or deletes the extras."""
+    
+    def __init__(self, index, log, workers=DEDUP_HASH_WORKERS):
+        self.index = index
+        self.workers = workers
+        self.log = log
+    
+    def find_duplicates(self, root):
+        """Return groups of FileEntry with equal content, oldest first."""
+        # Only files sharing a size can be duplicates; hardlinks to one inode count once
+        by_size = {}
+        for entry in iter_files(root):
+            if entry.size:
+                by_size.setdefault(entry.size, {}).setdefault(entry.key[:2], entry)
+        candidates = [entry for group in by_size.values() if len(group) > 1 for entry in group.values()]
+        self.log(f"Dedup: {len(candidates):,} files share a size with another file")
+        
+        digests = {}
+        missing = []
+        db = self.index.connect()
+        try:
+            for entry in candidates:
+                digest = self.index.lookup(db, entry.key)
+                if digest is None:
+                    missing.append(entry)
+                else:
+                    digests[entry.path] = digest
+            self.log(f"Dedup: {len(digests):,} hashes cached, {len(missing):,} files to hash")
+            
+            new_rows = []
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for number, (entry, digest) in enumerate(zip(missing, pool.map(self.try_hash, missing)), 1):
+                    if digest is not None:
+                        digests[entry.path] = digest
+                        new_rows.append((entry.key, digest))
+                    if number % DEDUP_PROGRESS_FILES == 0:
+                        self.log(f"Dedup: hashed {number:,} of {len(missing):,} files")
+                        with db:
+                            self.index.store(db, new_rows)
+                        new_rows = []
+            with db:
+                self.index.store(db, new_rows)
+        finally:
+            db.close()
+        
+        by_digest = {}
+        for entry in candidates:
+            if entry.path in digests:
+                by_digest.setdefault((entry.size, digests[entry.path]), []).append(entry)
+        return [
+            sorted(group, key=lambda entry: (entry.mtime, len(entry.path)))
+            for group in by_digest.values() if len(group) > 1
+        ]
+    
+    def try_hash(self, entry):
+        try:
+            return hash_file(entry.path)
+        except OSError as e:
+            self.log(f"Dedup: cannot read {entry.path}: {e}")
+            return None
+    
+    def resolve(self, groups, mode):
+        """Hardlink or delete every copy but the oldest; returns (files, bytes) reclaimed.
+        
+        A pair is skipped if either file changed since it was hashed, such as
+        a file a running job is still writing.
+        """
+        files = 0
+        reclaimed = 0
+        for group in groups:
+            keep = group[0]
+            for duplicate in group[1:]:
+                if not (self.unchanged(keep) and self.unchanged(duplicate)):
+                    self.log(f"Dedup: skipping {duplicate.path}, it or {keep.path} changed since the scan")
+                    continue
+                try:
+                    if mode == DEDUP_HARDLINK:
+                        temp_path = duplicate.path + ".dedup-tmp"
+                        os.link(keep.path, temp_path)
+                        os.replace(temp_path, duplicate.path)
+                    elif mode == DEDUP_DELETE:
+                        os.remove(duplicate.path)
+                except OSError as e:
+                    self.log(f"Dedup: cannot replace {duplicate.path}: {e}")
+                    continue
+                files += 1
+                reclaimed += duplicate.size
+        return files, reclaimed
+    
+    @staticmethod
+    def unchanged(entry):
+        """True if the file still has the size and mtime it had when it was hashed."""
+        try:
+            st = os.stat(entry.path, follow_symlinks=False)
+        except OSError:
+            return False
+        return (st.st_size, st.st_mtime_ns) == entry.key[2:]
+
+class DestinationIndex:
+    """SQLite listing of the destination tree (path, size, mtime), refreshed incrementally.
+    
+    Creating, deleting or renaming a file changes its directory's mtime, so a
+    refresh only lists directories whose mtime moved; every other directory
+    costs one stat. Jobs answer gallery-dl's "file exists" check from the
+    listing instead of stat-ing each file.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER)")
+            db.execute("CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files (dir TEXT, name TEXT, size INTEGER, mtime_ns INTEGER, "
+                "PRIMARY KEY (dir, name)) WITHOUT ROWID"
+            )
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    @staticmethod
+    def dir_key(path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def refresh(self, root, full=False):
+        """Bring the listing of root up to date; returns (directories, directories listed, files listed).
+        
+        A full refresh lists every directory again, which also catches files
+        modified in place (that does not change the directory's mtime).
+        """
+        root = self.dir_key(root)
+        prefix = os.path.join(root, "")
+        db = self.connect()
+        try:
+            known = {}
+            children = {}
+            for path, parent, mtime_ns in db.execute("SELECT path, parent, mtime_ns FROM dirs"):
+                if path == root or path.startswith(prefix):
+                    known[path] = mtime_ns
+                    children.setdefault(parent, []).append(path)
+            
+            settled = time.time_ns() - int(DEST_INDEX_SETTLE_SECONDS * 1e9)
+            seen = set()
+            listed = files = 0
+            stack = [(root, None)]
+            while stack:
+                directory, parent = stack.pop()
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(directory)
+                if not full and known.get(directory) == mtime_ns:
+                    stack.extend((child, directory) for child in children.get(directory, ()))
+                    continue
+                
+                rows = []
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir(follow_symlinks=False):
+                                    stack.append((self.dir_key(entry.path), directory))
+                                elif entry.is_file():
+                                    st = entry.stat()
+                                    rows.append((directory, os.path.normcase(entry.name), st.st_size, st.st_mtime_ns))
+                            except OSError:
+                                continue
+                except OSError:
+                    seen.discard(directory)
+                    continue
+                db.execute("DELETE FROM files WHERE dir=?", (directory,))
+                db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+                # A directory that may still change within its mtime tick is listed again next time
+                db.execute(
+                    "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                    (directory, parent, mtime_ns if mtime_ns < settled else None)
+                )
+                listed += 1
+                files += len(rows)
+                if listed % DEST_INDEX_BATCH_SIZE == 0:
+                    db.commit()
+            
+            gone = [(path,) for path in known if path not in seen]
+            db.executemany("DELETE FROM dirs WHERE path=?", gone)
+            db.executemany("DELETE FROM files WHERE dir=?", gone)
+            db.commit()
+            return len(seen), listed, files
+        finally:
+            db.close()
+    
+    def directories(self, root):
+        """Yield (directory, {name: (size, mtime_ns)}) for every indexed directory below root."""
+        root = self.dir_key(root)
+        prefix = os.path.join(root, "")
+        db = self.connect()
+        try:
+            rows = db.execute(
+                "SELECT dir, name, size, mtime_ns FROM files WHERE dir=? OR (dir>=? AND dir<?) ORDER BY dir",
+                (root, prefix, prefix + "\uffff")
+            )
+            for directory, group in itertools.groupby(rows, lambda row: row[0]):
+                yield directory, {name: (size, mtime_ns) for _, name, size, mtime_ns in group}
+        finally:
+            db.close()
+    
+    def counts(self):
+        db = self.connect()
+        try:
+            directories = db.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+            files = db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            return directories, files
+        finally:
+            db.close()
+
+class KnownFiles:
+    """A job's read-only view of a DestinationIndex: one query per directory, then dict lookups."""
+    
+    def __init__(self, path):
+        self.path = path
+        self.db = None
+        self.dirs = {}
+    
+    def exists(self, path, expected_size=None):
+        """True or False if path's directory is indexed, None if the disk has to be asked.
+        
+        A file smaller than expected_size (the size its metadata announces)
+        is treated as missing, so it is downloaded again; one with a ".part"
+        file beside it is left to gallery-dl's own check.
+        """
+        if path.startswith("\\\\?\\"):
+            path = "\\\\" + path[8:] if path.startswith("\\\\?\\UNC\\") else path[4:]
+        directory, name = os.path.split(DestinationIndex.dir_key(path))
+        sizes = self.dirs.get(directory, False)
+        if sizes is False:
+            sizes = self.dirs[directory] = self.load(directory)
+        if sizes is None or name + ".part" in sizes:
+            return None
+        size = sizes.get(name)
+        if size is None:
+            return False
+        return expected_size is None or size >= expected_size
+    
+    def load(self, directory):
+        """{name: size} of an indexed directory, or None if it is not indexed."""
+        if self.db is None:
+            self.db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=60)
+        if self.db.execute("SELECT 1 FROM dirs WHERE path=?", (directory,)).fetchone() is None:
+            return None
+        return dict(self.db.execute("SELECT name, size FROM files WHERE dir=?", (directory,)))
+    
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+def restore_datetimes(kwdict):
+    """Turn the datetime strings of a -j dump back into datetime objects, as filters expect."""
+    for key, value in kwdict.items():
+        if isinstance(value, str) and METADATA_DATETIME.match(value):
+            kwdict[key] = datetime.datetime.fromisoformat(value)
+    return kwdict
+
+class MetadataCache:
+    """zlib-compressed "gallery-dl -j" results per URL, stored in SQLite and kept for METADATA_CACHE_TTL."""
+    
+    def __init__(self, path, ttl=METADATA_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        with self.connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS metadata (url TEXT PRIMARY KEY, fetched REAL, data BLOB)")
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def get(self, url):
+        """(files, queued) for url if it was fetched within the TTL, else None."""
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT data FROM metadata WHERE url=? AND fetched>?", (url, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(zlib.decompress(row[0]))
+        for kwdict in entry["files"]:
+            restore_datetimes(kwdict)
+        return entry["files"], entry["queued"]
+    
+    def put(self, url, messages):
+        """Store the message list printed by "gallery-dl -j url"."""
+        files = [message[2] for message in messages if message[0] == MESSAGE_URL]
+        queued = sum(1 for message in messages if message[0] == MESSAGE_QUEUE)
+        data = zlib.compress(json.dumps({"files": files, "queued": queued}).encode("utf-8"))
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)", (url, time.time(), data))
+            db.execute("DELETE FROM metadata WHERE fetched<?", (time.time() - self.ttl,))
+        return len(files), queued
+
+def filter_contains(values, elements, separator=" "):
+    """gallery-dl's contains() filter function."""
+    if isinstance(values, str):
+        values = values.split(separator)
+    if not isinstance(elements, (tuple, list)):
+        return elements in values
+    return any(element in values for element in elements)
+
+def compile_filter(expression):
+    """Compile a --filter expression into fn(kwdict), with the names gallery-dl provides to filters."""
+    code = compile(expression, "<filter>", "eval")
+    if gallery_dl is not None:
+        namespace = dict(gdl_util.GLOBALS)
+    else:
+        namespace = {"contains": filter_contains, "datetime": datetime.datetime, "timedelta": datetime.timedelta, "re": re}
+    return lambda kwdict: eval(code, namespace, kwdict)
+
+def parse_range(spec):
+    """Parse a --range value such as "-2,4,6-8,10-" or "1:10:2" into a list of range objects."""
+    ranges = []
+    for group in spec.split(","):
+        group = group.strip()
+        if not group:
+            continue
+        if ":" in group:
+            start, _, stop = group.partition(":")
+            stop, _, step = stop.partition(":")
+            ranges.append(range(
+                int(start) if start.strip() else 1,
+                int(stop) if stop.strip() else sys.maxsize,
+                int(step) if step.strip() else 1
+            ))
+        elif "-" in group:
+            start, _, stop = group.partition("-")
+            ranges.append(range(int(start) if start.strip() else 1, int(stop) + 1 if stop.strip() else sys.maxsize))
+        else:
+            ranges.append(range(int(group), int(group) + 1))
+    return ranges
+
+def format_range(positions):
+    """Shortest --range value selecting exactly the given ascending positions."""
+    groups = []
+    for _, run in itertools.groupby(enumerate(positions), lambda item: item[1] - item[0]):
+        run = [position for _, position in run]
+        groups.append(str(run[0]) if len(run) == 1 else f"{run[0]}-{run[-1]}")
+    return ",".join(groups)
+
+MetadataMatch = namedtuple("MetadataMatch", "total filtered matched positions unknown_size errors")
+
+def match_files(files, filter_func=None, ranges=None, min_size=None, max_size=None):
+    """Evaluate the file selection options against cached metadata the way gallery-dl would.
+    
+    gallery-dl checks --filter before --range, so range indices count files that
+    passed the filter; positions uses that numbering. Files without a size in
+    their metadata pass the size limits here and are checked during download.
+    """
+    matched = unknown_size = errors = 0
+    positions = []
+    index = 0
+    for kwdict in files:
+        if filter_func is not None:
+            try:
+                if not filter_func(kwdict):
+                    continue
+            except Exception:
+                errors += 1
+                continue
+        index += 1
+        if ranges and not any(index in r for r in ranges):
+            continue
+        if min_size is not None or max_size is not None:
+            size = next((kwdict[key] for key in METADATA_SIZE_KEYS if isinstance(kwdict.get(key), int)), None)
+            if size is None:
+                unknown_size += 1
+            elif (min_size is not None and size < min_size) or (max_size is not None and size > max_size):
+                continue
+        matched += 1
+        positions.append(index)
+    return MetadataMatch(len(files), index, matched, positions, unknown_size, errors)
+
+FilterPlan = namedtuple("FilterPlan", "expression notes")
+
+def filter_call_cost(node):
+    """Rough cost of evaluating an expression node, counting the calls in it."""
+    cost = 1
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            func = child.func
+            if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+                cost += FILTER_CALL_COSTS.get(func.value.id, FILTER_DEFAULT_CALL_COST)
+            elif isinstance(func, ast.Name):
+                cost += FILTER_CALL_COSTS.get(func.id, FILTER_DEFAULT_CALL_COST)
+            else:
+                cost += FILTER_DEFAULT_CALL_COST
+    return cost
+
+def is_control_clause(node):
+    """True for clauses that call abort() and friends or assign names; their order matters."""
+    for child in ast.walk(node):
+        if isinstance(child, ast.NamedExpr):
+            return True
+        if isinstance(child, ast.Call) and isinstance(child.func, ast.Name) and child.func.id in FILTER_CONTROL_CALLS:
+            return True
+    return False
+
+def membership_clause(node):
+    """(name, values, negated) for "name == c", "name != c", "name in (c, ...)" and "name not in (c, ...)"."""
+    if not (isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.left, ast.Name)):
+        return None
+    op, right = node.ops[0], node.comparators[0]
+    if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant):
+        values = [right.value]
+    elif isinstance(op, (ast.In, ast.NotIn)) and isinstance(right, (ast.Tuple, ast.List, ast.Set)):
+        if not all(isinstance(element, ast.Constant) for element in right.elts):
+            return None
+        values = [element.value for element in right.elts]
+    else:
+        return None
+    try:
+        values = set(values)
+    except TypeError:
+        return None
+    return node.left.id, values, isinstance(op, (ast.NotEq, ast.NotIn))
+
+def membership_node(name, values, negated):
+    """Comparison node testing name against values, as a tuple when there are several.
+    
+    A tuple compares with == like the tests it replaces; a set would raise
+    TypeError for unhashable field values such as lists of tags.
+    """
+    elements = [ast.Constant(value) for value in sorted(values, key=repr)]
+    if not elements:
+        return ast.Constant(negated)
+    if len(elements) == 1:
+        return ast.Compare(ast.Name(name, ast.Load()), [ast.NotEq() if negated else ast.Eq()], elements)
+    return ast.Compare(ast.Name(name, ast.Load()), [ast.NotIn() if negated else ast.In()], [ast.Tuple(elements, ast.Load())])
+
+def unconditional_nodes(node):
+    """Nodes of an expression that are evaluated whenever the expression is."""
+    yield node
+    if isinstance(node, ast.BoolOp):
+        children = node.values[:1]
+    elif isinstance(node, ast.IfExp):
+        children = [node.test]
+    elif isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+        children = []
+    elif isinstance(node, ast.Compare):
+        # later comparisons of a chain are skipped once one is false
+        children = [node.left, node.comparators[0]]
+    else:
+        children = ast.iter_child_nodes(node)
+    for child in children:
+        yield from unconditional_nodes(child)
+
+def hoistable_call(node):
+    """Source of a no-argument method call on a name, such as filename.lower(), or None."""
+    if (isinstance(node, ast.Call) and not node.args and not node.keywords
+            and isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Name)):
+        return f"{node.func.value.id}.{node.func.attr}()"
+    return None
+
+def optimize_filter(expression):
+    """Validate a --filter expression and rewrite it to evaluate faster; raises SyntaxError or ValueError.
+    
+    The top-level "and" clauses are rewritten: equality and membership tests
+    on the same name are merged into one membership test, method calls repeated in
+    several clauses are evaluated once through a "_"-prefixed name (which
+    gallery-dl keeps out of metadata output), and cheap clauses move in front
+    of expensive ones. gallery-dl treats an exception in a filter as False,
+    so reordering side-effect free clauses does not change which files pass;
+    clauses calling abort() and friends keep their place.
+    """
+    tree = ast.parse(expression.strip(), "<filter>", "eval")
+    
+    notes = []
+    regexes = 0
+    for node in ast.walk(tree):
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == "re"
+                and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+            try:
+                re.compile(node.args[0].value)
+            except re.error as e:
+                raise ValueError(f"invalid regular expression {node.args[0].value!r}: {e}")
+            regexes += 1
+    if regexes:
+        notes.append(f"validated {regexes} regular expression(s)")
+    
+    clauses = []
+    def flatten(node):
+        if isinstance(node, ast.BoolOp) and isinstance(node.op, ast.And):
+            for value in node.values:
+                flatten(value)
+        else:
+            clauses.append(node)
+    flatten(tree.body)
+    
+    # Merge tests on the same name; the merged test takes the place of the first one
+    merged = {}
+    kept = []
+    for clause in clauses:
+        membership = membership_clause(clause)
+        if membership is None:
+            kept.append(clause)
+            continue
+        name, values, negated = membership
+        if name not in merged:
+            merged[name] = {"allowed": None, "excluded": set(), "count": 0}
+            kept.append(name)
+        group = merged[name]
+        group["count"] += 1
+        if negated:
+            group["excluded"] |= values
+        else:
+            group["allowed"] = values if group["allowed"] is None else group["allowed"] & values
+    clauses = []
+    for clause in kept:
+        if not isinstance(clause, str):
+            clauses.append(clause)
+            continue
+        group = merged[clause]
+        if group["allowed"] is not None:
+            clauses.append(membership_node(clause, group["allowed"] - group["excluded"], False))
+        else:
+            clauses.append(membership_node(clause, group["excluded"], True))
+        if group["count"] > 1:
+            notes.append(f"merged {group['count']} tests on '{clause}' into one")
+    
+    # Cheap clauses first, without moving anything across a control clause
+    ordered = []
+    segment = []
+    for clause in clauses:
+        if is_control_clause(clause):
+            ordered.extend(sorted(segment, key=filter_call_cost))
+            ordered.append(clause)
+            segment = []
+        else:
+            segment.append(clause)
+    ordered.extend(sorted(segment, key=filter_call_cost))
+    if ordered != clauses:
+        notes.append("moved cheaper clauses to the front")
+    clauses = ordered
+    
+    # Evaluate calls used by several clauses once, where the first of them always evaluates it
+    uses = Counter()
+    for clause in clauses:
+        uses.update({hoistable_call(node) for node in ast.walk(clause)} - {None})
+    for call, count in uses.items():
+        if count < 2:
+            continue
+        alias = "_" + re.sub(r"\W+", "_", call).strip("_")
+        for index, clause in enumerate(clauses):
+            target = next((node for node in unconditional_nodes(clause) if hoistable_call(node) == call), None)
+            if target is not None:
+                break
+        if target is None or index == len(clauses) - 1:
+            continue
+        
+        class Hoist(ast.NodeTransformer):
+            def visit_Call(self, node):
+                if node is target:
+                    return ast.NamedExpr(ast.Name(alias, ast.Store()), node)
+                if hoistable_call(node) == call and self.after:
+                    return ast.Name(alias, ast.Load())
+                return self.generic_visit(node)
+        hoist = Hoist()
+        hoist.after = False
+        clauses[index] = hoist.visit(clauses[index])
+        hoist.after = True
+        clauses[index + 1:] = [hoist.visit(clause) for clause in clauses[index + 1:]]
+        notes.append(f"hoisted {call} ({count} uses)")
+    
+    body = clauses[0] if len(clauses) == 1 else ast.BoolOp(ast.And(), clauses)
+    return FilterPlan(ast.unparse(ast.fix_missing_locations(ast.Expression(body))), notes)
+
+def load_filter_corpus(path):
+    """File metadata from a JSON file: "gallery-dl -j" output, a list of metadata dicts, or one dict."""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = [data]
+    corpus = []
+    for item in data:
+        if isinstance(item, dict):
+            corpus.append(restore_datetimes(item))
+        elif isinstance(item, list) and item and item[0] == MESSAGE_URL:
+            corpus.append(restore_datetimes(item[2]))
+    return corpus
+
+FilterBenchmark = namedtuple("FilterBenchmark", "plan original optimized matches mismatches")
+
+def benchmark_filter(expression, corpus, repeat=FILTER_BENCH_REPEAT):
+    """Best-of-repeat seconds for evaluating the original and the optimized filter over corpus."""
+    plan = optimize_filter(expression)
+    
+    def evaluate(func, kwdict):
+        try:
+            return bool(func(kwdict))
+        except Exception:
+            return False
+    
+    timings = []
+    results = []
+    for source in (expression, plan.expression):
+        func = compile_filter(source)
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            matches = [evaluate(func, kwdict) for kwdict in corpus]
+            best = min(best, time.perf_counter() - started)
+        timings.append(best)
+        results.append(matches)
+    mismatches = sum(a != b for a, b in zip(*results))
+    return FilterBenchmark(plan, timings[0], timings[1], sum(results[1]), mismatches)
+
+def run_filter_benchmark(args):
+    """Command line entry point: --bench-filter CORPUS.json EXPRESSION"""
+    if len(args) != 2:
+        print(f"usage: {os.path.basename(sys.argv[0])} {BENCH_FILTER_FLAG} CORPUS.json EXPRESSION", file=sys.stderr)
+        return 2
+    corpus = load_filter_corpus(args[0])
+    try:
+        result = benchmark_filter(args[1], corpus)
+    except (SyntaxError, ValueError) as e:
+        print(f"Invalid filter: {e}", file=sys.stderr)
+        return 1
+    print(f"Files:     {len(corpus):,}")
+    print(f"Original:  {args[1]}")
+    print(f"Optimized: {result.plan.expression}")
+    for note in result.plan.notes:
+        print(f"  - {note}")
+    per_file = 1e6 / max(len(corpus), 1)
+    print(f"Original:  {result.original * 1000:.2f} ms ({result.original * per_file:.2f} us/file)")
+    print(f"Optimized: {result.optimized * 1000:.2f} ms ({result.optimized * per_file:.2f} us/file)")
+    if result.optimized:
+        print(f"Speedup:   {result.original / result.optimized:.2f}x")
+    print(f"Matches:   {result.matches:,}, {result.mismatches:,} file(s) evaluated differently")
+    return 1 if result.mismatches else 0
+
+def tag_list(tags):
+    """Tags of a metadata value as they appear in it, the way filters see them."""
+    if isinstance(tags, str):
+        tags = tags.split(", ") if ", " in tags else tags.split()
+    elif not isinstance(tags, (list, tuple)):
+        return []
+    result = []
+    for tag in tags:
+        if isinstance(tag, dict):
+            tag = tag.get("name") or tag.get("tag")
+        if isinstance(tag, str) and tag.strip():
+            result.append(tag.strip())
+    return result
+
+def normalize_tag(tag):
+    """Lower case, with spaces inside the tag turned into "_"."""
+    return "_".join(tag.lower().split())
+
+def split_tags(tags):
+    """Normalized tags from a metadata value."""
+    return [normalize_tag(tag) for tag in tag_list(tags)]
+
+def sidecar_fields(kwdict):
+    """(category, date, extension, size, artist, tags, text, raw tags) indexed for one metadata dict."""
+    size = next((kwdict[key] for key in METADATA_SIZE_KEYS if isinstance(kwdict.get(key), int)), None)
+    artist = ""
+    for key in SEARCH_ARTIST_KEYS:
+        value = kwdict.get(key)
+        if isinstance(value, dict):
+            value = value.get("name") or value.get("username")
+        if isinstance(value, str) and value:
+            artist = value
+            break
+    raw_tags = tag_list(kwdict.get("tags") or kwdict.get("tag_string"))
+    text = " ".join(kwdict[key] for key in SEARCH_TEXT_KEYS if isinstance(kwdict.get(key), str))
+    date = kwdict.get("date")
+    return (
+        kwdict.get("category"), date if isinstance(date, str) else None, kwdict.get("extension"),
+        size, artist, " ".join(normalize_tag(tag) for tag in raw_tags), text[:SEARCH_TEXT_MAX_CHARS], raw_tags
+    )
+
+def read_sidecar(path):
+    """sidecar_fields() of a JSON sidecar file, or None if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            kwdict = json.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    return sidecar_fields(kwdict) if isinstance(kwdict, dict) else None
+
+def fts_quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+SearchResult = namedtuple("SearchResult", "path date extension size artist")
+
+class MetadataIndex:
+    """SQLite FTS5 index of the JSON sidecars written by --write-metadata.
+    
+    Typed columns (date, extension, size) live in a regular table, tags,
+    artist and text in an external-content FTS5 table kept in sync by
+    triggers. Updates take the sidecars and their mtimes from the
+    DestinationIndex, so only new or modified sidecars are read again.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            # Tag frequencies for autocomplete, keyed by normalized tag, with the form seen last
+            new_counts = db.execute("SELECT 1 FROM sqlite_master WHERE name='tag_counts'").fetchone() is None
+            db.execute("CREATE TABLE IF NOT EXISTS tag_counts (tag TEXT PRIMARY KEY, raw TEXT, count INTEGER)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, sidecar TEXT UNIQUE, mtime_ns INTEGER, "
+                "path TEXT, category TEXT, date TEXT, extension TEXT, size INTEGER, artist TEXT, tags TEXT, text TEXT)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS files_date ON files (date)")
+            db.execute("CREATE INDEX IF NOT EXISTS files_extension ON files (extension)")
+            db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(tags, artist, text, "
+                "content='files', content_rowid='id', tokenize=\"unicode61 tokenchars '_'\")"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN "
+                "INSERT INTO files_fts (rowid, tags, artist, text) VALUES (new.id, new.tags, new.artist, new.text); END"
+            )
+            db.execute(
+                "CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN "
+                "INSERT INTO files_fts (files_fts, rowid, tags, artist, text) "
+                "VALUES ('delete', old.id, old.tags, old.artist, old.text); END"
+            )
+            if new_counts:
+                # Index built before tags were counted; its normalized tags have to do
+                counts = Counter(tag for tags, in db.execute("SELECT tags FROM files") for tag in tags.split())
+                db.executemany("INSERT INTO tag_counts VALUES (?, ?, ?)", ((tag, tag, count) for tag, count in counts.items()))
+    
+    def forget(self, db, sidecar):
+        """Remove a sidecar from the index and from the tag counts."""
+        row = db.execute("SELECT tags FROM files WHERE sidecar=?", (sidecar,)).fetchone()
+        if row is None:
+            return
+        db.executemany("UPDATE tag_counts SET count=count-1 WHERE tag=?", ((tag,) for tag in row[0].split()))
+        db.execute("DELETE FROM files WHERE sidecar=?", (sidecar,))
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def update(self, root, dest_index, log, workers=SEARCH_INDEX_WORKERS):
+        """Index new and modified sidecars below root and drop deleted ones; returns (indexed, removed)."""
+        dest_index.refresh(root)
+        prefix = os.path.join(DestinationIndex.dir_key(root), "")
+        db = self.connect()
+        try:
+            known = dict(db.execute(
+                "SELECT sidecar, mtime_ns FROM files WHERE sidecar>=? AND sidecar<?", (prefix, prefix + "\uffff")
+            ))
+            indexed = 0
+            batch = []
+            
+            def flush():
+                # Reading is I/O bound on network shares, so threads overlap it well
+                rows = list(pool.map(read_sidecar, [sidecar for sidecar, _, _ in batch]))
+                for (sidecar, mtime_ns, media_size), fields in zip(batch, rows):
+                    self.forget(db, sidecar)
+                    if fields is None:
+                        continue
+                    category, date, extension, size, artist, tags, text, raw_tags = fields
+                    db.executemany(
+                        "INSERT INTO tag_counts VALUES (?, ?, 1) "
+                        "ON CONFLICT (tag) DO UPDATE SET count=count+1, raw=excluded.raw",
+                        {normalize_tag(tag): tag for tag in raw_tags}.items()
+                    )
+                    db.execute(
+                        "INSERT INTO files (sidecar, mtime_ns, path, category, date, extension, size, artist, tags, text) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (sidecar, mtime_ns, sidecar[:-5], category, date, extension,
+                         media_size if media_size is not None else size, artist, tags, text)
+                    )
+                db.commit()
+                batch.clear()
+            
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for directory, entries in dest_index.directories(root):
+                    for name, (size, mtime_ns) in entries.items():
+                        if not name.endswith(".json"):
+                            continue
+                        sidecar = os.path.join(directory, name)
+                        if known.pop(sidecar, None) == mtime_ns:
+                            continue
+                        media = entries.get(name[:-5])
+                        batch.append((sidecar, mtime_ns, media[0] if media else None))
+                        if len(batch) >= SEARCH_INDEX_BATCH_SIZE:
+                            indexed += len(batch)
+                            flush()
+                            log(f"Search index: {indexed:,} sidecars indexed")
+                indexed += len(batch)
+                flush()
+            
+            # Whatever is left in known was not found on disk any more
+            for sidecar in known:
+                self.forget(db, sidecar)
+            db.execute("DELETE FROM tag_counts WHERE count<=0")
+            db.commit()
+            return indexed, len(known)
+        finally:
+            db.close()
+    
+    def search(self, tags=(), artist="", text="", extension="", after="", before="", limit=SEARCH_RESULT_LIMIT):
+        """Newest files matching every given criterion; tags starting with "-" must not be present."""
+        where = []
+        params = []
+        terms = [f"tags : {fts_quote(tag)}" for tag in tags if not tag.startswith("-")]
+        if artist:
+            terms.append(f"artist : {fts_quote(artist)}")
+        terms.extend(f"text : {fts_quote(word)}" for word in text.split())
+        if terms:
+            where.append("id IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+            params.append(" AND ".join(terms))
+        excluded = [f"tags : {fts_quote(tag[1:])}" for tag in tags if tag.startswith("-") and len(tag) > 1]
+        if excluded:
+            where.append("id NOT IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+            params.append(" OR ".join(excluded))
+        if extension:
+            where.append("extension=?")
+            params.append(extension.lower().lstrip("."))
+        if after:
+            where.append("date>=?")
+            params.append(after)
+        if before:
+            where.append("date<?")
+            params.append(before)
+        
+        sql = "SELECT path, date, extension, size, artist FROM files"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY date DESC LIMIT ?"
+        params.append(limit)
+        db = self.connect()
+        try:
+            return [SearchResult(*row) for row in db.execute(sql, params)]
+        finally:
+            db.close()
+    
+    def count(self):
+        db = self.connect()
+        try:
+            return db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        finally:
+            db.close()
+    
+    def tag_rows(self):
+        """Yield (tag, raw, count) for every observed tag in byte order of the normalized tag."""
+        db = self.connect()
+        try:
+            yield from db.execute("SELECT tag, raw, count FROM tag_counts WHERE count>0 ORDER BY tag")
+        finally:
+            db.close()
+
+class TagKeys:
+    """Sequence view of the normalized tags in a TagIndex, for bisect."""
+    
+    def __init__(self, index):
+        self.index = index
+    
+    def __len__(self):
+        return self.index.count
+    
+    def __getitem__(self, position):
+        return self.index.entry_bytes(position).partition(b"\0")[0]
+
+class TagIndex:
+    """Memory-mapped sorted array of observed tags with their counts, for prefix lookups.
+    
+    The file holds a header (magic, entry count), N+1 uint64 offsets, N
+    uint32 counts and the entries as "normalized tag\\0raw tag" in byte order
+    of the normalized tag, so a prefix is a range found with two bisects and
+    nothing has to be loaded into memory.
+    """
+    
+    MAGIC = b"GUITAGS1"
+    
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.mm = None
+        self.offsets = None
+        self.counts = None
+        self.count = 0
+        self.open()
+    
+    def open(self):
+        """Map the index file; a missing or damaged one leaves the index empty until it is rebuilt."""
+        try:
+            self.file = open(self.path, "rb")
+            self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, count = struct.unpack_from("<8sQ", self.mm)
+            if magic != self.MAGIC:
+                raise ValueError("not a tag index")
+            offsets_end = 16 + 8 * (count + 1)
+            blob_start = offsets_end + 4 * count
+            if len(self.mm) < blob_start:
+                raise ValueError("truncated tag index")
+            with memoryview(self.mm) as view:
+                self.offsets = view[16:offsets_end].cast("Q")
+                self.counts = view[offsets_end:blob_start].cast("I")
+            if self.offsets[count] > len(self.mm) - blob_start:
+                raise ValueError("truncated tag index")
+        except (OSError, ValueError, TypeError, struct.error):
+            self.close()
+            return
+        self.blob_start = blob_start
+        self.count = count
+    
+    def close(self):
+        if self.offsets is not None:
+            self.offsets.release()
+            self.offsets = None
+        if self.counts is not None:
+            self.counts.release()
+            self.counts = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.count = 0
+    
+    def write(self, rows):
+        """Replace the index with rows of (tag, raw, count), sorted by tag."""
+        offsets = array("Q", [0])
+        counts = array("I")
+        with tempfile.TemporaryFile() as blob:
+            for tag, raw, count in rows:
+                entry = tag.encode("utf-8") + b"\0" + raw.encode("utf-8")
+                blob.write(entry)
+                offsets.append(offsets[-1] + len(entry))
+                counts.append(min(count, 0xFFFFFFFF))
+            blob.seek(0)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "wb") as f:
+                f.write(struct.pack("<8sQ", self.MAGIC, len(counts)))
+                offsets.tofile(f)
+                counts.tofile(f)
+                shutil.copyfileobj(blob, f)
+        # A mapped file cannot be replaced on Windows
+        with self.lock:
+            self.close()
+            os.replace(temp_path, self.path)
+            self.open()
+        return len(counts)
+    
+    def entry_bytes(self, position):
+        start = self.blob_start + self.offsets[position]
+        return self.mm[start:self.blob_start + self.offsets[position + 1]]
+    
+    def entry(self, position):
+        """(raw tag, count) at a position."""
+        raw = self.entry_bytes(position).partition(b"\0")[2]
+        return raw.decode("utf-8", errors="replace"), self.counts[position]
+    
+    def span(self, prefix):
+        """Positions [lo, hi) of the tags starting with prefix."""
+        key = normalize_tag(prefix).encode("utf-8")
+        keys = TagKeys(self)
+        # UTF-8 never contains 0xff, so it sorts after every continuation of the prefix
+        return bisect_left(keys, key), bisect_left(keys, key + b"\xff")
+    
+    def complete(self, prefix, limit=TAG_COMPLETIONS, scan=TAG_COMPLETION_SCAN):
+        """Most frequent (raw tag, count) pairs starting with prefix."""
+        with self.lock:
+            if not self.count or not prefix.strip():
+                return []
+            lo, hi = self.span(prefix)
+            hi = min(hi, lo + scan)
+            best = heapq.nlargest(limit, range(lo, hi), key=self.counts.__getitem__)
+            return [self.entry(position) for position in best]
+    
+    def exists(self, tag):
+        with self.lock:
+            if not self.count:
+                return True
+            key = normalize_tag(tag).encode("utf-8")
+            position = bisect_left(TagKeys(self), key)
+            return position < self.count and TagKeys(self)[position] == key
+    
+    def suggest(self, tag, limit=TAG_SUGGESTIONS):
+        """Known tags that look like a misspelling of tag, most similar first."""
+        with self.lock:
+            if not self.count:
+                return []
+            # Typos rarely hit the first characters; compare against the most frequent tags sharing them
+            lo, hi = self.span(normalize_tag(tag)[:2])
+            positions = heapq.nlargest(TAG_SUGGESTION_CANDIDATES, range(lo, hi), key=self.counts.__getitem__)
+            candidates = {self.entry_bytes(position).partition(b"\0")[0].decode("utf-8", errors="replace"): position
+                          for position in positions}
+            matches = difflib.get_close_matches(normalize_tag(tag), candidates, n=limit, cutoff=TAG_SUGGESTION_CUTOFF)
+            return [self.entry(candidates[match]) for match in matches]
+
+def expected_file_size(headers):
+    """Full size of a download from its response headers, or None if the server did not say."""
+    if not headers:
+        return None
+    fields = {str(name).lower(): value for name, value in headers.items()}
+    if fields.get("content-encoding", "identity") != "identity":
+        return None
+    if "content-range" in fields:
+        size = str(fields["content-range"]).rpartition("/")[2]
+    else:
+        size = fields.get("content-length")
+    try:
+        return int(size)
+    except (TypeError, ValueError):
+        return None
+
+def check_mp4_boxes(file, size):
+    """Walk the top-level boxes of an MP4/MOV file; a truncated file ends inside its last box."""
+    offset = 0
+    boxes = set()
+    while offset < size:
+        file.seek(offset)
+        header = file.read(16)
+        if len(header) < 8:
+            return "truncated MP4 box header"
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        if box_size == 1:
+            if len(header) < 16:
+                return "truncated MP4 box header"
+            box_size = struct.unpack(">Q", header[8:16])[0]
+        elif box_size == 0:
+            box_size = size - offset
+        if box_size < 8:
+            return f"invalid MP4 box size at offset {offset:,}"
+        boxes.add(box_type)
+        offset += box_size
+    if offset > size:
+        return f"MP4 truncated ({size:,} of {offset:,} bytes)"
+    if b"moov" not in boxes:
+        return "MP4 has no moov box"
+    return None
+
+def check_media_file(path, expected=None):
+    """Cheap structural check of a downloaded file; returns why it looks broken, or None.
+    
+    The format is taken from the file's first bytes rather than its extension,
+    and files in other formats only get the size check.
+    """
+    size = os.path.getsize(path)
+    if expected is not None and size != expected:
+        return f"size {size:,} does not match Content-Length {expected:,}"
+    if not size:
+        return "empty file"
+    with open(path, "rb") as file:
+        head = file.read(16)
+        if head.startswith(b"\xff\xd8\xff"):
+            file.seek(max(size - VERIFY_TAIL_BYTES, 0))
+            if b"\xff\xd9" not in file.read():
+                return "JPEG end marker missing"
+        elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+            file.seek(max(size - VERIFY_TAIL_BYTES, 0))
+            if b"IEND\xaeB`\x82" not in file.read():
+                return "PNG IEND chunk missing"
+        elif head[4:8] in VERIFY_MP4_BOXES:
+            return check_mp4_boxes(file, size)
+    return None
+
+def decode_media_file(path):
+    """Decode the whole file with Pillow or ffmpeg; returns the error, or None if it decoded or neither applies."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in VERIFY_VIDEO_EXTENSIONS:
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            return None
+        result = subprocess.run(
+            [ffmpeg, "-v", "error", "-xerror", "-i", path, "-f", "null", "-"],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace"
+        )
+        if result.returncode:
+            error = result.stderr.strip().splitlines()
+            return "ffmpeg: " + (error[-1] if error else f"exit code {result.returncode}")
+    elif Image is not None and extension in GALLERY_EXTENSIONS:
+        try:
+            with Image.open(path) as image:
+                image.load()
+        except Exception as e:
+            return f"decoding failed: {e}"
+    return None
+
+class VerifyCache:
+    """Verification results per path, valid while the file keeps its size and mtime."""
+    
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS verified "
+                "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, decoded INTEGER, problem TEXT)"
+            )
+    
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=60)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+    
+    def get(self, path, size, mtime_ns, decode):
+        """(problem,) from an earlier check at least as thorough, or None if the file has to be checked."""
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT problem FROM verified WHERE path=? AND size=? AND mtime_ns=? AND decoded>=?",
+                (path, size, mtime_ns, int(decode))
+            ).fetchone()
+        return row
+    
+    def put(self, path, size, mtime_ns, decoded, problem):
+        with self.connect() as db:
+            db.execute("INSERT OR REPLACE INTO verified VALUES (?, ?, ?, ?, ?)", (path, size, mtime_ns, int(decoded), problem))
+
+def retry_job_options(options, path):
+    """Options for a job that downloads just one file again, straight to path."""
+    for flag, takes_value in VERIFY_RETRY_STRIP_OPTIONS:
+        options = remove_option(options, flag, takes_value)
+    directory, name = os.path.split(path)
+    # -f is a format string, so braces in the name are doubled
+    options = set_option(options, "-D", directory)
+    return set_option(options, "-f", name.replace("{", "{{").replace("}", "}}"))
+
+class VerifyStage:
+    """Checks finished files on a bounded pool of worker threads before later stages see them.
+    
+    Each file's size is compared with the server's Content-Length, and JPEG,
+    PNG and MP4 files are checked for their header and trailer (or complete
+    box structure); optionally everything is fully decoded. Results are
+    cached by size and mtime. Files that pass are handed to downstream
+    listeners; corrupt ones are collected for take_corrupt().
+    """
+    
+    def __init__(self, cache, log, downstream=()):
+        self.cache = cache
+        self.downstream = list(downstream)
+        self.log = log
+        self.lock = threading.Lock()
+        self.queue = None
+        self.threads = []
+        self.decode = False
+        self.hold_corrupt = False
+        self.corrupt = []
+        self.stats = Counter()
+    
+    def start(self, decode=False, hold_corrupt=False, workers=VERIFY_WORKERS):
+        """Start the workers; with hold_corrupt, corrupt files are not passed downstream."""
+        with self.lock:
+            self.decode = decode
+            self.hold_corrupt = hold_corrupt
+            if self.queue is not None:
+                return
+            self.stats = Counter()
+            self.queue = queue.Queue(maxsize=VERIFY_QUEUE_SIZE)
+            self.threads = [threading.Thread(target=self.worker_loop, args=(self.queue,), daemon=True) for _ in range(workers)]
+            for thread in self.threads:
+                thread.start()
+    
+    def on_event(self, job, event):
+        work = self.queue
+        if work is None or event.kind != EVENT_FILE or not event.path:
+            self.forward(job, event)
+            return
+        work.put((job, event))
+    
+    def forward(self, job, event):
+        for listener in self.downstream:
+            listener(job, event)
+    
+    def worker_loop(self, work):
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            job, event = item
+            # A worker that dies would leave downloads blocked on the full queue
+            try:
+                problem = self.verify(event.path, event.expected)
+            except Exception as e:
+                self.log(f"Verification: cannot check {event.path}: {e}")
+                problem = None
+            if problem is not None:
+                self.log(f"Verification: {event.path}: {problem}")
+                with self.lock:
+                    self.stats["corrupt"] += 1
+                    self.corrupt.append((job, event, problem))
+                if self.hold_corrupt:
+                    continue
+            self.forward(job, event)
+    
+    def verify(self, path, expected=None):
+        st = os.stat(path)
+        decode = self.decode
+        cached = self.cache.get(path, st.st_size, st.st_mtime_ns, decode)
+        if cached is not None:
+            with self.lock:
+                self.stats["cached"] += 1
+            return cached[0]
+        problem = check_media_file(path, expected)
+        if problem is None and decode:
+            problem = decode_media_file(path)
+        self.cache.put(path, st.st_size, st.st_mtime_ns, decode, problem)
+        with self.lock:
+            self.stats["checked"] += 1
+            self.stats["with_size"] += expected is not None
+        return problem
+    
+    def take_corrupt(self):
+        """Corrupt files found so far as (job, event, problem), clearing the list."""
+        with self.lock:
+            corrupt, self.corrupt = self.corrupt, []
+        return corrupt
+    
+    def finish(self):
+        """Check everything still queued, stop the workers and return the stage's statistics."""
+        with self.lock:
+            work, threads = self.queue, self.threads
+        if work is None:
+            return None
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            self.queue = None
+            self.threads = []
+            stats = Counter(self.stats)
+        return stats
+
+def quote_path(path):
+    """Quote a path for the platform's shell."""
+    if platform.system() == "Windows":
+        return subprocess.list2cmdline([path])
+    return shlex.quote(path)
+
+class PostProcessStage:
+    """Runs a command over downloaded files on a bounded pool of worker threads.
+    
+    Files arrive as "file" events on the jobs' threads. The queue is bounded,
+    so when the command falls behind, downloads wait for it instead of
+    piling up paths. In EXEC_BATCHED mode each worker collects files like
+    xargs: a command without "{}" gets a whole batch appended, one with "{}"
+    runs once per file. In EXEC_STDIN mode each worker keeps one helper
+    process running and writes it a path per line.
+    """
+    
+    def __init__(self, log):
+        self.log = log
+        self.lock = threading.Lock()
+        self.queue = None
+        self.threads = []
+        self.command = None
+        self.mode = None
+        self.stats = Counter()
+    
+    def start(self, command, mode, workers=EXEC_WORKERS):
+        """Start the workers, unless a stage for the same command is still running."""
+        with self.lock:
+            if self.queue is not None:
+                if (command, mode) != (self.command, self.mode):
+                    self.log("Post-processing: still finishing the previous command, new settings apply next run")
+                return
+            self.command = command
+            self.mode = mode
+            self.stats = Counter()
+            self.queue = queue.Queue(maxsize=EXEC_QUEUE_SIZE)
+            self.threads = [threading.Thread(target=self.worker_loop, args=(self.queue,), daemon=True) for _ in range(workers)]
+            for thread in self.threads:
+                thread.start()
+    
+    def on_event(self, job, event):
+        work = self.queue
+        if work is None or event.kind != EVENT_FILE or not event.path:
+            return
+        queued = time.monotonic()
+        work.put((event.path, queued))
+        blocked = time.monotonic() - queued
+        with self.lock:
+            self.stats["files"] += 1
+            self.stats["backpressure"] += blocked
+            self.stats["max_depth"] = max(self.stats["max_depth"], work.qsize())
+    
+    def worker_loop(self, work):
+        helper = None
+        stopping = False
+        while not stopping:
+            item = work.get()
+            if item is None:
+                break
+            batch = [item]
+            length = len(item[0])
+            deadline = time.monotonic() + EXEC_BATCH_LINGER
+            # Per-file commands do not wait for more work
+            while self.mode == EXEC_STDIN or "{}" not in self.command:
+                if len(batch) >= EXEC_BATCH_SIZE or length >= EXEC_BATCH_MAX_CHARS:
+                    break
+                try:
+                    item = work.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+                length += len(item[0]) + 3
+            
+            started = time.monotonic()
+            if self.mode == EXEC_STDIN:
+                helper = self.feed_helper(helper, [path for path, _ in batch])
+            else:
+                self.run_batch([path for path, _ in batch])
+            with self.lock:
+                self.stats["batches"] += 1
+                self.stats["wait"] += sum(started - queued for _, queued in batch)
+                self.stats["command"] += time.monotonic() - started
+        
+        if helper is not None:
+            started = time.monotonic()
+            helper.stdin.close()
+            if helper.wait():
+                self.log(f"Post-processing helper exited with code {helper.returncode}")
+            with self.lock:
+                self.stats["command"] += time.monotonic() - started
+    
+    def run_batch(self, paths):
+        if "{}" in self.command:
+            commands = [self.command.replace("{}", quote_path(path)) for path in paths]
+        else:
+            commands = [self.command + " " + " ".join(quote_path(path) for path in paths)]
+        for command in commands:
+            result = subprocess.run(command, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                    text=True, errors="replace")
+            if result.returncode:
+                with self.lock:
+                    self.stats["failures"] += 1
+                error = result.stderr.strip().splitlines()
+                self.log(f"Post-processing failed with code {result.returncode}" + (f": {error[-1]}" if error else ""))
+    
+    def feed_helper(self, helper, paths):
+        """Write paths to the helper, starting it (again) when needed; returns the helper."""
+        for attempt in range(2):
+            if helper is None or helper.poll() is not None:
+                helper = subprocess.Popen(self.command, shell=True, stdin=subprocess.PIPE, text=True, encoding="utf-8")
+            try:
+                helper.stdin.write("".join(path + "\n" for path in paths))
+                helper.stdin.flush()
+                return helper
+            except OSError:
+                self.log(f"Post-processing helper exited with code {helper.wait()}")
+                helper = None
+        with self.lock:
+            self.stats["failures"] += 1
+        return None
+    
+    def finish(self):
+        """Process everything still queued, stop the workers and return the stage's statistics."""
+        with self.lock:
+            work, threads = self.queue, self.threads
+        if work is None:
+            return None
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            self.queue = None
+            self.threads = []
+            stats = Counter(self.stats)
+            stats["workers"] = len(threads)
+        return stats
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def deflate_file(path):
+    """Deflate a file into a spool file; returns (spool, CRC-32, uncompressed size)."""
+    spool = tempfile.SpooledTemporaryFile(ARCHIVE_SPOOL_SIZE)
+    compressor = zlib.compressobj(ARCHIVE_DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    crc = size = 0
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(ARCHIVE_CHUNK_SIZE), b""):
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    spool.seek(0)
+    return spool, crc, size
+
+def append_zip_entry(zfile, zinfo, source):
+    """Append an entry whose data in source is already deflated; zinfo carries its CRC and sizes.
+    
+    zipfile only compresses while it writes, so to deflate on several
+    threads the compressed data is copied in the way ZipFile.open(zinfo, "w")
+    and its writer do for a seekable file. Only used where
+    ARCHIVE_RAW_DEFLATE holds.
+    """
+    with zfile._lock:
+        if zfile._writing:
+            raise ValueError("another write handle is open on the archive")
+        zip64 = max(zinfo.file_size, zinfo.compress_size) * 1.05 > zipfile.ZIP64_LIMIT
+        zinfo.flag_bits = 0
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zfile._writecheck(zinfo)
+        zfile._didModify = True
+        zfile.fp.seek(zfile.start_dir)
+        zinfo.header_offset = zfile.fp.tell()
+        zfile.fp.write(zinfo.FileHeader(zip64))
+        shutil.copyfileobj(source, zfile.fp, ARCHIVE_CHUNK_SIZE)
+        zfile.start_dir = zfile.fp.tell()
+        zfile.filelist.append(zinfo)
+        zfile.NameToInfo[zinfo.filename] = zinfo
+
+class OpenArchive:
+    """An archive of an ArchiveStage, with the workers using it and the sources written into it."""
+    
+    def __init__(self, previous=None):
+        self.zfile = None
+        self.lock = threading.Lock()
+        self.users = 0
+        self.held = set()
+        self.closed = threading.Event()
+        # The same archive still being closed after an eviction; it is reopened once that is done
+        self.previous = previous
+
+class ArchiveStage:
+    """Moves downloaded files into ZIP/CBZ archives on a bounded pool of worker threads.
+    
+    Same layout as gallery-dl's zip post-processor: files saved in "dir/"
+    end up in "dir.zip" (or "dir.cbz"). Formats that are already compressed
+    are stored and copied straight from disk; everything else is deflated by
+    the workers into a spool file first, so only the copy into the archive
+    happens under its lock. Existing archives are appended to and stay open
+    until the stage finishes, so each central directory is written once;
+    only past ARCHIVE_OPEN_LIMIT open archives is the least recently used
+    one closed early. Appending writes over the old central directory, so a
+    source file is only deleted once every archive it went into is closed.
+    """
+    
+    def __init__(self, log):
+        self.log = log
+        self.lock = threading.Lock()
+        self.queue = None
+        self.threads = []
+        self.extensions = ()
+        self.keep_until_finish = False
+        # archive path -> OpenArchive, least recently used first
+        self.archives = OrderedDict()
+        self.closing = {}
+        # source path -> open archives (and the worker archiving it) still holding it
+        self.holders = Counter()
+        self.written = set()
+        self.touched = set()
+        self.archived = []
+        self.stats = Counter()
+    
+    def start(self, extensions, keep_until_finish=False, workers=ARCHIVE_WORKERS):
+        """Start the workers; with keep_until_finish, sources are only deleted by finish()."""
+        with self.lock:
+            if self.queue is not None:
+                if tuple(extensions) != self.extensions:
+                    self.log("Archiving: still finishing the previous run, new settings apply next run")
+                self.keep_until_finish = self.keep_until_finish or keep_until_finish
+                return
+            self.extensions = tuple(extensions)
+            self.keep_until_finish = keep_until_finish
+            self.stats = Counter()
+            self.touched = set()
+            self.started = time.monotonic()
+            self.queue = queue.Queue(maxsize=ARCHIVE_QUEUE_SIZE)
+            self.threads = [threading.Thread(target=self.worker_loop, args=(self.queue,), daemon=True) for _ in range(workers)]
+            for thread in self.threads:
+                thread.start()
+    
+    def on_event(self, job, event):
+        work = self.queue
+        if work is None or event.kind != EVENT_FILE or not event.path:
+            return
+        queued = time.monotonic()
+        work.put(event.path)
+        with self.lock:
+            self.stats["backpressure"] += time.monotonic() - queued
+    
+    def worker_loop(self, work):
+        while True:
+            path = work.get()
+            if path is None:
+                break
+            # A worker that dies would leave downloads blocked on the full queue
+            try:
+                self.archive_file(path)
+            except Exception as e:
+                with self.lock:
+                    self.stats["failures"] += 1
+                self.log(f"Archiving {path} failed: {e}")
+    
+    def open_archive(self, path):
+        """The archive at path, opened if needed and marked as in use until release_archive()."""
+        with self.lock:
+            archive = self.archives.get(path)
+            if archive is None:
+                archive = self.archives[path] = OpenArchive(self.closing.get(path))
+                self.touched.add(path)
+            self.archives.move_to_end(path)
+            archive.users += 1
+        # Opened outside the stage lock: mode "a" reads the whole existing central directory
+        try:
+            with archive.lock:
+                if archive.zfile is None:
+                    if archive.previous is not None:
+                        archive.previous.closed.wait()
+                        archive.previous = None
+                    # New entries are written over the central directory, which close() writes again
+                    archive.zfile = zipfile.ZipFile(path, "a")
+        except Exception:
+            self.release_archive(archive)
+            raise
+        return archive
+    
+    def release_archive(self, archive):
+        with self.lock:
+            archive.users -= 1
+            idle = [path for path, other in self.archives.items() if not other.users]
+            evicted = idle[:max(len(self.archives) - ARCHIVE_OPEN_LIMIT, 0)]
+            for path in evicted:
+                self.closing[path] = self.archives.pop(path)
+        for path in evicted:
+            self.close_archive(path)
+    
+    def close_archive(self, path):
+        """Write the central directory of an archive taken out of self.archives, then delete the sources it frees."""
+        archive = self.closing[path]
+        with archive.lock:
+            try:
+                if archive.zfile is not None:
+                    archive.zfile.close()
+                closed = True
+            except OSError as e:
+                closed = False
+                self.log(f"Archiving: could not finish {path}: {e}")
+        archive.closed.set()
+        with self.lock:
+            if self.closing.get(path) is archive:
+                del self.closing[path]
+            if not closed:
+                # Without a central directory the entries may be lost, so their sources stay
+                self.written.difference_update(archive.held)
+            deletable = self.release_sources(archive.held)
+        remove_files(deletable)
+    
+    def release_sources(self, sources):
+        """Drop one holder of each source; returns the archived ones no longer held. Called with the lock held."""
+        deletable = []
+        for source in sources:
+            self.holders[source] -= 1
+            if self.holders[source] > 0:
+                continue
+            del self.holders[source]
+            if source in self.written:
+                self.written.discard(source)
+                deletable.append(source)
+        if self.keep_until_finish:
+            self.archived.extend(deletable)
+            return []
+        return deletable
+    
+    def archive_file(self, path):
+        directory, name = os.path.split(path)
+        stored = os.path.splitext(name)[1].lower() in ARCHIVE_STORED_EXTENSIONS
+        payload = None if stored or not ARCHIVE_RAW_DEFLATE else deflate_file(path)
+        with self.lock:
+            # Held by this worker too, so closing the first archive cannot delete it before the next is written
+            self.holders[path] += 1
+        try:
+            for extension in self.extensions:
+                archive = self.open_archive(directory + extension)
+                try:
+                    with archive.lock:
+                        zfile = archive.zfile
+                        if name in zfile.NameToInfo:
+                            with self.lock:
+                                self.stats["duplicates"] += 1
+                            continue
+                        if payload is not None:
+                            spool, crc, size = payload
+                            zinfo = zipfile.ZipInfo.from_file(path, name)
+                            zinfo.CRC, zinfo.file_size = crc, size
+                            spool.seek(0, os.SEEK_END)
+                            zinfo.compress_size = spool.tell()
+                            spool.seek(0)
+                            append_zip_entry(zfile, zinfo, spool)
+                        elif stored:
+                            zfile.write(path, name, zipfile.ZIP_STORED)
+                        else:
+                            zfile.write(path, name, zipfile.ZIP_DEFLATED, ARCHIVE_DEFLATE_LEVEL)
+                        zinfo = zfile.NameToInfo[name]
+                    with self.lock:
+                        # Like gallery-dl, a file whose name is already taken in the archive stays on disk
+                        self.written.add(path)
+                        if path not in archive.held:
+                            archive.held.add(path)
+                            self.holders[path] += 1
+                        self.stats["stored" if stored else "deflated"] += 1
+                        self.stats["bytes_in"] += zinfo.file_size
+                        self.stats["bytes_out"] += zinfo.compress_size
+                finally:
+                    self.release_archive(archive)
+        finally:
+            if payload is not None:
+                payload[0].close()
+            with self.lock:
+                self.stats["files"] += 1
+                deletable = self.release_sources([path])
+            remove_files(deletable)
+    
+    def finish(self):
+        """Archive everything still queued, write the central directories and return the stage's statistics."""
+        with self.lock:
+            work, threads = self.queue, self.threads
+        if work is None:
+            return None
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            closing = list(self.archives)
+            for path in closing:
+                self.closing[path] = self.archives.pop(path)
+        for path in closing:
+            self.close_archive(path)
+        with self.lock:
+            archived, self.archived = self.archived, []
+            touched = self.touched
+            self.queue = None
+            self.threads = []
+        remove_files(archived)
+        # Like gallery-dl, drop the directories whose files all went into archives
+        for path in touched:
+            try:
+                os.rmdir(os.path.splitext(path)[0])
+            except OSError:
+                pass
+        with self.lock:
+            stats = Counter(self.stats)
+            stats["archives"] = len(touched)
+            stats["workers"] = len(threads)
+            stats["seconds"] = time.monotonic() - self.started
+        return stats
+
+class ThroughputMeter:
+    """Smoothed files/s and bytes/s from cumulative counters sampled at a fixed rate."""
+    
+    def __init__(self):
+        self.last_time = None
+        self.last_files = 0
+        self.last_bytes = 0
+        self.files_per_second = 0.0
+        self.bytes_per_second = 0.0
+    
+    def update(self, files, total_bytes, now=None):
+        now = time.monotonic() if now is None else now
+        if self.last_time is not None and now > self.last_time:
+            interval = now - self.last_time
+            weight = min(interval / DASHBOARD_SMOOTHING_SECONDS, 1.0)
+            self.files_per_second += weight * ((files - self.last_files) / interval - self.files_per_second)
+            self.bytes_per_second += weight * ((total_bytes - self.last_bytes) / interval - self.bytes_per_second)
+        self.last_time = now
+        self.last_files = files
+        self.last_bytes = total_bytes
+
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+def format_skip_ratio(files, skipped):
+    total = files + skipped
+    return f"{skipped / total:.0%}" if total else "-"
+
+def open_with_system(path):
+    """Open a file or folder with the platform's default application."""
+    if platform.system() == "Windows":
+        os.startfile(path)
+    elif platform.system() == "Darwin":
+        subprocess.Popen(["open", path])
+    else:
+        subprocess.Popen(["xdg-open", path])
+
+def make_thumbnail(path, size=GALLERY_THUMB_SIZE):
+    """Decode an image scaled to fit size x size, flattened onto the gallery background."""
+    with Image.open(path) as image:
+        # JPEGs decode straight at 1/2 to 1/8 scale
+        image.draft("RGB", (size, size))
+        image.thumbnail((size, size))
+        rgba = image.convert("RGBA")
+    thumbnail = Image.new("RGB", rgba.size, GALLERY_BACKGROUND)
+    thumbnail.paste(rgba, mask=rgba.getchannel("A"))
+    return thumbnail
+
+class ThumbnailStore:
+    """Thumbnails on disk, named after a hash of the source's size and its first and last 64 KiB.
+    
+    The name does not depend on the path, so moved or duplicated files share
+    a thumbnail and a file rewritten in place gets a new one.
+    """
+    
+    def __init__(self, directory, size=GALLERY_THUMB_SIZE):
+        self.directory = directory
+        self.size = size
+    
+    def key(self, path):
+        with open(path, "rb") as file:
+            file_size = os.fstat(file.fileno()).st_size
+            digest = hashlib.sha1(f"{file_size}:{self.size}:".encode())
+            digest.update(file.read(GALLERY_KEY_BYTES))
+            if file_size > GALLERY_KEY_BYTES:
+                file.seek(max(GALLERY_KEY_BYTES, file_size - GALLERY_KEY_BYTES))
+                digest.update(file.read())
+        return digest.hexdigest()
+    
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".jpg")
+    
+    def load(self, key):
+        try:
+            with Image.open(self.path(key)) as image:
+                return image.convert("RGB")
+        except (OSError, ValueError):
+            return None
+    
+    def save(self, key, image):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(temp_path, "JPEG", quality=85)
+        os.replace(temp_path, path)
+    
+    def thumbnail(self, path):
+        """(key, image, decoded) for path, decoding and storing the thumbnail on a miss."""
+        key = self.key(path)
+        image = self.load(key)
+        if image is not None:
+            return key, image, False
+        image = make_thumbnail(path, self.size)
+        self.save(key, image)
+        return key, image, True
+
+class ThumbnailCache:
+    """LRU of thumbnail PhotoImages bounded by their decoded size; only used on the Tk thread."""
+    
+    def __init__(self, budget=GALLERY_MEMORY_BUDGET):
+        self.budget = budget
+        self.used = 0
+        self.items = OrderedDict()
+    
+    def get(self, key):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        self.items.move_to_end(key)
+        return item[0]
+    
+    def put(self, key, photo, cost):
+        if key in self.items:
+            self.used -= self.items.pop(key)[1]
+        self.items[key] = (photo, cost)
+        self.used += cost
+        while self.used > self.budget and len(self.items) > 1:
+            _, (_, evicted) = self.items.popitem(last=False)
+            self.used -= evicted
+
+class ThumbnailGrid(ctk.CTkFrame):
+    """Virtualized thumbnail grid: canvas items exist only for the rows on screen.
+    
+    Thumbnails come from the memory LRU, then the disk store, and are decoded
+    on a thread pool otherwise. Requests for cells that scrolled away before
+    a worker got to them are dropped.
+    """
+    
+    def __init__(self, master, store, on_open=None, **kwargs):
+        super().__init__(master, **kwargs)
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.store = store
+        self.on_open = on_open
+        self.cache = ThumbnailCache()
+        self.pool = ThreadPoolExecutor(max_workers=GALLERY_DECODE_WORKERS)
+        self.paths = []
+        self.keys = {}
+        self.pending = set()
+        self.wanted = frozenset()
+        self.generation = 0
+        self.top = 0
+        self.columns = 1
+        self.render_scheduled = False
+        self.stats = Counter()
+        
+        self.canvas = tk.Canvas(self, bg=GALLERY_BACKGROUND, highlightthickness=0)
+        self.canvas.grid(row=0, column=0, sticky="nsew")
+        self.canvas.bind("<Configure>", lambda event: self.render())
+        self.canvas.bind("<MouseWheel>", lambda event: self.scroll_to(self.top - event.delta // 120 * GALLERY_SCROLL_STEP))
+        self.canvas.bind("<Button-4>", lambda event: self.scroll_to(self.top - GALLERY_SCROLL_STEP))
+        self.canvas.bind("<Button-5>", lambda event: self.scroll_to(self.top + GALLERY_SCROLL_STEP))
+        self.canvas.bind("<Double-1>", self.on_double_click)
+        
+        self.scrollbar = tk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+    
+    def set_paths(self, paths):
+        self.generation += 1
+        self.paths = paths
+        self.keys = {}
+        self.pending = set()
+        self.top = 0
+        self.render()
+    
+    def total_height(self):
+        return -(-len(self.paths) // self.columns) * GALLERY_CELL_SIZE
+    
+    def render(self):
+        self.render_scheduled = False
+        width = max(self.canvas.winfo_width(), 1)
+        height = max(self.canvas.winfo_height(), 1)
+        self.columns = max(width // GALLERY_CELL_SIZE, 1)
+        total = self.total_height()
+        self.top = max(0, min(self.top, total - height))
+        
+        first = self.top // GALLERY_CELL_SIZE * self.columns
+        last = min(-(-(self.top + height) // GALLERY_CELL_SIZE) * self.columns, len(self.paths))
+        prefetch = min(last + GALLERY_PREFETCH_ROWS * self.columns, len(self.paths))
+        self.wanted = frozenset(range(first, prefetch))
+        
+        self.canvas.delete("all")
+        half = GALLERY_CELL_SIZE // 2
+        for index in range(first, prefetch):
+            key = self.keys.get(index)
+            photo = self.cache.get(key) if key is not None else None
+            if photo is None:
+                self.request(index)
+            if index >= last:
+                continue
+            row, column = divmod(index, self.columns)
+            x = column * GALLERY_CELL_SIZE + half
+            y = row * GALLERY_CELL_SIZE - self.top + half
+            if photo is not None:
+                self.canvas.create_image(x, y, image=photo)
+            else:
+                inset = half - 8
+                self.canvas.create_rectangle(x - inset, y - inset, x + inset, y + inset, outline="#3a3a3a")
+                extension = os.path.splitext(self.paths[index])[1].lower()
+                self.canvas.create_text(x, y, text=extension or "?", fill="gray")
+        
+        if total:
+            self.scrollbar.set(self.top / total, min(self.top + height, total) / total)
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def schedule_render(self):
+        if not self.render_scheduled:
+            self.render_scheduled = True
+            self.after_idle(self.render)
+    
+    def request(self, index):
+        path = self.paths[index]
+        if Image is None or index in self.pending or os.path.splitext(path)[1].lower() not in GALLERY_EXTENSIONS:
+            return
+        self.pending.add(index)
+        self.pool.submit(self.decode_worker, self.generation, index, path)
+    
+    def decode_worker(self, generation, index, path):
+        if generation != self.generation or index not in self.wanted:
+            self.after(0, lambda: self.on_dropped(generation, index))
+            return
+        try:
+            key, image, decoded = self.store.thumbnail(path)
+        except Exception:
+            # Undecodable files keep their placeholder and are not retried
+            self.after(0, lambda: self.stats.update(failed=1))
+            return
+        self.after(0, lambda: self.on_thumbnail(generation, index, key, image, decoded))
+    
+    def on_dropped(self, generation, index):
+        if generation == self.generation:
+            self.pending.discard(index)
+    
+    def on_thumbnail(self, generation, index, key, image, decoded):
+        if generation != self.generation:
+            return
+        self.pending.discard(index)
+        self.keys[index] = key
+        self.stats["decoded" if decoded else "stored"] += 1
+        if self.cache.get(key) is None:
+            # PhotoImages belong to the Tk thread
+            self.cache.put(key, ImageTk.PhotoImage(image), image.width * image.height * 4)
+        if index in self.wanted:
+            self.schedule_render()
+    
+    def scroll_to(self, top):
+        self.top = int(top)
+        self.render()
+    
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(amount) * self.total_height())
+        elif action == "scroll":
+            step = self.canvas.winfo_height() if unit == "pages" else GALLERY_SCROLL_STEP
+            self.scroll_to(self.top + int(amount) * step)
+    
+    def on_double_click(self, event):
+        column = event.x // GALLERY_CELL_SIZE
+        index = (event.y + self.top) // GALLERY_CELL_SIZE * self.columns + column
+        if column < self.columns and 0 <= index < len(self.paths) and self.on_open is not None:
+            self.on_open(self.paths[index])
+
+class LogViewer(ctk.CTkToplevel):
+    """Window that pages through a MappedLog, rendering only the visible lines."""
+    
+    def __init__(self, master, path):
+        super().__init__(master)
+        self.title(f"Log Viewer - {os.path.basename(path)}")
+        self.geometry("1000x650")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        
+        self.log = MappedLog(path)
+        self.top_line = 0
+        self.visible_lines = 40
+        self.match_line = None
+        
+        # Search bar
+        search_frame = ctk.CTkFrame(self)
+        search_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=10, pady=10)
+        search_frame.grid_columnconfigure(1, weight=1)
+        
+        search_label = ctk.CTkLabel(search_frame, text="Regex:", font=ctk.CTkFont(size=14))
+        search_label.grid(row=0, column=0, padx=10, pady=10)
+        
+        self.search_var = tk.StringVar()
+        search_entry = ctk.CTkEntry(search_frame, textvariable=self.search_var, placeholder_text="Search pattern...")
+        search_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=10)
+        search_entry.bind("<Return>", lambda event: self.find_next())
+        
+        search_button = ctk.CTkButton(search_frame, text="Find Next", command=self.find_next, width=100)
+        search_button.grid(row=0, column=2, padx=10, pady=10)
+        
+        self.status_var = tk.StringVar(value="Indexing...")
+        status_label = ctk.CTkLabel(search_frame, textvariable=self.status_var, text_color="gray")
+        status_label.grid(row=0, column=3, padx=10, pady=10)
+        
+        # Text area only ever holds one screen of lines
+        self.text = tk.Text(self, bg="#212121", fg="#ffffff", font=("Consolas", 10), wrap=tk.NONE)
+        self.text.grid(row=1, column=0, sticky="nsew", padx=(10, 0), pady=(0, 10))
+        self.text.tag_configure("match", background="#5a4a00")
+        self.text.bind("<Configure>", self.on_resize)
+        self.text.bind("<MouseWheel>", self.on_mousewheel)
+        self.text.bind("<Button-4>", lambda event: self.scroll_to(self.top_line - 3))
+        self.text.bind("<Button-5>", lambda event: self.scroll_to(self.top_line + 3))
+        
+        self.scrollbar = tk.Scrollbar(self, command=self.on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 10), pady=(0, 10))
+        
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        threading.Thread(target=self.index_worker, daemon=True).start()
+    
+    def index_worker(self):
+        self.log.build_index()
+        self.after(0, self.on_indexed)
+    
+    def on_indexed(self):
+        self.status_var.set(f"{self.log.line_count():,} lines")
+        self.render()
+    
+    def render(self):
+        lines = self.log.get_lines(self.top_line, self.visible_lines)
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(lines))
+        if self.match_line is not None and self.top_line <= self.match_line < self.top_line + len(lines):
+            row = self.match_line - self.top_line + 1
+            self.text.tag_add("match", f"{row}.0", f"{row}.end")
+        self.text.config(state=tk.DISABLED)
+        
+        total = max(self.log.line_count(), 1)
+        self.scrollbar.set(self.top_line / total, min(self.top_line + self.visible_lines, total) / total)
+    
+    def scroll_to(self, line):
+        max_top = max(self.log.line_count() - self.visible_lines, 0)
+        self.top_line = max(0, min(int(line), max_top))
+        self.render()
+    
+    def on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(float(amount) * self.log.line_count())
+        elif action == "scroll":
+            step = self.visible_lines if unit == "pages" else 1
+            self.scroll_to(self.top_line + int(amount) * step)
+    
+    def on_mousewheel(self, event):
+        self.scroll_to(self.top_line - int(event.delta / 40))
+    
+    def on_resize(self, event):
+        line_height = max(self.text.tk.call("font", "metrics", self.text.cget("font"), "-linespace"), 1)
+        self.visible_lines = max(event.height // line_height, 1)
+        self.render()
+    
+    def find_next(self):
+        pattern = self.search_var.get()
+        if not pattern:
+            return
+        start = self.match_line + 1 if self.match_line is not None else self.top_line
+        try:
+            line = self.log.search(pattern, start)
+        except re.error as e:
+            self.status_var.set(f"Invalid regex: {e}")
+            return
+        if line is None:
+            self.status_var.set("No more matches")
+            return
+        self.match_line = line
+        self.status_var.set(f"Match at line {line + 1:,}")
+        self.scroll_to(line - self.visible_lines // 2)
+    
+    def on_close(self):
+        self.log.close()
+        self.destroy()
 
 class GalleryDLUI:
     def __init__(self, root):
@@ -26,6 +3928,87 @@ class GalleryDLUI:
         self.root.grid_columnconfigure(0, weight=1)
         self.root.grid_rowconfigure(0, weight=1)
         
+        # Lines waiting to be written to the console (filled from any thread)
+        self.console_queue = queue.Queue()
+        self.last_log_path = None
+        
+        # Download jobs, keyed by job id
+        self.jobs = {}
+        self.job_ids = itertools.count(1)
+        self.scheduler = JobScheduler(self.run_job)
+        self.was_busy = False
+        # Earlier runs of each URL, for job cost estimates and ETAs
+        self.job_history = None
+        self.drag_job_row = None
+        # Callbacks run for every DownloadEvent as fn(job, event), on the job's thread
+        self.event_listeners = []
+        self.job_meters = {}
+        self.total_meter = ThroughputMeter()
+        
+        # URLs imported from a file, queued in chunks on the next run
+        self.url_importer = None
+        
+        # Per-host limits learned from 429s and errors
+        self.rate_controller = None
+        
+        # Per-file commands and ZIP/CBZ archives, run by the UI on bounded worker pools
+        self.postprocess = PostProcessStage(log=self.log_to_console)
+        self.archiver = ArchiveStage(log=self.log_to_console)
+        
+        # Finished files are verified before the stages above see them
+        self.verifier = None
+        self.verify_attempts = Counter()
+        
+        # Failed URLs and the timer that runs them again
+        self.retry_queue = RetryQueue()
+        self.retry_after = None
+        self.retry_button_count = None
+        
+        # Subscriptions checked on a schedule, and the checks running now as {job id: (url, newest file URLs)}
+        self.watch_list = None
+        self.watch_checks = {}
+        self.event_listeners.append(self.on_watch_event)
+        
+        # Proxies handed out to jobs as they start
+        self.proxy_pool = ProxyPool(log=self.log_to_console)
+        self.event_listeners.append(self.proxy_pool.on_event)
+        
+        # One bandwidth budget shared by all running jobs
+        self.bandwidth = BandwidthBudget()
+        self.last_rebalance = time.monotonic()
+        
+        # Content hashes of downloaded files, reused by every de-duplication pass
+        self.hash_index = None
+        
+        # -j results per URL, so selection options can be previewed without crawling again
+        self.metadata_cache = None
+        self.metadata_loaded = OrderedDict()
+        self.metadata_loaded_lock = threading.Lock()
+        self.metadata_preview_after = None
+        self.metadata_preview_running = False
+        self.metadata_preview_pending = False
+        
+        # Full-text index of metadata sidecars for the Search tab
+        self.search_index = None
+        self.tag_index = None
+        
+        # Listing of the destination tree, used to skip existing files without a stat each
+        self.dest_index = None
+        self.indexing_jobs = []
+        
+        # Download archive shared by all jobs
+        self.archive = None
+        
+        # Journal of every URL's state, used to resume after the app is closed or crashes
+        self.journal = None
+        # The stores above are opened by open_stores() on a worker thread, so the window appears first;
+        # widgets in store_widgets stay disabled until stores_ready() has run
+        self.stores_loaded = False
+        self.store_widgets = []
+        self.library_engine = None
+        self.warm_pool = WarmWorkerPool()
+        self.standby_pool = StandbyProcessPool()
+        
         # Gallery-dl executable path
         self.gallery_dl_path = self.find_gallery_dl()
         
@@ -55,19 +4038,97 @@ class GalleryDLUI:
         self.create_auth_tab()
         self.create_selection_tab()
         self.create_postprocessing_tab()
+        self.create_jobs_tab()
+        self.create_watch_tab()
+        self.create_tools_tab()
+        self.create_search_tab()
+        self.create_gallery_tab()
         
         # Output console
         self.create_console()
         
-        # Run button
+        # Run and stop buttons
+        button_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        button_frame.grid(row=2, column=0, pady=20)
+        
         self.run_button = ctk.CTkButton(
-            self.main_frame, 
+            button_frame, 
             text="Run Download", 
             command=self.run_gallery_dl,
             height=40,
             font=ctk.CTkFont(size=16, weight="bold")
         )
-        self.run_button.grid(row=2, column=0, pady=20)
+        self.run_button.grid(row=0, column=0, padx=10)
+        
+        self.stop_button = ctk.CTkButton(
+            button_frame,
+            text="Stop All",
+            command=self.stop_all_jobs,
+            height=40,
+            fg_color="#8b2e2e",
+            hover_color="#6e2424",
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        self.stop_button.grid(row=0, column=1, padx=10)
+        
+        self.retry_button = ctk.CTkButton(
+            button_frame,
+            text="Retry Failed",
+            command=self.retry_failed_only,
+            height=40,
+            font=ctk.CTkFont(size=16, weight="bold")
+        )
+        self.retry_button.grid(row=0, column=2, padx=10)
+        self.store_widgets += [self.run_button, self.retry_button]
+        
+        for widget in self.store_widgets:
+            widget.configure(state="disabled")
+        threading.Thread(target=self.open_stores, daemon=True).start()
+    
+    def open_stores(self):
+        """Open the SQLite stores, tag index and learned host limits, then hand over to stores_ready()."""
+        try:
+            data_dir = get_data_dir()
+            self.job_history = JobHistory(os.path.join(data_dir, "history.sqlite3"))
+            self.rate_controller = HostRateController(os.path.join(data_dir, "host_limits.json"))
+            self.verifier = VerifyStage(
+                VerifyCache(os.path.join(data_dir, "verified.sqlite3")),
+                downstream=[self.postprocess.on_event, self.archiver.on_event], log=self.log_to_console
+            )
+            self.watch_list = WatchList(os.path.join(data_dir, "watch.sqlite3"))
+            self.hash_index = HashIndex(os.path.join(data_dir, "hashes.sqlite3"))
+            self.metadata_cache = MetadataCache(os.path.join(data_dir, "metadata.sqlite3"))
+            self.search_index = MetadataIndex(os.path.join(data_dir, "search.sqlite3"))
+            self.tag_index = TagIndex(os.path.join(data_dir, "tags.idx"))
+            self.dest_index = DestinationIndex(os.path.join(data_dir, "destination.sqlite3"))
+            self.archive = DownloadArchiveDB(os.path.join(data_dir, "archive.sqlite3"))
+            self.journal = JobJournal(os.path.join(data_dir, "journal.sqlite3"))
+        except Exception as e:
+            self.log_to_console(f"Failed to open the data stores in {get_data_dir()}: {str(e)}")
+            self.root.after(0, lambda: messagebox.showerror(
+                "Startup Failed",
+                f"Failed to open the data stores in {get_data_dir()}:\n{str(e)}\n\n"
+                "Downloads stay disabled until the app is restarted."
+            ))
+            return
+        self.root.after(0, self.stores_ready)
+    
+    def stores_ready(self):
+        # Listeners run in this order: rate control and verification before the watch list and proxy pool
+        self.rate_controller.on_change = self.on_rate_change
+        self.event_listeners[:0] = [self.rate_controller.on_event, self.verifier.on_event]
+        self.stores_loaded = True
+        for widget in self.store_widgets:
+            widget.configure(state="normal")
+        
+        self.refresh_archive_status()
+        self.refresh_dest_index_status()
+        self.refresh_watch_table()
+        self.schedule_metadata_preview()
+        self.root.after(WATCH_POLL_MS, self.poll_watch_list)
+        
+        # Offer to continue where the last session stopped
+        self.offer_resume()
 
     def find_gallery_dl(self):
         """Find gallery-dl executable in various locations."""
@@ -141,7 +4202,7 @@ class GalleryDLUI:
                 local_path = os.path.join(current_dir, local_filename)
                 
                 # Show progress in console
-                self.root.after(0, lambda: self.log_to_console(f"Downloading gallery-dl from {url}..."))
+                self.log_to_console(f"Downloading gallery-dl from {url}...")
                 
                 # Download the file
                 response = requests.get(url, stream=True)
@@ -157,7 +4218,7 @@ class GalleryDLUI:
                             downloaded += len(chunk)
                             if total_size > 0:
                                 progress = (downloaded / total_size) * 100
-                                self.root.after(0, lambda p=progress: self.log_to_console(f"Download progress: {p:.1f}%"))
+                                self.log_to_console(f"Download progress: {progress:.1f}%")
                 
                 # Make executable on Unix-like systems
                 if not filename.endswith((".exe", ".whl")):
@@ -165,25 +4226,25 @@ class GalleryDLUI:
                 
                 # Handle wheel installation
                 if filename.endswith(".whl"):
-                    self.root.after(0, lambda: self.log_to_console("Installing gallery-dl from wheel..."))
+                    self.log_to_console("Installing gallery-dl from wheel...")
                     result = subprocess.run([sys.executable, "-m", "pip", "install", local_path], 
                                           capture_output=True, text=True)
                     if result.returncode == 0:
                         self.gallery_dl_path = "gallery-dl"
-                        self.root.after(0, lambda: self.log_to_console("Gallery-dl installed successfully via pip!"))
+                        self.log_to_console("Gallery-dl installed successfully via pip!")
                         os.remove(local_path)  # Remove the wheel file
                     else:
-                        self.root.after(0, lambda: self.log_to_console(f"Failed to install wheel: {result.stderr}"))
+                        self.log_to_console(f"Failed to install wheel: {result.stderr}")
                         return
                 else:
                     self.gallery_dl_path = local_path
-                    self.root.after(0, lambda: self.log_to_console(f"Gallery-dl downloaded successfully to {local_path}"))
+                    self.log_to_console(f"Gallery-dl downloaded successfully to {local_path}")
                 
                 # Test the installation
                 self.root.after(0, self.test_gallery_dl)
                 
             except Exception as e:
-                self.root.after(0, lambda: self.log_to_console(f"Failed to download gallery-dl: {str(e)}"))
+                self.log_to_console(f"Failed to download gallery-dl: {str(e)}")
                 self.root.after(0, lambda: messagebox.showerror(
                     "Download Failed", 
                     f"Failed to download gallery-dl:\n{str(e)}\n\n"
@@ -220,6 +4281,9 @@ class GalleryDLUI:
         url_label = ctk.CTkLabel(main_tab, text="URLs (one per line):", font=ctk.CTkFont(size=14, weight="bold"))
         url_label.grid(row=0, column=0, sticky="w", padx=20, pady=(20, 5))
         
+        import_button = ctk.CTkButton(main_tab, text="Import URL List...", command=self.import_url_list, width=140)
+        import_button.grid(row=0, column=0, sticky="e", padx=20, pady=(20, 5))
+        
         self.url_text = ctk.CTkTextbox(main_tab, height=200)
         self.url_text.grid(row=1, column=0, sticky="ew", padx=20, pady=(0, 20))
         
@@ -360,6 +4424,44 @@ class GalleryDLUI:
         proxy_entry = ctk.CTkEntry(proxy_frame, textvariable=self.proxy_var, placeholder_text="http://proxy:port...")
         proxy_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=5)
         
+        # Proxy pool, used instead of the single proxy above when it has entries
+        pool_frame = ctk.CTkFrame(networking_tab)
+        pool_frame.grid(row=4, column=0, sticky="ew", padx=20, pady=15)
+        pool_frame.grid_columnconfigure(1, weight=1)
+        
+        pool_label = ctk.CTkLabel(pool_frame, text="Proxy pool (one per line):", font=ctk.CTkFont(size=14))
+        pool_label.grid(row=0, column=0, sticky="nw", padx=20, pady=5)
+        
+        self.proxy_pool_text = ctk.CTkTextbox(pool_frame, height=80)
+        self.proxy_pool_text.grid(row=0, column=1, columnspan=2, sticky="ew", padx=10, pady=5)
+        
+        check_url_label = ctk.CTkLabel(pool_frame, text="Health check URL:", font=ctk.CTkFont(size=14))
+        check_url_label.grid(row=1, column=0, sticky="w", padx=20, pady=5)
+        
+        self.proxy_check_url_var = tk.StringVar(value=PROXY_CHECK_URL)
+        check_url_entry = ctk.CTkEntry(pool_frame, textvariable=self.proxy_check_url_var)
+        check_url_entry.grid(row=1, column=1, sticky="ew", padx=10, pady=5)
+        
+        check_button = ctk.CTkButton(pool_frame, text="Check Now", command=self.check_proxy_pool, width=100)
+        check_button.grid(row=1, column=2, padx=10, pady=5)
+        
+        self.proxy_sticky_var = tk.BooleanVar()
+        sticky_check = ctk.CTkCheckBox(
+            pool_frame, text="Keep one proxy per site (for sites that tie sessions to an IP)", variable=self.proxy_sticky_var
+        )
+        sticky_check.grid(row=2, column=0, columnspan=3, sticky="w", padx=20, pady=5)
+        
+        columns = ("proxy", "latency", "errors", "jobs", "state")
+        headings = ("Proxy", "Latency (ms)", "Error Rate", "Jobs", "State")
+        widths = (300, 90, 80, 50, 70)
+        self.proxy_table = ttk.Treeview(pool_frame, columns=columns, show="headings", height=4)
+        for column, heading, width in zip(columns, headings, widths):
+            self.proxy_table.heading(column, text=heading)
+            self.proxy_table.column(column, width=width, stretch=(column == "proxy"))
+        self.proxy_table.grid(row=3, column=0, columnspan=3, sticky="ew", padx=20, pady=(5, 10))
+        
+        self.root.after(PROXY_TABLE_REFRESH_MS, self.refresh_proxy_table)
+        
         # IP version options
         ip_frame = ctk.CTkFrame(networking_tab)
         ip_frame.grid(row=3, column=0, sticky="w", padx=20, pady=10)
@@ -376,6 +4478,26 @@ class GalleryDLUI:
         no_check_cert_check = ctk.CTkCheckBox(ip_frame, text="No Certificate Check", variable=self.no_check_cert_var)
         no_check_cert_check.grid(row=0, column=2, sticky=tk.W)
     
+    def configure_proxy_pool(self):
+        proxies = [line.strip() for line in self.proxy_pool_text.get("1.0", tk.END).splitlines() if line.strip()]
+        # Keep the order but drop repeated lines
+        proxies = list(dict.fromkeys(proxies))
+        self.proxy_pool.configure(proxies, self.proxy_check_url_var.get().strip(), self.proxy_sticky_var.get())
+        return proxies
+    
+    def check_proxy_pool(self):
+        if not self.configure_proxy_pool():
+            messagebox.showinfo("Proxy Pool", "Enter one or more proxies first.")
+            return
+        self.proxy_pool.check_now()
+    
+    def refresh_proxy_table(self):
+        rows = self.proxy_pool.rows()
+        self.proxy_table.delete(*self.proxy_table.get_children())
+        for row in rows:
+            self.proxy_table.insert("", tk.END, values=row)
+        self.root.after(PROXY_TABLE_REFRESH_MS, self.refresh_proxy_table)
+    
     def create_download_tab(self):
         self.tabview.add("Download")
         download_tab = self.tabview.tab("Download")
@@ -405,6 +4527,18 @@ class GalleryDLUI:
         sleep_entry = ctk.CTkEntry(sleep_frame, textvariable=self.sleep_var, width=10, placeholder_text="2")
         sleep_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=5)
         
+        # Total bandwidth shared by all jobs
+        budget_frame = ctk.CTkFrame(download_tab)
+        budget_frame.grid(row=4, column=0, sticky="ew", padx=20, pady=15)
+        budget_frame.grid_columnconfigure(1, weight=1)
+        
+        budget_label = ctk.CTkLabel(budget_frame, text="Total bandwidth for all jobs (e.g. 50M):", font=ctk.CTkFont(size=14))
+        budget_label.grid(row=0, column=0, sticky="w", padx=20, pady=5)
+        
+        self.bandwidth_budget_var = tk.StringVar()
+        budget_entry = ctk.CTkEntry(budget_frame, textvariable=self.bandwidth_budget_var, width=10, placeholder_text="50M")
+        budget_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=5)
+        
         # Various checkboxes
         check_frame = ctk.CTkFrame(download_tab)
         check_frame.grid(row=2, column=0, sticky="w", padx=20, pady=10)
@@ -424,6 +4558,67 @@ class GalleryDLUI:
         self.no_download_var = tk.BooleanVar()
         no_download_check = ctk.CTkCheckBox(check_frame, text="No download (data extraction only)", variable=self.no_download_var)
         no_download_check.grid(row=1, column=1, sticky=tk.W)
+        
+        self.use_archive_var = tk.BooleanVar(value=True)
+        use_archive_check = ctk.CTkCheckBox(check_frame, text="Use shared download archive", variable=self.use_archive_var)
+        use_archive_check.grid(row=2, column=0, sticky=tk.W)
+        
+        # Parallel jobs
+        parallel_frame = ctk.CTkFrame(download_tab)
+        parallel_frame.grid(row=3, column=0, sticky="ew", padx=20, pady=15)
+        parallel_frame.grid_columnconfigure((1, 3), weight=1)
+        
+        max_jobs_label = ctk.CTkLabel(parallel_frame, text="Parallel jobs:", font=ctk.CTkFont(size=14))
+        max_jobs_label.grid(row=0, column=0, sticky="w", padx=20, pady=5)
+        
+        self.max_jobs_var = tk.StringVar(value=str(DEFAULT_MAX_JOBS))
+        max_jobs_entry = ctk.CTkEntry(parallel_frame, textvariable=self.max_jobs_var, width=60)
+        max_jobs_entry.grid(row=0, column=1, sticky="w", padx=10, pady=5)
+        
+        host_jobs_label = ctk.CTkLabel(parallel_frame, text="Max jobs per host:", font=ctk.CTkFont(size=14))
+        host_jobs_label.grid(row=0, column=2, sticky="w", padx=20, pady=5)
+        
+        self.max_jobs_per_host_var = tk.StringVar(value=str(DEFAULT_MAX_JOBS_PER_HOST))
+        host_jobs_entry = ctk.CTkEntry(parallel_frame, textvariable=self.max_jobs_per_host_var, width=60)
+        host_jobs_entry.grid(row=0, column=3, sticky="w", padx=10, pady=5)
+        
+        # Engine
+        engine_label = ctk.CTkLabel(parallel_frame, text="Engine:", font=ctk.CTkFont(size=14))
+        engine_label.grid(row=1, column=0, sticky="w", padx=20, pady=5)
+        
+        engines = [ENGINE_SUBPROCESS, ENGINE_WARM_POOL]
+        if LibraryEngine.available():
+            engines.insert(1, ENGINE_LIBRARY)
+        self.engine_var = tk.StringVar(value=ENGINE_SUBPROCESS)
+        engine_combo = ctk.CTkComboBox(parallel_frame, variable=self.engine_var, values=engines, width=200)
+        engine_combo.grid(row=1, column=1, sticky="w", padx=10, pady=5)
+        
+        policy_label = ctk.CTkLabel(parallel_frame, text="Queue order:", font=ctk.CTkFont(size=14))
+        policy_label.grid(row=1, column=2, sticky="w", padx=20, pady=5)
+        
+        self.schedule_policy_var = tk.StringVar(value=SCHEDULE_MANUAL)
+        policy_combo = ctk.CTkComboBox(
+            parallel_frame, variable=self.schedule_policy_var, values=[SCHEDULE_MANUAL, SCHEDULE_SHORTEST, SCHEDULE_FAIR],
+            width=200, command=self.on_schedule_policy_change
+        )
+        policy_combo.grid(row=1, column=3, sticky="w", padx=10, pady=5)
+        
+        self.adaptive_var = tk.BooleanVar()
+        adaptive_check = ctk.CTkCheckBox(
+            parallel_frame,
+            text="Adaptive rate control (per-host jobs and sleep tuned from 429s and errors)",
+            variable=self.adaptive_var
+        )
+        adaptive_check.grid(row=2, column=0, columnspan=4, sticky="w", padx=20, pady=5)
+        
+        self.auto_retry_var = tk.BooleanVar(value=True)
+        auto_retry_check = ctk.CTkCheckBox(
+            parallel_frame,
+            text="Retry failed URLs automatically (backoff doubles per attempt, per host)",
+            variable=self.auto_retry_var,
+            command=self.schedule_retries
+        )
+        auto_retry_check.grid(row=3, column=0, columnspan=4, sticky="w", padx=20, pady=(5, 10))
     
     def create_auth_tab(self):
         self.tabview.add("Authentication")
@@ -527,8 +4722,13 @@ class GalleryDLUI:
         fb_help_label = ctk.CTkLabel(filter_builder_frame, textvariable=self.fb_help_var, text_color="gray", font=ctk.CTkFont(size=12))
         fb_help_label.grid(row=4, column=0, columnspan=2, sticky="w", padx=20, pady=(5, 15))
         
+        # Tag suggestions from the tags seen in downloaded metadata
+        self.tag_suggestion_frame = ctk.CTkFrame(filter_builder_frame, fg_color="transparent")
+        self.tag_suggestion_frame.grid(row=5, column=0, columnspan=2, sticky="w", padx=20, pady=(0, 10))
+        self.filter_builder_value_var.trace_add("write", self.update_tag_suggestions)
+        
         fb_add_button = ctk.CTkButton(filter_builder_frame, text="Add to Filter Expression", command=self.add_to_filter_expression)
-        fb_add_button.grid(row=5, column=0, columnspan=2, pady=(0, 20))
+        fb_add_button.grid(row=6, column=0, columnspan=2, pady=(0, 20))
         
         # Other selection options
         row_idx = 1
@@ -550,80 +4750,1163 @@ class GalleryDLUI:
         min_size_label = ctk.CTkLabel(size_frame, text="Min Size:", font=ctk.CTkFont(size=14))
         min_size_label.grid(row=0, column=0, padx=20, pady=15)
         
-        self.min_size_var = tk.StringVar()
-        min_size_entry = ctk.CTkEntry(size_frame, textvariable=self.min_size_var, placeholder_text="e.g., 100KB")
-        min_size_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=15)
+        self.min_size_var = tk.StringVar()
+        min_size_entry = ctk.CTkEntry(size_frame, textvariable=self.min_size_var, placeholder_text="e.g., 100KB")
+        min_size_entry.grid(row=0, column=1, sticky="ew", padx=10, pady=15)
+        
+        max_size_label = ctk.CTkLabel(size_frame, text="Max Size:", font=ctk.CTkFont(size=14))
+        max_size_label.grid(row=0, column=2, padx=20, pady=15)
+        
+        self.max_size_var = tk.StringVar()
+        max_size_entry = ctk.CTkEntry(size_frame, textvariable=self.max_size_var, placeholder_text="e.g., 10MB")
+        max_size_entry.grid(row=0, column=3, sticky="ew", padx=20, pady=15)
+        row_idx += 1
+        
+        # Range
+        range_label = ctk.CTkLabel(scrollable_frame, text="Index Range:", font=ctk.CTkFont(size=14))
+        range_label.grid(row=row_idx, column=0, sticky="w", padx=20, pady=15)
+        
+        self.range_var = tk.StringVar()
+        range_entry = ctk.CTkEntry(scrollable_frame, textvariable=self.range_var, placeholder_text="e.g., 1-10, 1:10:2")
+        range_entry.grid(row=row_idx, column=1, sticky="ew", padx=20, pady=15)
+        row_idx += 1
+        
+        # Final Filter Expression
+        filter_label = ctk.CTkLabel(scrollable_frame, text="Final Filter Expression:", font=ctk.CTkFont(size=14, weight="bold"))
+        filter_label.grid(row=row_idx, column=0, sticky="w", padx=20, pady=(30, 5))
+        
+        self.filter_var = tk.StringVar()
+        filter_entry = ctk.CTkEntry(scrollable_frame, textvariable=self.filter_var, placeholder_text="Complete filter expression...")
+        filter_entry.grid(row=row_idx, column=1, sticky="ew", padx=20, pady=(30, 15))
+        row_idx += 1
+        
+        filter_tools_frame = ctk.CTkFrame(scrollable_frame, fg_color="transparent")
+        filter_tools_frame.grid(row=row_idx, column=1, sticky="w", padx=20, pady=(0, 15))
+        
+        optimize_button = ctk.CTkButton(filter_tools_frame, text="Check & Optimize", command=self.optimize_filter_expression, width=140)
+        optimize_button.grid(row=0, column=0, padx=(0, 10))
+        
+        benchmark_button = ctk.CTkButton(filter_tools_frame, text="Benchmark...", command=self.benchmark_filter_expression, width=120)
+        benchmark_button.grid(row=0, column=1)
+        row_idx += 1
+        
+        # Metadata preview
+        preview_frame = ctk.CTkFrame(scrollable_frame)
+        preview_frame.grid(row=row_idx, column=0, columnspan=2, sticky="ew", padx=20, pady=15)
+        preview_frame.grid_columnconfigure(2, weight=1)
+        
+        preview_title = ctk.CTkLabel(preview_frame, text="Metadata Preview", font=ctk.CTkFont(size=16, weight="bold"))
+        preview_title.grid(row=0, column=0, columnspan=3, sticky="w", padx=20, pady=(15, 5))
+        
+        self.metadata_preview_var = tk.StringVar(value="Fetch metadata for the URLs on the Main tab to preview the selection")
+        preview_label = ctk.CTkLabel(preview_frame, textvariable=self.metadata_preview_var, text_color="gray")
+        preview_label.grid(row=1, column=0, columnspan=3, sticky="w", padx=20, pady=5)
+        
+        fetch_button = ctk.CTkButton(preview_frame, text="Fetch Metadata", command=self.fetch_metadata, width=140)
+        fetch_button.grid(row=2, column=0, padx=(20, 10), pady=(5, 15))
+        self.store_widgets.append(fetch_button)
+        
+        self.metadata_only_matching_var = tk.BooleanVar(value=True)
+        only_matching_check = ctk.CTkCheckBox(
+            preview_frame, text="Only request matching files when downloading", variable=self.metadata_only_matching_var
+        )
+        only_matching_check.grid(row=2, column=1, sticky="w", padx=10, pady=(5, 15))
+        
+        # The preview follows every change to the selection options
+        for var in (self.filter_var, self.range_var, self.min_size_var, self.max_size_var):
+            var.trace_add("write", self.schedule_metadata_preview)
+    
+    def optimize_filter_expression(self):
+        expression = self.filter_var.get().strip()
+        if not expression:
+            return
+        try:
+            plan = optimize_filter(expression)
+        except (SyntaxError, ValueError) as e:
+            messagebox.showerror("Invalid Filter", str(e))
+            return
+        self.filter_var.set(plan.expression)
+        self.log_to_console(f"Filter optimized: {'; '.join(plan.notes) or 'already optimal'}")
+    
+    def benchmark_filter_expression(self):
+        """Time the filter as typed against its optimized form, over cached metadata or a JSON corpus."""
+        expression = self.filter_var.get().strip()
+        if not expression:
+            return
+        corpus = []
+        for url in self.get_urls():
+            cached = self.cached_metadata(url)
+            if cached is not None:
+                corpus.extend(cached[0])
+        if not corpus:
+            path = filedialog.askopenfilename(
+                title="Select a metadata corpus",
+                filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            )
+            if not path:
+                return
+            try:
+                corpus = load_filter_corpus(path)
+            except (OSError, ValueError) as e:
+                messagebox.showerror("Benchmark", f"Cannot read {path}: {e}")
+                return
+        
+        def benchmark():
+            return benchmark_filter(expression, corpus)
+        
+        def finished(result):
+            self.log_to_console(f"Filter benchmark over {len(corpus):,} files: original {result.original * 1000:.1f} ms, "
+                                f"optimized {result.optimized * 1000:.1f} ms, {result.matches:,} match")
+            self.log_to_console(f"Optimized filter: {result.plan.expression}")
+            if result.mismatches:
+                self.log_to_console(f"Warning: {result.mismatches:,} file(s) evaluated differently after optimizing")
+        
+        self.run_tool("Benchmarking filter", benchmark, finished)
+    
+    def metadata_selection(self):
+        """Compile the selection options for match_files(); raises ValueError or SyntaxError if one is invalid."""
+        expression = self.filter_var.get().strip()
+        filter_func = compile_filter(optimize_filter(expression).expression) if expression else None
+        ranges = parse_range(self.range_var.get()) if self.range_var.get().strip() else None
+        sizes = []
+        for var in (self.min_size_var, self.max_size_var):
+            text = var.get().strip()
+            size = parse_byte_rate(text) if text else None
+            if text and size is None:
+                raise ValueError(f"invalid size '{text}'")
+            sizes.append(size)
+        return filter_func, ranges, sizes[0], sizes[1]
+    
+    def cached_metadata(self, url):
+        """Cached (files, queued) for url, or None; decoded entries are kept in a small LRU."""
+        key = normalize_url(url) or url
+        with self.metadata_loaded_lock:
+            if key in self.metadata_loaded:
+                self.metadata_loaded.move_to_end(key)
+                return self.metadata_loaded[key]
+        cached = self.metadata_cache.get(key)
+        with self.metadata_loaded_lock:
+            self.metadata_loaded[key] = cached
+            while len(self.metadata_loaded) > METADATA_MEMORY_URLS:
+                self.metadata_loaded.popitem(last=False)
+        return cached
+    
+    def forget_metadata(self, urls=None):
+        """Drop decoded cache entries, or only those of URLs no longer in urls."""
+        keep = {normalize_url(url) or url for url in urls or ()}
+        with self.metadata_loaded_lock:
+            for key in [key for key in self.metadata_loaded if key not in keep]:
+                del self.metadata_loaded[key]
+    
+    def schedule_metadata_preview(self, *args):
+        if self.metadata_preview_after is not None:
+            self.root.after_cancel(self.metadata_preview_after)
+        self.metadata_preview_after = self.root.after(METADATA_PREVIEW_DELAY_MS, self.update_metadata_preview)
+    
+    def update_metadata_preview(self):
+        """Match the cached metadata against the selection options on a worker thread."""
+        self.metadata_preview_after = None
+        if not self.stores_loaded:
+            return
+        # One scan at a time; changes made meanwhile start another scan once it is done
+        if self.metadata_preview_running:
+            self.metadata_preview_pending = True
+            return
+        try:
+            selection = self.metadata_selection()
+        except (ValueError, SyntaxError) as e:
+            self.metadata_preview_var.set(f"Invalid selection: {e}")
+            return
+        urls = self.get_urls()
+        self.metadata_preview_running = True
+        
+        def scan():
+            try:
+                summary = self.summarize_metadata(urls, selection)
+            except Exception as e:
+                summary = f"Preview failed: {e}"
+            self.root.after(0, lambda: scanned(summary))
+        
+        def scanned(summary):
+            self.metadata_preview_running = False
+            if self.metadata_preview_pending:
+                self.metadata_preview_pending = False
+                self.update_metadata_preview()
+            else:
+                self.metadata_preview_var.set(summary)
+        
+        threading.Thread(target=scan, daemon=True).start()
+    
+    def summarize_metadata(self, urls, selection):
+        """One-line summary of how many cached files of urls the selection matches."""
+        total = matched = unknown_size = errors = missing = unresolved = 0
+        for url in urls:
+            cached = self.cached_metadata(url)
+            if cached is None:
+                missing += 1
+                continue
+            files, queued = cached
+            unresolved += bool(queued)
+            match = match_files(files, *selection)
+            total += match.total
+            matched += match.matched
+            unknown_size += match.unknown_size
+            errors += match.errors
+        # Entries of URLs removed from the list are not needed any more
+        self.forget_metadata(urls)
+        
+        parts = [f"{matched:,} of {total:,} files match"]
+        if unknown_size:
+            parts.append(f"{unknown_size:,} without a known size")
+        if errors:
+            parts.append(f"filter failed on {errors:,}")
+        if unresolved:
+            parts.append(f"{unresolved:,} URL(s) link to other galleries")
+        if missing:
+            parts.append(f"{missing:,} URL(s) not fetched")
+        return ", ".join(parts)
+    
+    def fetch_metadata(self):
+        """Run a -j pass for every URL on the Main tab that has no fresh cache entry."""
+        if self.gallery_dl_path:
+            command = [self.gallery_dl_path]
+        elif LibraryEngine.available() and not getattr(sys, "frozen", False):
+            command = [sys.executable, "-m", "gallery_dl"]
+        else:
+            messagebox.showerror("Gallery-DL Not Found", "Gallery-DL executable not found. Please download it first.")
+            return
+        urls = [normalize_url(url) or url for url in self.get_urls()]
+        if not urls:
+            messagebox.showerror("No URLs", "Enter at least one URL on the Main tab.")
+            return
+        if not self.check_filter():
+            return
+        
+        # Selection options are applied locally, everything else (auth, cookies, ...) is kept
+        options = self.build_options()
+        for flag in METADATA_LOCAL_OPTIONS:
+            options = remove_option(options, flag)
+        workers = self.parse_int_setting(self.max_jobs_var, DEFAULT_MAX_JOBS)
+        
+        def fetch_one(url):
+            result = subprocess.run(
+                command + options + ["-j", url], capture_output=True, text=True, encoding="utf-8", errors="replace"
+            )
+            try:
+                messages = json.loads(result.stdout)
+            except ValueError:
+                stderr = result.stderr.strip().splitlines()
+                self.log_to_console(f"Metadata: {url}: {stderr[-1] if stderr else 'no JSON output'}")
+                return
+            errors = [message[1] for message in messages if message[0] == MESSAGE_ERROR]
+            if errors:
+                self.log_to_console(f"Metadata: {url}: {errors[0].get('message') or errors[0].get('error')}")
+                return
+            files, queued = self.metadata_cache.put(url, messages)
+            linked = f", {queued:,} linked URL(s) not followed" if queued else ""
+            self.log_to_console(f"Metadata: {url}: {files:,} files{linked}")
+        
+        def fetch():
+            missing = [url for url in dict.fromkeys(urls) if self.metadata_cache.get(url) is None]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(fetch_one, missing))
+            return len(missing)
+        
+        def fetched(count):
+            self.log_to_console(f"Metadata: fetched {count:,} URL(s), {len(urls) - count:,} already cached")
+            self.forget_metadata()
+            self.update_metadata_preview()
+        
+        self.run_tool("Fetching metadata", fetch, fetched)
+    
+    def metadata_job_options(self, url, options, selection):
+        """Options for url that request only the files matching its cached metadata; None if nothing matches."""
+        cached = self.cached_metadata(url)
+        # Files from linked galleries run in child extractors, which a single --range cannot address
+        if cached is None or cached[1]:
+            return options
+        match = match_files(cached[0], *selection)
+        if match.errors:
+            return options
+        if not match.matched:
+            return None
+        if match.matched == match.filtered:
+            return options
+        spec = format_range(match.positions)
+        if len(spec) > METADATA_RANGE_MAX_CHARS:
+            return options
+        return set_option(options, "--range", spec)
+
+    def create_postprocessing_tab(self):
+        self.tabview.add("Post-processing")
+        pp_tab = self.tabview.tab("Post-processing")
+        pp_tab.grid_columnconfigure(0, weight=1)
+        
+        # Post-processor options
+        pp_options_frame = ctk.CTkFrame(pp_tab)
+        pp_options_frame.grid(row=0, column=0, sticky="nsew", padx=20, pady=15)
+        
+        # Various post-processing checkboxes
+        self.write_metadata_var = tk.BooleanVar()
+        write_metadata_check = ctk.CTkCheckBox(pp_options_frame, text="Write metadata to JSON files", variable=self.write_metadata_var)
+        write_metadata_check.grid(row=0, column=0, sticky=tk.W)
+        
+        self.write_tags_var = tk.BooleanVar()
+        write_tags_check = ctk.CTkCheckBox(pp_options_frame, text="Write image tags to text files", variable=self.write_tags_var)
+        write_tags_check.grid(row=1, column=0, sticky=tk.W)
+        
+        self.zip_var = tk.BooleanVar()
+        zip_check = ctk.CTkCheckBox(pp_options_frame, text="Store in ZIP archive", variable=self.zip_var)
+        zip_check.grid(row=0, column=1, sticky=tk.W)
+        
+        self.cbz_var = tk.BooleanVar()
+        cbz_check = ctk.CTkCheckBox(pp_options_frame, text="Store in CBZ archive", variable=self.cbz_var)
+        cbz_check.grid(row=1, column=1, sticky=tk.W)
+        
+        # Execute command
+        exec_frame = ctk.CTkFrame(pp_tab)
+        exec_frame.grid(row=1, column=0, sticky="ew", padx=20, pady=15)
+        exec_frame.grid_columnconfigure(1, weight=1)
+        
+        exec_label = ctk.CTkLabel(exec_frame, text="Execute command for each file:", font=ctk.CTkFont(size=14))
+        exec_label.grid(row=0, column=0, padx=20, pady=5)
+        
+        self.exec_var = tk.StringVar()
+        exec_entry = ctk.CTkEntry(exec_frame, textvariable=self.exec_var, placeholder_text="Command to execute...")
+        exec_entry.grid(row=0, column=1, sticky="ew", pady=5)
+        
+        # Execute after command
+        exec_after_label = ctk.CTkLabel(exec_frame, text="Execute command after all downloads:", font=ctk.CTkFont(size=14))
+        exec_after_label.grid(row=1, column=0, padx=20, pady=(5, 0))
+        
+        self.exec_after_var = tk.StringVar()
+        exec_after_entry = ctk.CTkEntry(exec_frame, textvariable=self.exec_after_var, placeholder_text="Command to execute...")
+        exec_after_entry.grid(row=1, column=1, sticky="ew", pady=5)
+        
+        exec_mode_label = ctk.CTkLabel(exec_frame, text="Run per-file command:", font=ctk.CTkFont(size=14))
+        exec_mode_label.grid(row=2, column=0, padx=20, pady=(5, 10))
+        
+        self.exec_mode_var = tk.StringVar(value=EXEC_BATCHED)
+        exec_mode_combo = ctk.CTkComboBox(
+            exec_frame, variable=self.exec_mode_var, values=[EXEC_BATCHED, EXEC_STDIN, EXEC_PER_FILE], width=260
+        )
+        exec_mode_combo.grid(row=2, column=1, sticky="w", pady=(5, 10))
+        
+        exec_help = ctk.CTkLabel(
+            exec_frame,
+            text="Batched: without {} the command gets many files at once; with {} it runs once per file, in parallel.\n"
+                 "Persistent helper: one process per worker reads file paths from stdin, one per line.",
+            text_color="gray", justify="left"
+        )
+        exec_help.grid(row=3, column=0, columnspan=2, sticky="w", padx=20, pady=(0, 10))
+        
+        # Integrity checks
+        verify_frame = ctk.CTkFrame(pp_tab)
+        verify_frame.grid(row=2, column=0, sticky="ew", padx=20, pady=15)
+        
+        self.verify_var = tk.BooleanVar()
+        verify_check = ctk.CTkCheckBox(
+            verify_frame, text="Verify downloaded files (size, JPEG/PNG/MP4 structure)", variable=self.verify_var
+        )
+        verify_check.grid(row=0, column=0, sticky=tk.W, padx=20, pady=(10, 5))
+        
+        self.verify_decode_var = tk.BooleanVar()
+        verify_decode_check = ctk.CTkCheckBox(
+            verify_frame, text="Fully decode files (Pillow for images, ffmpeg for videos; slower)", variable=self.verify_decode_var
+        )
+        verify_decode_check.grid(row=1, column=0, sticky=tk.W, padx=20, pady=5)
+        
+        self.verify_retry_var = tk.BooleanVar(value=True)
+        verify_retry_check = ctk.CTkCheckBox(
+            verify_frame, text="Delete corrupt files and download them again", variable=self.verify_retry_var
+        )
+        verify_retry_check.grid(row=2, column=0, sticky=tk.W, padx=20, pady=(5, 10))
+    
+    def create_tools_tab(self):
+        self.tabview.add("Tools")
+        tools_tab = self.tabview.tab("Tools")
+        tools_tab.grid_columnconfigure(0, weight=1)
+        
+        self.tools_frame = ctk.CTkScrollableFrame(tools_tab)
+        self.tools_frame.grid(row=0, column=0, sticky="nsew", padx=20, pady=20)
+        self.tools_frame.grid_columnconfigure(0, weight=1)
+        
+        # Download archive
+        archive_frame = ctk.CTkFrame(self.tools_frame)
+        archive_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=10)
+        archive_frame.grid_columnconfigure(3, weight=1)
+        
+        archive_title = ctk.CTkLabel(archive_frame, text="Download Archive", font=ctk.CTkFont(size=16, weight="bold"))
+        archive_title.grid(row=0, column=0, columnspan=4, sticky="w", padx=20, pady=(15, 5))
+        
+        self.archive_status_var = tk.StringVar(value="Opening...")
+        archive_status = ctk.CTkLabel(archive_frame, textvariable=self.archive_status_var, text_color="gray")
+        archive_status.grid(row=1, column=0, columnspan=4, sticky="w", padx=20, pady=5)
+        
+        compact_button = ctk.CTkButton(archive_frame, text="Compact", command=self.compact_archive, width=120)
+        compact_button.grid(row=2, column=0, padx=(20, 10), pady=(5, 15))
+        
+        merge_button = ctk.CTkButton(archive_frame, text="Merge / Import...", command=self.merge_archives, width=140)
+        merge_button.grid(row=2, column=1, padx=10, pady=(5, 15))
+        
+        refresh_button = ctk.CTkButton(archive_frame, text="Refresh", command=self.refresh_archive_status, width=100)
+        refresh_button.grid(row=2, column=2, padx=10, pady=(5, 15))
+        self.store_widgets += [compact_button, merge_button, refresh_button]
+        
+        # Duplicate files
+        dedup_frame = ctk.CTkFrame(self.tools_frame)
+        dedup_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=10)
+        dedup_frame.grid_columnconfigure(3, weight=1)
+        
+        dedup_title = ctk.CTkLabel(dedup_frame, text="Duplicate Files", font=ctk.CTkFont(size=16, weight="bold"))
+        dedup_title.grid(row=0, column=0, columnspan=4, sticky="w", padx=20, pady=(15, 5))
+        
+        dedup_help = ctk.CTkLabel(
+            dedup_frame,
+            text="Finds files with identical content in the destination directory; the oldest copy is kept.",
+            text_color="gray"
+        )
+        dedup_help.grid(row=1, column=0, columnspan=4, sticky="w", padx=20, pady=5)
+        
+        self.dedup_mode_var = tk.StringVar(value=DEDUP_REPORT)
+        dedup_mode_combo = ctk.CTkComboBox(
+            dedup_frame, variable=self.dedup_mode_var, values=[DEDUP_REPORT, DEDUP_HARDLINK, DEDUP_DELETE], width=180
+        )
+        dedup_mode_combo.grid(row=2, column=0, padx=(20, 10), pady=(5, 15))
+        
+        dedup_button = ctk.CTkButton(dedup_frame, text="Find Duplicates", command=self.run_dedup, width=140)
+        dedup_button.grid(row=2, column=1, padx=10, pady=(5, 15))
+        self.store_widgets.append(dedup_button)
+        
+        self.dedup_after_run_var = tk.BooleanVar()
+        dedup_after_check = ctk.CTkCheckBox(dedup_frame, text="Run after downloads finish", variable=self.dedup_after_run_var)
+        dedup_after_check.grid(row=2, column=2, sticky="w", padx=10, pady=(5, 15))
+        
+        # Destination index
+        index_frame = ctk.CTkFrame(self.tools_frame)
+        index_frame.grid(row=2, column=0, sticky="ew", padx=10, pady=10)
+        index_frame.grid_columnconfigure(3, weight=1)
+        
+        index_title = ctk.CTkLabel(index_frame, text="Destination Index", font=ctk.CTkFont(size=16, weight="bold"))
+        index_title.grid(row=0, column=0, columnspan=4, sticky="w", padx=20, pady=(15, 5))
+        
+        self.dest_index_status_var = tk.StringVar(value="Opening...")
+        index_status = ctk.CTkLabel(index_frame, textvariable=self.dest_index_status_var, text_color="gray")
+        index_status.grid(row=1, column=0, columnspan=4, sticky="w", padx=20, pady=5)
+        
+        rescan_button = ctk.CTkButton(index_frame, text="Rescan", command=lambda: self.refresh_dest_index(full=True), width=120)
+        rescan_button.grid(row=2, column=0, padx=(20, 10), pady=(5, 15))
+        self.store_widgets.append(rescan_button)
+        
+        self.dest_index_skip_var = tk.BooleanVar(value=True)
+        index_skip_check = ctk.CTkCheckBox(
+            index_frame,
+            text="Skip indexed files without checking the disk (in-process and warm worker engines)",
+            variable=self.dest_index_skip_var
+        )
+        index_skip_check.grid(row=2, column=1, columnspan=2, sticky="w", padx=10, pady=(5, 15))
+    
+    def refresh_dest_index_status(self):
+        directories, files = self.dest_index.counts()
+        self.dest_index_status_var.set(f"{self.dest_index.path} - {files:,} files in {directories:,} directories")
+    
+    def refresh_dest_index(self, done=None, full=False):
+        """Update the destination index in the background, then call done()."""
+        root_dir = self.dest_var.get()
+        if not root_dir:
+            if done is None:
+                messagebox.showerror("No Destination", "Select a download directory first.")
+            else:
+                done()
+            return
+        
+        def refresh():
+            # Jobs waiting on the refresh still have to start if it fails
+            try:
+                return self.dest_index.refresh(root_dir, full)
+            except (OSError, sqlite3.Error) as e:
+                self.log_to_console(f"Destination index refresh failed: {e}")
+                return None
+        
+        def refreshed(result):
+            if result is not None:
+                directories, listed, files = result
+                self.log_to_console(f"Destination index: {directories:,} directories, {listed:,} re-listed ({files:,} files)")
+                self.refresh_dest_index_status()
+            if done is not None:
+                done()
+        
+        self.run_tool("Refreshing destination index", refresh, refreshed)
+    
+    def run_dedup(self):
+        root_dir = self.dest_var.get() or filedialog.askdirectory()
+        if not root_dir:
+            return
+        mode = self.dedup_mode_var.get()
+        if mode == DEDUP_DELETE and not messagebox.askyesno(
+            "Delete Duplicates", f"Delete every duplicate copy below\n{root_dir}?\n\nThe oldest copy of each file is kept."
+        ):
+            return
+        
+        def dedup():
+            deduplicator = Deduplicator(self.hash_index, log=self.log_to_console)
+            groups = deduplicator.find_duplicates(root_dir)
+            extra = sum(len(group) - 1 for group in groups)
+            wasted = sum(group[0].size * (len(group) - 1) for group in groups)
+            self.log_to_console(f"Dedup: {extra:,} duplicate files in {len(groups):,} groups, {wasted / 1e6:,.1f} MB")
+            if mode != DEDUP_REPORT:
+                files, reclaimed = deduplicator.resolve(groups, mode)
+                action = "Hardlinked" if mode == DEDUP_HARDLINK else "Deleted"
+                self.log_to_console(f"Dedup: {action} {files:,} files, {reclaimed / 1e6:,.1f} MB reclaimed")
+        
+        self.run_tool("Finding duplicate files", dedup)
+    
+    def on_all_jobs_finished(self):
+        """Post-run stages, started once the scheduler has nothing left to do."""
+        if all(stage.queue is None for stage in (self.verifier, self.postprocess, self.archiver)):
+            self.finish_run()
+            return
+        
+        def finish_stages():
+            # Verified files flow into the other stages, and commands may still be
+            # reading files the archiver is about to delete
+            return self.verifier.finish(), self.postprocess.finish(), self.archiver.finish()
+        
+        def on_finished(result):
+            self.report_verification(result[0])
+            self.report_postprocess(result[1])
+            self.report_archiving(result[2])
+            # Re-downloads start once everything else is done with the files
+            if self.retry_corrupt_files():
+                return
+            self.finish_run()
+        
+        self.run_tool("Finishing post-processing", finish_stages, on_finished)
+    
+    def finish_run(self):
+        self.run_exec_after()
+        self.run_dedup_after_run()
+    
+    def run_exec_after(self):
+        """Run the "after all downloads" command once for the whole run, not once per job."""
+        command = self.exec_after_var.get().strip()
+        if not command:
+            return
+        directory = self.dest_var.get() or None
         
-        max_size_label = ctk.CTkLabel(size_frame, text="Max Size:", font=ctk.CTkFont(size=14))
-        max_size_label.grid(row=0, column=2, padx=20, pady=15)
+        def exec_after():
+            result = subprocess.run(command, shell=True, cwd=directory, stdout=subprocess.PIPE,
+                                    stderr=subprocess.STDOUT, text=True, errors="replace")
+            for line in result.stdout.splitlines():
+                self.log_to_console(f"[exec-after] {line}")
+            if result.returncode:
+                self.log_to_console(f"[exec-after] Command exited with code {result.returncode}")
         
-        self.max_size_var = tk.StringVar()
-        max_size_entry = ctk.CTkEntry(size_frame, textvariable=self.max_size_var, placeholder_text="e.g., 10MB")
-        max_size_entry.grid(row=0, column=3, sticky="ew", padx=20, pady=15)
-        row_idx += 1
+        self.run_tool("Running command after all downloads", exec_after)
+    
+    def run_dedup_after_run(self):
+        if self.dedup_after_run_var.get() and self.dest_var.get():
+            self.run_dedup()
+    
+    def report_postprocess(self, stats):
+        if not stats or not stats.get("files"):
+            return
+        files = stats["files"]
+        self.log_to_console(
+            f"Post-processing: {files:,} files in {stats['batches']:,} batches on {stats['workers']} workers, "
+            f"command time {stats['command']:.1f}s, average queue wait {stats['wait'] / files:.2f}s, "
+            f"downloads held back {stats['backpressure']:.1f}s (queue peak {stats['max_depth']:,}), "
+            f"{stats['failures']:,} failures"
+        )
+    
+    def report_verification(self, stats):
+        if not stats:
+            return
+        self.log_to_console(
+            f"Verification: {stats['checked']:,} files checked ({stats['with_size']:,} against Content-Length), "
+            f"{stats['cached']:,} already verified, {stats['corrupt']:,} corrupt"
+        )
+    
+    def retry_corrupt_files(self):
+        """Delete corrupt files and queue a job per file to download it again; returns True if any job started."""
+        corrupt = self.verifier.take_corrupt()
+        if not corrupt or not self.verify_retry_var.get():
+            return False
+        targeted = {}
+        rerun = {}
+        for job, event, problem in corrupt:
+            self.verify_attempts[event.path] += 1
+            if self.verify_attempts[event.path] > VERIFY_MAX_ATTEMPTS:
+                self.log_to_console(f"Verification: giving up on {event.path} after {VERIFY_MAX_ATTEMPTS} re-downloads")
+                continue
+            try:
+                os.remove(event.path)
+            except OSError as e:
+                self.log_to_console(f"Verification: cannot delete {event.path}: {e}")
+                continue
+            if event.url and gdl_extractor.find(event.url) is not None:
+                targeted[event.path] = (event.url, job)
+            else:
+                # Without the file's URL the whole job runs again; everything else in it is skipped
+                rerun[job.id] = job
+        
+        jobs = [self.create_job([url], retry_job_options(job.options, path), job.engine) for path, (url, job) in targeted.items()]
+        jobs.extend(self.create_job(job.urls, job.options, job.engine) for job in rerun.values())
+        if not jobs:
+            return False
+        self.log_to_console(
+            f"Verification: downloading {len(targeted):,} corrupt file(s) again"
+            + (f", re-running {len(rerun):,} job(s) for files without a known URL" if rerun else "")
+        )
+        self.start_jobs(jobs, jobs[0].engine)
+        return True
+    
+    def report_archiving(self, stats):
+        if not stats or not stats.get("files"):
+            return
+        ratio = stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 1.0
+        self.log_to_console(
+            f"Archiving: {stats['files']:,} files into {stats['archives']:,} archives on {stats['workers']} workers "
+            f"in {stats['seconds']:.1f}s, {stats['stored']:,} stored, {stats['deflated']:,} deflated, "
+            f"{stats['bytes_in'] / 1e6:,.1f} MB -> {stats['bytes_out'] / 1e6:,.1f} MB ({ratio:.0%}), "
+            f"downloads held back {stats['backpressure']:.1f}s, {stats['duplicates']:,} already archived, "
+            f"{stats['failures']:,} failures"
+        )
+    
+    def refresh_archive_status(self):
+        entries, urls = self.archive.counts()
+        self.archive_status_var.set(f"{self.archive.path} - {entries:,} files, {urls:,} completed posts")
+    
+    def run_tool(self, name, work, done=None):
+        """Run a maintenance task off the UI thread and log how it went."""
+        def tool_worker():
+            started = time.monotonic()
+            try:
+                result = work()
+            except Exception as e:
+                self.log_to_console(f"{name} failed: {e}")
+                return
+            self.log_to_console(f"{name} finished in {time.monotonic() - started:.1f}s")
+            if done is not None:
+                self.root.after(0, lambda: done(result))
+        self.log_to_console(f"{name}...")
+        threading.Thread(target=tool_worker, daemon=True).start()
+    
+    def compact_archive(self):
+        self.run_tool("Compacting download archive", self.archive.compact, lambda result: self.refresh_archive_status())
+    
+    def merge_archives(self):
+        paths = filedialog.askopenfilenames(
+            title="Select archives to merge",
+            filetypes=[("SQLite archives", "*.sqlite3 *.sqlite *.db"), ("All files", "*.*")]
+        )
+        if not paths:
+            return
         
-        # Range
-        range_label = ctk.CTkLabel(scrollable_frame, text="Index Range:", font=ctk.CTkFont(size=14))
-        range_label.grid(row=row_idx, column=0, sticky="w", padx=20, pady=15)
+        def merge_all():
+            for path in paths:
+                files, urls = self.archive.merge(path)
+                self.log_to_console(f"Merged {path}: {files:,} new files, {urls:,} new completed posts")
         
-        self.range_var = tk.StringVar()
-        range_entry = ctk.CTkEntry(scrollable_frame, textvariable=self.range_var, placeholder_text="e.g., 1-10, 1:10:2")
-        range_entry.grid(row=row_idx, column=1, sticky="ew", padx=20, pady=15)
-        row_idx += 1
+        self.run_tool("Merging archives", merge_all, lambda result: self.refresh_archive_status())
+    
+    def create_search_tab(self):
+        self.tabview.add("Search")
+        search_tab = self.tabview.tab("Search")
+        search_tab.grid_columnconfigure(0, weight=1)
+        search_tab.grid_rowconfigure(1, weight=1)
+        
+        # Search criteria
+        criteria_frame = ctk.CTkFrame(search_tab)
+        criteria_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=20, pady=(20, 0))
+        criteria_frame.grid_columnconfigure((1, 3), weight=1)
+        
+        self.search_vars = {}
+        fields = (
+            ("tags", "Tags:", "tag1, tag2, -excluded"), ("artist", "Artist:", "Artist or uploader"),
+            ("text", "Text:", "Words in title or description"), ("extension", "Extension:", "e.g., jpg"),
+            ("after", "Date from:", "YYYY-MM-DD"), ("before", "Date before:", "YYYY-MM-DD")
+        )
+        for index, (key, label_text, placeholder) in enumerate(fields):
+            row, column = divmod(index, 2)
+            label = ctk.CTkLabel(criteria_frame, text=label_text, font=ctk.CTkFont(size=14))
+            label.grid(row=row, column=column * 2, sticky="w", padx=(20, 10), pady=5)
+            self.search_vars[key] = tk.StringVar()
+            entry = ctk.CTkEntry(criteria_frame, textvariable=self.search_vars[key], placeholder_text=placeholder)
+            entry.grid(row=row, column=column * 2 + 1, sticky="ew", padx=(0, 20), pady=5)
+            entry.bind("<Return>", lambda event: self.run_search())
+        
+        search_buttons = ctk.CTkFrame(criteria_frame, fg_color="transparent")
+        search_buttons.grid(row=3, column=0, columnspan=4, sticky="ew", padx=20, pady=10)
+        search_buttons.grid_columnconfigure(2, weight=1)
+        
+        search_button = ctk.CTkButton(search_buttons, text="Search", command=self.run_search, width=120)
+        search_button.grid(row=0, column=0, padx=(0, 10))
+        
+        update_button = ctk.CTkButton(search_buttons, text="Update Index", command=self.update_search_index, width=120)
+        update_button.grid(row=0, column=1, padx=(0, 10))
+        self.store_widgets += [search_button, update_button]
+        
+        self.search_status_var = tk.StringVar(value="Index the destination's metadata sidecars with Update Index")
+        search_status = ctk.CTkLabel(search_buttons, textvariable=self.search_status_var, text_color="gray")
+        search_status.grid(row=0, column=2, sticky="w", padx=10)
+        
+        # Results
+        columns = ("path", "date", "extension", "size", "artist")
+        headings = ("File", "Date", "Ext", "Size (MB)", "Artist")
+        widths = (420, 140, 50, 80, 140)
+        self.search_table = ttk.Treeview(search_tab, columns=columns, show="headings", height=12)
+        for column, heading, width in zip(columns, headings, widths):
+            self.search_table.heading(column, text=heading)
+            self.search_table.column(column, width=width, stretch=(column == "path"))
+        self.search_table.grid(row=1, column=0, sticky="nsew", padx=(20, 0), pady=20)
+        self.search_table.bind("<Double-1>", self.open_search_result)
+        
+        search_scrollbar = ttk.Scrollbar(search_tab, orient=tk.VERTICAL, command=self.search_table.yview)
+        search_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 20), pady=20)
+        self.search_table.configure(yscrollcommand=search_scrollbar.set)
+    
+    def update_search_index(self):
+        root_dir = self.dest_var.get()
+        if not root_dir:
+            messagebox.showerror("No Destination", "Select a download directory first.")
+            return
         
-        # Final Filter Expression
-        filter_label = ctk.CTkLabel(scrollable_frame, text="Final Filter Expression:", font=ctk.CTkFont(size=14, weight="bold"))
-        filter_label.grid(row=row_idx, column=0, sticky="w", padx=20, pady=(30, 5))
+        def update():
+            result = self.search_index.update(root_dir, self.dest_index, log=self.log_to_console)
+            tags = self.tag_index.write(self.search_index.tag_rows())
+            return result + (tags,)
         
-        self.filter_var = tk.StringVar()
-        filter_entry = ctk.CTkEntry(scrollable_frame, textvariable=self.filter_var, placeholder_text="Complete filter expression...")
-        filter_entry.grid(row=row_idx, column=1, sticky="ew", padx=20, pady=(30, 15))
-
-    def create_postprocessing_tab(self):
-        self.tabview.add("Post-processing")
-        pp_tab = self.tabview.tab("Post-processing")
-        pp_tab.grid_columnconfigure(0, weight=1)
+        def updated(result):
+            indexed, removed, tags = result
+            self.log_to_console(f"Search index: {indexed:,} sidecars indexed, {removed:,} removed, {tags:,} distinct tags")
+            self.search_status_var.set(f"{self.search_index.count():,} files indexed")
+            self.refresh_dest_index_status()
         
-        # Post-processor options
-        pp_options_frame = ctk.CTkFrame(pp_tab)
-        pp_options_frame.grid(row=0, column=0, sticky="nsew", padx=20, pady=15)
+        self.run_tool("Updating search index", update, updated)
+    
+    def run_search(self):
+        values = {key: var.get().strip() for key, var in self.search_vars.items()}
+        tags = values.pop("tags")
+        values["tags"] = split_tags(tags.replace(",", ", ")) if "," in tags else split_tags(tags)
+        started = time.perf_counter()
+        try:
+            results = self.search_index.search(**values)
+        except sqlite3.Error as e:
+            self.search_status_var.set(f"Search failed: {e}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        
+        self.search_table.delete(*self.search_table.get_children())
+        for result in results:
+            size = f"{result.size / 1e6:.2f}" if result.size is not None else ""
+            self.search_table.insert("", tk.END, values=(result.path, result.date or "", result.extension or "", size, result.artist or ""))
+        limited = " (limit reached)" if len(results) >= SEARCH_RESULT_LIMIT else ""
+        self.search_status_var.set(f"{len(results):,} result(s){limited} in {elapsed:.1f} ms")
+    
+    def open_search_result(self, event=None):
+        selection = self.search_table.selection()
+        if not selection:
+            return
+        path = self.search_table.item(selection[0], "values")[0]
+        # Show the file in its folder; the file itself may be an archive member or gone
+        folder = os.path.dirname(path)
+        try:
+            open_with_system(folder)
+        except OSError as e:
+            self.log_to_console(f"Cannot open {folder}: {e}")
+    
+    def create_gallery_tab(self):
+        self.tabview.add("Gallery")
+        gallery_tab = self.tabview.tab("Gallery")
+        gallery_tab.grid_columnconfigure(0, weight=1)
+        gallery_tab.grid_rowconfigure(1, weight=1)
+        
+        # Folder selection
+        gallery_frame = ctk.CTkFrame(gallery_tab)
+        gallery_frame.grid(row=0, column=0, sticky="ew", padx=20, pady=(20, 0))
+        gallery_frame.grid_columnconfigure(1, weight=1)
+        
+        folder_label = ctk.CTkLabel(gallery_frame, text="Folder:", font=ctk.CTkFont(size=14))
+        folder_label.grid(row=0, column=0, padx=20, pady=10)
+        
+        self.gallery_dir_var = tk.StringVar()
+        folder_entry = ctk.CTkEntry(gallery_frame, textvariable=self.gallery_dir_var, placeholder_text="Download directory")
+        folder_entry.grid(row=0, column=1, sticky="ew", pady=10)
+        folder_entry.bind("<Return>", lambda event: self.load_gallery())
+        
+        browse_button = ctk.CTkButton(gallery_frame, text="Browse", command=self.browse_gallery_folder, width=80)
+        browse_button.grid(row=0, column=2, padx=(10, 0), pady=10)
+        
+        self.gallery_sort_var = tk.StringVar(value=GALLERY_NEWEST)
+        sort_combo = ctk.CTkComboBox(
+            gallery_frame, variable=self.gallery_sort_var, values=[GALLERY_NEWEST, GALLERY_NAME],
+            width=140, command=lambda choice: self.load_gallery()
+        )
+        sort_combo.grid(row=0, column=3, padx=(10, 0), pady=10)
         
-        # Various post-processing checkboxes
-        self.write_metadata_var = tk.BooleanVar()
-        write_metadata_check = ctk.CTkCheckBox(pp_options_frame, text="Write metadata to JSON files", variable=self.write_metadata_var)
-        write_metadata_check.grid(row=0, column=0, sticky=tk.W)
+        load_button = ctk.CTkButton(gallery_frame, text="Load", command=self.load_gallery, width=80)
+        load_button.grid(row=0, column=4, padx=(10, 20), pady=10)
         
-        self.write_tags_var = tk.BooleanVar()
-        write_tags_check = ctk.CTkCheckBox(pp_options_frame, text="Write image tags to text files", variable=self.write_tags_var)
-        write_tags_check.grid(row=1, column=0, sticky=tk.W)
+        status = "Load a folder to see its images" if Image is not None else "Install Pillow (pip install pillow) to see thumbnails"
+        self.gallery_status_var = tk.StringVar(value=status)
+        status_label = ctk.CTkLabel(gallery_frame, textvariable=self.gallery_status_var, text_color="gray")
+        status_label.grid(row=1, column=0, columnspan=5, sticky="w", padx=20, pady=(0, 10))
         
-        self.zip_var = tk.BooleanVar()
-        zip_check = ctk.CTkCheckBox(pp_options_frame, text="Store in ZIP archive", variable=self.zip_var)
-        zip_check.grid(row=0, column=1, sticky=tk.W)
+        # Thumbnails
+        self.gallery = ThumbnailGrid(gallery_tab, ThumbnailStore(get_data_dir("thumbnails")), on_open=self.open_gallery_file)
+        self.gallery.grid(row=1, column=0, sticky="nsew", padx=20, pady=20)
+    
+    def browse_gallery_folder(self):
+        directory = filedialog.askdirectory()
+        if directory:
+            self.gallery_dir_var.set(directory)
+            self.load_gallery()
+    
+    def load_gallery(self):
+        root_dir = self.gallery_dir_var.get() or self.dest_var.get()
+        if not root_dir:
+            messagebox.showerror("No Folder", "Select a folder or a download directory first.")
+            return
+        newest = self.gallery_sort_var.get() == GALLERY_NEWEST
+        # Only the download directory is kept in the destination index that jobs skip files with
+        dest_dir = self.dest_var.get()
+        indexed = self.stores_loaded and bool(dest_dir) and is_within(root_dir, dest_dir)
+        
+        def list_images():
+            images = []
+            if indexed:
+                # The destination index makes listing a large tree again cost a stat per directory
+                self.dest_index.refresh(root_dir)
+                for directory, names in self.dest_index.directories(root_dir):
+                    for name, (size, mtime_ns) in names.items():
+                        if os.path.splitext(name)[1].lower() in GALLERY_EXTENSIONS:
+                            images.append((-mtime_ns if newest else 0, os.path.join(directory, name)))
+            else:
+                for entry in iter_files(root_dir):
+                    if os.path.splitext(entry.path)[1].lower() in GALLERY_EXTENSIONS:
+                        images.append((-entry.key[3] if newest else 0, entry.path))
+            images.sort()
+            return [path for _, path in images]
         
-        self.cbz_var = tk.BooleanVar()
-        cbz_check = ctk.CTkCheckBox(pp_options_frame, text="Store in CBZ archive", variable=self.cbz_var)
-        cbz_check.grid(row=1, column=1, sticky=tk.W)
+        def listed(paths):
+            self.gallery.set_paths(paths)
+            self.gallery_status_var.set(f"{len(paths):,} images in {root_dir}")
         
-        # Execute command
-        exec_frame = ctk.CTkFrame(pp_tab)
-        exec_frame.grid(row=1, column=0, sticky="ew", padx=20, pady=15)
-        exec_frame.grid_columnconfigure(1, weight=1)
+        self.run_tool("Listing gallery", list_images, listed)
+    
+    def open_gallery_file(self, path):
+        try:
+            open_with_system(path)
+        except OSError as e:
+            self.log_to_console(f"Cannot open {path}: {e}")
+    
+    def create_jobs_tab(self):
+        self.tabview.add("Jobs")
+        jobs_tab = self.tabview.tab("Jobs")
+        jobs_tab.grid_columnconfigure(0, weight=1)
+        jobs_tab.grid_rowconfigure(1, weight=1)
+        
+        # Throughput dashboard for all jobs together
+        dashboard_frame = ctk.CTkFrame(jobs_tab)
+        dashboard_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=20, pady=(20, 0))
+        
+        self.dashboard_vars = {}
+        for index, (key, title) in enumerate((
+            ("files_per_second", "Files/s"), ("mb_per_second", "MB/s"), ("skip_ratio", "Skipped"),
+            ("eta", "ETA"), ("active", "Running"), ("queued", "Queued")
+        )):
+            dashboard_frame.grid_columnconfigure(index, weight=1)
+            title_label = ctk.CTkLabel(dashboard_frame, text=title, text_color="gray", font=ctk.CTkFont(size=12))
+            title_label.grid(row=0, column=index, padx=10, pady=(10, 0))
+            self.dashboard_vars[key] = tk.StringVar(value="-")
+            value_label = ctk.CTkLabel(dashboard_frame, textvariable=self.dashboard_vars[key], font=ctk.CTkFont(size=18, weight="bold"))
+            value_label.grid(row=1, column=index, padx=10, pady=(0, 10))
+        
+        # ttk.Treeview handles thousands of rows; CustomTkinter has no table widget
+        columns = ("id", "host", "url", "status", "files", "skipped", "errors", "rate", "eta", "elapsed", "result")
+        headings = ("#", "Host", "URL", "Status", "Files", "Skipped", "Errors", "MB/s", "ETA", "Elapsed", "Exit Code")
+        widths = (40, 120, 300, 80, 60, 70, 60, 60, 60, 70, 70)
+        
+        self.job_table = ttk.Treeview(jobs_tab, columns=columns, show="headings", height=12)
+        for column, heading, width in zip(columns, headings, widths):
+            self.job_table.heading(column, text=heading)
+            self.job_table.column(column, width=width, stretch=(column == "url"))
+        self.job_table.grid(row=1, column=0, sticky="nsew", padx=(20, 0), pady=20)
+        
+        job_scrollbar = ttk.Scrollbar(jobs_tab, orient=tk.VERTICAL, command=self.job_table.yview)
+        job_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 20), pady=20)
+        self.job_table.configure(yscrollcommand=job_scrollbar.set)
+        
+        # With the manual queue order, queued jobs can be dragged onto another queued job's place
+        self.job_table.bind("<ButtonPress-1>", self.on_job_drag_start, add="+")
+        self.job_table.bind("<ButtonRelease-1>", self.on_job_drag_end, add="+")
+        
+        self.root.after(JOB_TABLE_REFRESH_MS, self.refresh_job_table)
+    
+    def create_watch_tab(self):
+        self.tabview.add("Watch")
+        watch_tab = self.tabview.tab("Watch")
+        watch_tab.grid_columnconfigure(0, weight=1)
+        watch_tab.grid_rowconfigure(1, weight=1)
+        
+        watch_frame = ctk.CTkFrame(watch_tab)
+        watch_frame.grid(row=0, column=0, columnspan=2, sticky="ew", padx=20, pady=(20, 0))
+        
+        interval_label = ctk.CTkLabel(watch_frame, text="Check every (hours):", font=ctk.CTkFont(size=14))
+        interval_label.grid(row=0, column=0, padx=20, pady=10)
+        
+        self.watch_interval_var = tk.StringVar(value=f"{WATCH_DEFAULT_HOURS:g}")
+        interval_entry = ctk.CTkEntry(watch_frame, textvariable=self.watch_interval_var, width=60)
+        interval_entry.grid(row=0, column=1, pady=10)
+        
+        for column, (text, command) in enumerate((
+            ("Watch Main Tab URLs", self.watch_main_urls),
+            ("Set Interval", self.set_watch_interval),
+            ("Check Now", self.check_watched_now),
+            ("Remove", self.remove_watched)
+        ), start=2):
+            button = ctk.CTkButton(watch_frame, text=text, command=command, width=120)
+            button.grid(row=0, column=column, padx=(10, 0), pady=10)
+            self.store_widgets.append(button)
+        
+        self.watch_auto_var = tk.BooleanVar(value=True)
+        watch_auto_check = ctk.CTkCheckBox(
+            watch_frame, text=f"Check subscriptions automatically ({WATCH_MAX_CHECKS} at a time)", variable=self.watch_auto_var
+        )
+        watch_auto_check.grid(row=1, column=0, columnspan=3, sticky="w", padx=20, pady=(0, 10))
         
-        exec_label = ctk.CTkLabel(exec_frame, text="Execute command for each file:", font=ctk.CTkFont(size=14))
-        exec_label.grid(row=0, column=0, padx=20, pady=5)
+        self.watch_status_var = tk.StringVar()
+        status_label = ctk.CTkLabel(watch_frame, textvariable=self.watch_status_var, text_color="gray")
+        status_label.grid(row=1, column=3, columnspan=3, sticky="w", padx=10, pady=(0, 10))
         
-        self.exec_var = tk.StringVar()
-        exec_entry = ctk.CTkEntry(exec_frame, textvariable=self.exec_var, placeholder_text="Command to execute...")
-        exec_entry.grid(row=0, column=1, sticky="ew", pady=5)
+        columns = ("url", "interval", "next", "last", "status", "files")
+        headings = ("URL", "Every", "Next Check", "Last Check", "Last Result", "New Files")
+        widths = (360, 60, 90, 130, 80, 70)
         
-        # Execute after command
-        exec_after_label = ctk.CTkLabel(exec_frame, text="Execute command after all downloads:", font=ctk.CTkFont(size=14))
-        exec_after_label.grid(row=1, column=0, padx=20, pady=(5, 0))
+        self.watch_table = ttk.Treeview(watch_tab, columns=columns, show="headings", height=12)
+        for column, heading, width in zip(columns, headings, widths):
+            self.watch_table.heading(column, text=heading)
+            self.watch_table.column(column, width=width, stretch=(column == "url"))
+        self.watch_table.grid(row=1, column=0, sticky="nsew", padx=(20, 0), pady=20)
         
-        self.exec_after_var = tk.StringVar()
-        exec_after_entry = ctk.CTkEntry(exec_frame, textvariable=self.exec_after_var, placeholder_text="Command to execute...")
-        exec_after_entry.grid(row=1, column=1, sticky="ew", pady=5)
+        watch_scrollbar = ttk.Scrollbar(watch_tab, orient=tk.VERTICAL, command=self.watch_table.yview)
+        watch_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 20), pady=20)
+        self.watch_table.configure(yscrollcommand=watch_scrollbar.set)
+    
+    def watch_interval(self):
+        """Interval entered on the Watch tab in seconds, or None after telling the user it is invalid."""
+        try:
+            hours = float(self.watch_interval_var.get())
+        except ValueError:
+            hours = 0
+        if hours <= 0:
+            messagebox.showerror("Invalid Interval", "Enter the number of hours between checks.")
+            return None
+        return hours * 3600
+    
+    def watch_main_urls(self):
+        urls = self.get_urls()
+        interval = self.watch_interval()
+        if interval is None:
+            return
+        if not urls:
+            messagebox.showerror("No URLs", "Enter the URLs to watch on the Main tab.")
+            return
+        if not self.check_filter():
+            return
+        # Subscriptions keep the options they were added with, minus the URL-specific ones
+        added = self.watch_list.add(urls, remove_option(self.build_options(), "-i"), interval)
+        self.log_to_console(f"Watching {added:,} new URL(s)" + (f", {len(urls) - added:,} already watched" if added < len(urls) else ""))
+        self.refresh_watch_table()
+    
+    def selected_watch_urls(self):
+        urls = list(self.watch_table.selection())
+        if not urls:
+            messagebox.showinfo("Watch", "Select one or more subscriptions first.")
+        return urls
+    
+    def set_watch_interval(self):
+        urls = self.selected_watch_urls()
+        interval = self.watch_interval() if urls else None
+        if interval is not None:
+            self.watch_list.set_interval(urls, interval)
+            self.refresh_watch_table()
+    
+    def check_watched_now(self):
+        urls = self.selected_watch_urls()
+        if urls:
+            self.watch_list.check_now(urls)
+            self.dispatch_watch_checks()
+            self.refresh_watch_table()
+    
+    def remove_watched(self):
+        urls = self.selected_watch_urls()
+        if urls and messagebox.askyesno("Remove Subscriptions", f"Stop watching {len(urls):,} URL(s)?"):
+            self.watch_list.remove(urls)
+            self.refresh_watch_table()
+    
+    def poll_watch_list(self):
+        if self.watch_auto_var.get():
+            self.dispatch_watch_checks()
+        self.refresh_watch_table()
+        self.root.after(WATCH_POLL_MS, self.poll_watch_list)
+    
+    def dispatch_watch_checks(self):
+        """Start due checks, keeping at most WATCH_MAX_CHECKS running."""
+        limit = WATCH_MAX_CHECKS - len(self.watch_checks)
+        if limit <= 0:
+            return
+        due = self.watch_list.due(limit, exclude={url for url, mark in self.watch_checks.values()})
+        if not due:
+            return
+        engine = self.apply_run_settings()
+        if engine is None:
+            # Do not ask again on every poll
+            self.watch_auto_var.set(False)
+            return
+        password = self.password_var.get()
+        jobs = []
+        for url, options, mark in due:
+            if password:
+                options = set_option(options, "-p", password)
+            job = self.create_job([url], watch_check_options(options, mark), engine)
+            self.watch_checks[job.id] = (url, [])
+            jobs.append(job)
+        self.start_jobs(jobs, engine)
+    
+    def on_watch_event(self, job, event):
+        """Collect the newest file URLs of a check; they become the subscription's next mark."""
+        check = self.watch_checks.get(job.id)
+        if check is not None and event.kind == EVENT_FILE and event.url and len(check[1]) < WATCH_MARK_SIZE:
+            check[1].append(event.url)
+    
+    def finish_watch_check(self, job):
+        """Called on the job's thread when a check ends."""
+        url, mark = self.watch_checks.pop(job.id)
+        self.watch_list.checked(url, job.status, job.files, mark)
+        if job.files:
+            self.log_to_console(f"[watch] {job.files:,} new file(s) from {url}")
+        self.root.after(0, self.continue_watch_checks)
+    
+    def continue_watch_checks(self):
+        if self.watch_auto_var.get():
+            self.dispatch_watch_checks()
+    
+    def refresh_watch_table(self):
+        now = time.time()
+        rows = self.watch_list.rows()
+        selection = set(self.watch_table.selection())
+        self.watch_table.delete(*self.watch_table.get_children())
+        for url, interval, next_check, last_check, last_status, last_files in rows:
+            last = datetime.datetime.fromtimestamp(last_check).strftime("%Y-%m-%d %H:%M") if last_check else "never"
+            values = (
+                url, format_duration(interval), format_duration(max(next_check - now, 0)), last,
+                last_status or "", "" if last_files is None else last_files
+            )
+            self.watch_table.insert("", tk.END, iid=url, values=values)
+        self.watch_table.selection_set([url for url in selection if self.watch_table.exists(url)])
+        due = sum(1 for row in rows if row[2] <= now)
+        self.watch_status_var.set(f"{len(rows):,} subscriptions, {due:,} due, {len(self.watch_checks)} checking")
+    
+    def job_table_values(self, job):
+        result = "" if job.returncode is None else str(job.returncode)
+        meter = self.job_meters.get(job.id)
+        rate = f"{meter.bytes_per_second / 1e6:.2f}" if meter and job.status == "running" else ""
+        return (
+            job.id, job.host, job.describe(), job.status, job.files, format_skip_ratio(job.files, job.skipped),
+            job.errors, rate, self.job_table_eta(job),
+            format_duration(job.elapsed()), result
+        )
+    
+    def job_table_eta(self, job):
+        if job.status == "running":
+            return format_duration(self.estimate_job_eta(job))
+        # Queued jobs show how long they are expected to take
+        if job.status == "queued" and job.cost is not None:
+            return "~" + format_duration(job.cost)
+        return ""
+    
+    def estimate_job_eta(self, job):
+        """Remaining time of a running job, when it can be estimated."""
+        elapsed = job.elapsed()
+        done = job.files + job.skipped
+        # Progress through the files the last run saw is better than the time it took
+        if job.expected_files and done:
+            return max(elapsed * (job.expected_files - done) / done, 0)
+        if job.cost is not None:
+            return max(job.cost - elapsed, 0)
+        return None
+    
+    def on_schedule_policy_change(self, choice):
+        self.scheduler.policy = choice
+        self.scheduler.wake()
+    
+    def on_job_drag_start(self, event):
+        self.drag_job_row = self.job_table.identify_row(event.y)
+    
+    def on_job_drag_end(self, event):
+        """Dropping a queued job on another moves it to that place in the queue."""
+        source, target = self.drag_job_row, self.job_table.identify_row(event.y)
+        self.drag_job_row = None
+        if not source or not target or source == target or self.scheduler.policy != SCHEDULE_MANUAL:
+            return
+        job, target_job = self.jobs.get(int(source)), self.jobs.get(int(target))
+        if job is None or target_job is None or not self.scheduler.move(job, target_job):
+            return
+        self.job_table.move(source, "", self.job_table.index(target))
+        self.job_table.selection_set(source)
+    
+    def update_dashboard(self):
+        now = time.monotonic()
+        jobs = list(self.jobs.values())
+        running = [job for job in jobs if job.status == "running"]
+        queued = sum(1 for job in jobs if job.status == "queued")
+        
+        for job in running:
+            self.job_meters.setdefault(job.id, ThroughputMeter()).update(job.files, job.bytes, now)
+        self.total_meter.update(sum(job.files for job in jobs), sum(job.bytes for job in jobs), now)
+        
+        # Overall ETA: queued and running jobs at the average duration of finished ones
+        finished = [job.elapsed() for job in jobs if job.status in ("done", "failed")]
+        eta = None
+        if finished and (queued or running):
+            average = sum(finished) / len(finished)
+            eta = (queued + len(running)) * average / max(min(self.scheduler.max_jobs, queued + len(running)), 1)
+        
+        self.dashboard_vars["files_per_second"].set(f"{self.total_meter.files_per_second:.1f}")
+        self.dashboard_vars["mb_per_second"].set(f"{self.total_meter.bytes_per_second / 1e6:.2f}")
+        self.dashboard_vars["skip_ratio"].set(format_skip_ratio(sum(job.files for job in jobs), sum(job.skipped for job in jobs)))
+        self.dashboard_vars["eta"].set(format_duration(eta))
+        self.dashboard_vars["active"].set(str(len(running)))
+        self.dashboard_vars["queued"].set(str(queued))
+    
+    def refresh_job_table(self):
+        """Update the dashboard and redraw rows for jobs that changed (or are still running)."""
+        self.update_dashboard()
+        self.rebalance_bandwidth()
+        
+        busy = self.scheduler.is_busy()
+        if self.was_busy and not busy:
+            self.on_all_jobs_finished()
+        self.was_busy = busy
+        
+        failed = len(self.retry_queue)
+        if failed != self.retry_button_count:
+            self.retry_button_count = failed
+            self.retry_button.configure(text=f"Retry Failed ({failed:,})" if failed else "Retry Failed")
+        
+        for job in list(self.jobs.values()):
+            if not job.changed and job.status != "running":
+                continue
+            job.changed = False
+            row_id = str(job.id)
+            if self.job_table.exists(row_id):
+                self.job_table.item(row_id, values=self.job_table_values(job))
+            else:
+                self.job_table.insert("", tk.END, iid=row_id, values=self.job_table_values(job))
+        
+        self.root.after(JOB_TABLE_REFRESH_MS, self.refresh_job_table)
     
     def create_console(self):
         console_frame = ctk.CTkFrame(self.main_frame)
@@ -634,6 +5917,9 @@ class GalleryDLUI:
         console_label = ctk.CTkLabel(console_frame, text="Output Console", font=ctk.CTkFont(size=16, weight="bold"))
         console_label.grid(row=0, column=0, padx=20, pady=(20, 10))
         
+        log_viewer_button = ctk.CTkButton(console_frame, text="Open Log Viewer", command=self.open_log_viewer, width=140)
+        log_viewer_button.grid(row=0, column=1, padx=20, pady=(20, 10))
+        
         # Use regular tkinter scrolledtext for console as CustomTkinter doesn't have a direct equivalent
         self.console = scrolledtext.ScrolledText(
             console_frame, 
@@ -643,8 +5929,11 @@ class GalleryDLUI:
             insertbackground="#ffffff",
             font=("Consolas", 10)
         )
-        self.console.grid(row=1, column=0, sticky="nsew", padx=20, pady=(0, 20))
+        self.console.grid(row=1, column=0, columnspan=2, sticky="nsew", padx=20, pady=(0, 20))
         self.console.config(state=tk.DISABLED)
+        
+        # Start draining queued lines into the console
+        self.root.after(CONSOLE_POLL_MS, self.pump_console)
     
     def browse_destination(self):
         directory = filedialog.askdirectory()
@@ -660,6 +5949,16 @@ class GalleryDLUI:
         filename = filedialog.askopenfilename()
         if filename:
             self.cookies_var.set(filename)
+    
+    def open_log_viewer(self):
+        path = self.last_log_path
+        if not path or not os.path.isfile(path):
+            path = filedialog.askopenfilename(
+                initialdir=get_data_dir("logs"),
+                filetypes=[("Log files", "*.log*"), ("All files", "*.*")]
+            )
+        if path:
+            LogViewer(self.root, path)
 
     def add_to_filter_expression(self):
         filter_type = self.filter_builder_type_var.get()
@@ -669,6 +5968,10 @@ class GalleryDLUI:
             self.log_to_console("Filter builder: Value cannot be empty.")
             return
 
+        # Tags never seen in downloaded metadata are most likely typos
+        if filter_type in ("Tags contain", "Tags do not contain") and not self.confirm_tags(filter_value_str):
+            return
+        
         new_filter_condition = ""
         
         if filter_type == "Extension is":
@@ -768,6 +6071,55 @@ class GalleryDLUI:
         self.filter_builder_value_var.set("") # Clear the value input
         self.filter_builder_value2_var.set("") # Clear the second value input
 
+    def update_tag_suggestions(self, *args):
+        """Offer completions for the tag being typed, or close matches when no known tag starts with it."""
+        for widget in self.tag_suggestion_frame.winfo_children():
+            widget.destroy()
+        if self.filter_builder_type_var.get() not in ("Tags contain", "Tags do not contain"):
+            return
+        typed = self.filter_builder_value_var.get().rpartition(",")[2].strip()
+        if not typed or not self.stores_loaded:
+            return
+        
+        suggestions = self.tag_index.complete(typed)
+        title = "Tags:"
+        if not suggestions and len(typed) >= 3:
+            suggestions = self.tag_index.suggest(typed)
+            title = "Did you mean:"
+        if not suggestions:
+            return
+        
+        title_label = ctk.CTkLabel(self.tag_suggestion_frame, text=title, text_color="gray")
+        title_label.grid(row=0, column=0, padx=(0, 10))
+        for index, (tag, count) in enumerate(suggestions, 1):
+            button = ctk.CTkButton(
+                self.tag_suggestion_frame, text=f"{tag} ({count:,})", width=60, height=24,
+                command=lambda tag=tag: self.accept_tag_suggestion(tag)
+            )
+            button.grid(row=0, column=index, padx=(0, 5))
+    
+    def confirm_tags(self, value):
+        """Ask before adding tags that never appeared in downloaded metadata."""
+        if not self.stores_loaded:
+            return True
+        unknown = [tag.strip() for tag in value.split(",") if tag.strip() and not self.tag_index.exists(tag.strip())]
+        if not unknown:
+            return True
+        lines = []
+        for tag in unknown:
+            suggestions = self.tag_index.suggest(tag)
+            hint = f" - did you mean {', '.join(s for s, _ in suggestions)}?" if suggestions else ""
+            lines.append(f"{tag}{hint}")
+        return messagebox.askyesno(
+            "Unknown Tags",
+            "These tags were not seen in any downloaded metadata and may match nothing:\n\n"
+            + "\n".join(lines) + "\n\nAdd them anyway?"
+        )
+    
+    def accept_tag_suggestion(self, tag):
+        head = self.filter_builder_value_var.get().rpartition(",")[0]
+        self.filter_builder_value_var.set(f"{head}, {tag}" if head.strip() else tag)
+    
     def update_filter_help(self, choice=None):
         filter_type = self.filter_builder_type_var.get()
         help_texts = {
@@ -785,12 +6137,40 @@ class GalleryDLUI:
             "Date between": "Enter start date, end date below (both in YYYY-MM-DD format)"
         }
         self.fb_help_var.set(help_texts.get(filter_type, ""))
+        self.update_tag_suggestions()
 
     def log_to_console(self, text):
-        self.console.config(state=tk.NORMAL)
-        self.console.insert(tk.END, text + "\n")
-        self.console.see(tk.END)
-        self.console.config(state=tk.DISABLED)
+        """Queue a line for the console. Safe to call from any thread."""
+        self.console_queue.put(text)
+    
+    def pump_console(self):
+        """Write queued lines to the console in one insert, then reschedule."""
+        lines = []
+        try:
+            # Lines older than the last CONSOLE_MAX_LINES would be trimmed right away,
+            # so skip rendering them; they are still in the job log file
+            dropped = 0
+            while self.console_queue.qsize() > CONSOLE_MAX_LINES:
+                self.console_queue.get_nowait()
+                dropped += 1
+            if dropped:
+                lines.append(f"[{dropped} lines not shown - see the job log]")
+            while len(lines) < CONSOLE_MAX_LINES_PER_TICK:
+                lines.append(self.console_queue.get_nowait())
+        except queue.Empty:
+            pass
+        
+        if lines:
+            self.console.config(state=tk.NORMAL)
+            self.console.insert(tk.END, "\n".join(lines) + "\n")
+            # Keep the console a fixed-size ring of the newest lines
+            line_count = int(self.console.index("end-1c").split(".")[0]) - 1
+            if line_count > CONSOLE_MAX_LINES:
+                self.console.delete("1.0", f"{line_count - CONSOLE_MAX_LINES + 1}.0")
+            self.console.see(tk.END)
+            self.console.config(state=tk.DISABLED)
+        
+        self.root.after(CONSOLE_POLL_MS, self.pump_console)
     
     def log_to_console_if_exists(self, text):
         """Helper method to log to console only if it exists (for early initialization)."""
@@ -799,13 +6179,49 @@ class GalleryDLUI:
         else:
             print(text)  # Fallback to print during initialization
 
-    def build_command(self):
+    def get_urls(self):
+        urls = self.url_text.get("1.0", tk.END).strip().split("\n")
+        # Filter out empty lines and comments such as the import summary
+        return [url.strip() for url in urls if url.strip() and not url.strip().startswith("#")]
+    
+    def import_url_list(self):
+        path = filedialog.askopenfilename(filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        
+        def import_worker():
+            importer = UrlImporter()
+            try:
+                importer.import_file(path, lambda lines: self.log_to_console(f"Import: read {lines:,} lines..."))
+            except OSError as e:
+                self.log_to_console(f"Import failed: {e}")
+                return
+            self.root.after(0, lambda: self.finish_url_import(path, importer))
+        
+        self.log_to_console(f"Importing URLs from {path}...")
+        threading.Thread(target=import_worker, daemon=True).start()
+    
+    def finish_url_import(self, path, importer):
+        self.url_importer = importer
+        summary = f"Imported {importer.summary()} from {os.path.basename(path)}"
+        self.log_to_console(summary)
+        # The textbox only shows a summary; the URLs are queued from the importer on Run
+        self.url_text.delete("1.0", tk.END)
+        self.url_text.insert("1.0", f"# {summary}\n# They will be queued when you press Run Download.\n")
+    
+    def build_command(self, urls=None):
         # Use the found or downloaded gallery-dl path
         command = [self.gallery_dl_path or "gallery-dl"]
+        command.extend(self.build_options())
         
-        # Add URLs
-        urls = self.url_text.get("1.0", tk.END).strip().split("\n")
-        urls = [url for url in urls if url]  # Filter out empty lines
+        # Add URLs at the end
+        command.extend(self.get_urls() if urls is None else urls)
+        
+        return command
+    
+    def build_options(self):
+        """Translate the UI selections into gallery-dl options (everything but the URLs)."""
+        command = []
         
         # Add options based on UI selections
         if self.dest_var.get():
@@ -871,6 +6287,9 @@ class GalleryDLUI:
         if self.no_download_var.get():
             command.append("--no-download")
         
+        if self.use_archive_var.get():
+            command.extend(["--download-archive", self.archive.path])
+        
         if self.username_var.get():
             command.extend(["-u", self.username_var.get()])
         
@@ -895,8 +6314,10 @@ class GalleryDLUI:
         if self.range_var.get():
             command.extend(["--range", self.range_var.get()])
         
-        if self.filter_var.get():
-            command.extend(["--filter", self.filter_var.get()])
+        if self.filter_var.get().strip():
+            # gallery-dl evaluates the filter for every file, so it gets the optimized form;
+            # callers check it with check_filter() first
+            command.extend(["--filter", optimize_filter(self.filter_var.get()).expression])
         
         if self.write_metadata_var.get():
             command.append("--write-metadata")
@@ -904,59 +6325,541 @@ class GalleryDLUI:
         if self.write_tags_var.get():
             command.append("--write-tags")
         
-        if self.zip_var.get():
-            command.append("--zip")
-        
-        if self.cbz_var.get():
-            command.append("--cbz")
-        
-        if self.exec_var.get():
+        # The other modes run the command in the UI's post-processing stage
+        if self.exec_var.get() and self.exec_mode_var.get() == EXEC_PER_FILE:
             command.extend(["--exec", self.exec_var.get()])
         
-        if self.exec_after_var.get():
-            command.extend(["--exec-after", self.exec_after_var.get()])
-        
-        # Add URLs at the end
-        command.extend(urls)
-        
         return command
     
+    def parse_int_setting(self, var, default, minimum=1):
+        try:
+            return max(int(var.get()), minimum)
+        except ValueError:
+            return default
+    
+    def check_filter(self):
+        """Validate the --filter expression; shows an error and returns False if it is invalid."""
+        if not self.filter_var.get().strip():
+            return True
+        try:
+            optimize_filter(self.filter_var.get())
+        except (SyntaxError, ValueError) as e:
+            messagebox.showerror("Invalid Filter", str(e))
+            return False
+        return True
+    
     def run_gallery_dl(self):
-        if not self.gallery_dl_path:
+        if not self.check_filter():
+            return
+        
+        engine = self.apply_run_settings()
+        if engine is None:
+            return
+        
+        # URLs typed into the textbox go through the same normalization and de-duplication
+        importer = self.url_importer or UrlImporter()
+        self.url_importer = None
+        for url in self.get_urls():
+            importer.add(url)
+        if not importer.count and not self.input_file_var.get():
+            messagebox.showerror("No URLs", "Enter at least one URL or select an input file.")
+            return
+        
+        # Posts already fully downloaded are dropped before any process starts
+        if self.use_archive_var.get() and not self.no_skip_var.get():
+            dropped = self.drop_completed_urls(importer)
+            if dropped:
+                self.log_to_console(f"Skipped {dropped:,} post URL(s) already complete in the download archive")
+        
+        # Read every Tk variable here, on the main thread; jobs only get this snapshot
+        options = self.build_options()
+        expression = self.filter_var.get().strip()
+        if expression:
+            plan = optimize_filter(expression)
+            if plan.expression != expression:
+                notes = f" ({'; '.join(plan.notes)})" if plan.notes else ""
+                self.log_to_console(f"Filter rewritten for gallery-dl{notes}: {plan.expression}")
+        
+        # One job per URL so different sites download in parallel; an input file
+        # gets a job of its own instead of being repeated in every URL's job
+        url_options = remove_option(options, "-i")
+        
+        # URLs with fresh cached metadata only ask for the files that matched in the preview
+        selection = None
+        if self.metadata_only_matching_var.get():
+            try:
+                selection = self.metadata_selection()
+            except (ValueError, SyntaxError):
+                pass
+        
+        jobs = []
+        unmatched = 0
+        for chunk in importer.chunks():
+            if len(chunk) <= ARGV_URL_LIMIT:
+                for url in chunk:
+                    job_options = url_options if selection is None else self.metadata_job_options(url, url_options, selection)
+                    if job_options is None:
+                        unmatched += 1
+                        continue
+                    jobs.append(self.create_job([url], job_options, engine))
+            else:
+                # Big imports run as chunks; each chunk is still limited to one host
+                jobs.append(self.create_job(chunk, url_options, engine))
+        if self.input_file_var.get():
+            jobs.append(self.create_job([], options, engine))
+        if unmatched:
+            self.log_to_console(f"Skipped {unmatched:,} URL(s) with no file matching the selection in cached metadata")
+        self.start_jobs(jobs, engine)
+    
+    def apply_run_settings(self):
+        """Copy scheduler-related settings from the UI; returns the engine to use, or None."""
+        engine = self.engine_var.get()
+        if engine == ENGINE_LIBRARY and not LibraryEngine.available():
+            engine = ENGINE_SUBPROCESS
+        # Warm workers host gallery-dl themselves if it is importable, otherwise they need the binary
+        needs_binary = engine == ENGINE_SUBPROCESS or (engine == ENGINE_WARM_POOL and not LibraryEngine.available())
+        if not self.gallery_dl_path and needs_binary:
             messagebox.showerror(
                 "Gallery-DL Not Found", 
                 "Gallery-DL executable not found. Please download it first."
             )
+            return None
+        
+        self.scheduler.max_jobs = self.parse_int_setting(self.max_jobs_var, DEFAULT_MAX_JOBS)
+        self.scheduler.policy = self.schedule_policy_var.get()
+        self.configure_proxy_pool()
+        self.scheduler.per_host_limit = self.parse_int_setting(self.max_jobs_per_host_var, DEFAULT_MAX_JOBS_PER_HOST)
+        
+        # Adaptive control starts new hosts from the settings above and then takes over
+        self.rate_controller.enabled = self.adaptive_var.get()
+        self.rate_controller.default_limit = self.scheduler.per_host_limit
+        try:
+            self.rate_controller.default_sleep = float(self.sleep_var.get())
+        except ValueError:
+            self.rate_controller.default_sleep = 0.0
+        self.scheduler.host_limit_provider = self.rate_controller.job_limit if self.rate_controller.enabled else None
+        
+        # With a total budget, the Rate Limit field becomes the cap for a single job
+        self.bandwidth.total = parse_byte_rate(self.bandwidth_budget_var.get())
+        self.bandwidth.per_job_cap = parse_byte_rate(self.rate_var.get())
+        if self.bandwidth_budget_var.get().strip() and self.bandwidth.total is None:
+            self.log_to_console(f"Ignoring invalid bandwidth budget '{self.bandwidth_budget_var.get()}'")
+        
+        if engine == ENGINE_LIBRARY and self.library_engine is None:
+            self.library_engine = LibraryEngine()
+        return engine
+    
+    def create_job(self, urls, options, engine):
+        job = Job(next(self.job_ids), urls, options)
+        job.engine = engine
+        job.on_status = self.on_job_status
+        self.jobs[job.id] = job
+        return job
+    
+    def start_jobs(self, jobs, engine):
+        if not jobs:
             return
+        for job in jobs:
+            self.journal.record(job.urls, "queued", job.options)
+        self.job_history.estimate(jobs)
+        
+        if self.verify_var.get():
+            self.verifier.start(self.verify_decode_var.get(), hold_corrupt=self.verify_retry_var.get())
+            # Only in-process runs report the announced file size. With headers stored, gallery-dl's
+            # http downloader restarts interrupted .part files instead of resuming them, so it is
+            # only asked to store them while verifying.
+            if engine_runs_in_process(engine):
+                for job in jobs:
+                    if VERIFY_HEADER_OPTIONS[1] not in job.options:
+                        job.options = VERIFY_HEADER_OPTIONS + job.options
+        
+        if self.exec_var.get().strip() and self.exec_mode_var.get() != EXEC_PER_FILE:
+            self.postprocess.start(self.exec_var.get().strip(), self.exec_mode_var.get())
+        
+        extensions = [extension for extension, var in ((".zip", self.zip_var), (".cbz", self.cbz_var)) if var.get()]
+        if extensions:
+            self.archiver.start(extensions, keep_until_finish=self.postprocess.queue is not None)
+        
+        if engine == ENGINE_WARM_POOL:
+            warm_count = min(self.scheduler.max_jobs, len(jobs))
+            if LibraryEngine.available():
+                self.warm_pool.prewarm(warm_count)
+            else:
+                # A standby process only serves jobs with the same options it was started with
+                options = Counter(tuple(job.options) for job in jobs).most_common(1)[0]
+                self.standby_pool.fill(
+                    [self.gallery_dl_path] + MACHINE_OUTPUT_OPTIONS + list(options[0]), min(warm_count, options[1])
+                )
         
-        command = self.build_command()
+        per_host = "adaptive" if self.rate_controller.enabled else self.scheduler.per_host_limit
+        self.log_to_console(f"Queued {len(jobs)} job(s): up to {self.scheduler.max_jobs} at once, {per_host} per host")
+        
+        # In-process engines check existing files against the destination index, refreshed first;
+        # standby gallery-dl binaries (warm pool without the library) cannot use it
+        use_index = engine_runs_in_process(engine) and self.dest_index_skip_var.get() and self.dest_var.get()
+        if use_index and any("--no-skip" not in job.options for job in jobs):
+            for job in jobs:
+                if "--no-skip" not in job.options:
+                    job.skip_index = self.dest_index.path
+            self.indexing_jobs.extend(jobs)
+            self.refresh_dest_index(done=lambda: self.submit_indexed_jobs(jobs))
+            return
+        self.scheduler.submit(jobs)
+    
+    def submit_indexed_jobs(self, jobs):
+        """Hand jobs that waited for the destination index to the scheduler, unless they were stopped meanwhile."""
+        submitted = {job.id for job in jobs}
+        self.indexing_jobs = [job for job in self.indexing_jobs if job.id not in submitted]
+        self.scheduler.submit([job for job in jobs if job.status == "queued"])
+    
+    def drop_completed_urls(self, importer):
+        dropped = 0
+        for host, urls in importer.by_host.items():
+            completed = self.archive.completed(url for url in urls if SINGLE_POST_PATTERNS.search(url))
+            if completed:
+                importer.by_host[host] = [url for url in urls if url not in completed]
+                dropped += len(completed)
+        importer.count -= dropped
+        return dropped
+    
+    def on_job_status(self, job):
+        self.journal.record(job.urls, job.status, job.options)
+        # Only complete runs of one URL say what that URL costs; watch checks stop early
+        if job.status == "done" and len(job.urls) == 1 and job.id not in self.watch_checks:
+            self.job_history.record(job.urls[0], job.elapsed(), job.files + job.skipped, job.bytes)
+        if job.status in ("done", "failed"):
+            self.track_failures(job)
+        if job.id in self.watch_checks and job.status not in JOB_STATES_UNFINISHED:
+            self.finish_watch_check(job)
+        
+        # Remember single-post URLs that downloaded cleanly so they can be skipped next time
+        if job.status == "done" and not job.errors and "--download-archive" in job.options:
+            if not any(option in job.options for option in NO_DOWNLOAD_OPTIONS):
+                post_urls = [url for url in job.urls if SINGLE_POST_PATTERNS.search(url)]
+                if post_urls:
+                    self.archive.mark_completed(post_urls, job.files + job.skipped)
+    
+    def track_failures(self, job):
+        """Move a finished job's failed URLs to the retry queue. Called on the job's thread."""
+        # Subprocess runs only have one exit code for all of their URLs
+        returncode = job.returncode if job.returncode is not None else 1
+        statuses = job.url_status or {url: returncode for url in job.urls}
+        failed = 0
+        for url, code in statuses.items():
+            if code == 0:
+                self.retry_queue.succeeded(url)
+                continue
+            item = self.retry_queue.add(url, job.options, job.engine, code, job.last_error)
+            failed += 1
+        if not failed:
+            return
+        if item.due is None:
+            self.log_to_console(f"[job {job.id}] {failed} URL(s) failed (exit code {returncode}); use Retry Failed to run them again")
+        else:
+            self.log_to_console(
+                f"[job {job.id}] {failed} URL(s) failed (exit code {returncode}); "
+                f"attempt {item.attempt + 1} in {format_duration(item.due - time.monotonic())}"
+                + ("" if self.auto_retry_var.get() else " if automatic retries are enabled")
+            )
+        self.root.after(0, self.schedule_retries)
+    
+    def schedule_retries(self):
+        """Arm the timer for the next due retry."""
+        if self.retry_after is not None:
+            self.root.after_cancel(self.retry_after)
+            self.retry_after = None
+        due = self.retry_queue.next_due()
+        if due is None or not self.auto_retry_var.get():
+            return
+        delay_ms = max(int((due - time.monotonic()) * 1000), 0)
+        self.retry_after = self.root.after(delay_ms, self.run_due_retries)
+    
+    def run_due_retries(self):
+        self.retry_after = None
+        items = self.retry_queue.pop_due()
+        if items:
+            self.dispatch_retries(items)
+        self.schedule_retries()
+    
+    def retry_failed_only(self):
+        """Run every failed URL again now, whatever its backoff."""
+        if not len(self.retry_queue):
+            messagebox.showinfo("Retry Failed", "No failed URLs to retry.")
+            return
+        if self.apply_run_settings() is None:
+            return
+        self.dispatch_retries(self.retry_queue.pop_all())
+        self.schedule_retries()
+    
+    def dispatch_retries(self, items):
+        by_engine = {}
+        for item in items:
+            by_engine.setdefault(item.engine, []).append(self.create_job([item.url], item.options, item.engine))
+        hosts = len({item.host for item in items})
+        self.log_to_console(f"Retrying {len(items):,} failed URL(s) on {hosts:,} host(s)")
+        for engine, jobs in by_engine.items():
+            self.start_jobs(jobs, engine)
+    
+    def offer_resume(self):
+        unfinished = self.journal.unfinished()
+        if not unfinished:
+            self.journal.compact()
+            return
         
-        self.log_to_console("Running command: " + " ".join(command))
+        resume = messagebox.askyesno(
+            "Resume Downloads",
+            f"{len(unfinished)} URL(s) from the last session did not finish.\n\n"
+            "Would you like to resume them now?"
+        )
+        if not resume:
+            for url, options in unfinished:
+                self.journal.record([url], "cancelled", options)
+            return
         
-        def run_process():
-            try:
-                process = subprocess.Popen(
-                    command,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    text=True,
-                    bufsize=1,
-                    universal_newlines=True
+        engine = self.apply_run_settings()
+        if engine is None:
+            return
+        password = self.password_var.get()
+        jobs = []
+        for url, options in unfinished:
+            if password:
+                options = set_option(options, "-p", password)
+            jobs.append(self.create_job([url], options, engine))
+        self.log_to_console(f"Resuming {len(jobs)} unfinished URL(s) from the last session")
+        self.start_jobs(jobs, engine)
+        self.journal.compact()
+    
+    def on_rate_change(self, message):
+        self.log_to_console(f"[adaptive] {message}")
+        # A host may have been allowed more jobs
+        self.scheduler.wake()
+    
+    def prepare_job(self, job):
+        """Apply per-job settings that are decided at launch time rather than when queued."""
+        # Kept out of job.options so jobs still share one gallery-dl config and standby command
+        job.launch_options = []
+        job.proxy = self.proxy_pool.acquire(job.host)
+        if job.proxy is not None:
+            job.launch_options += ["--proxy", job.proxy]
+        if self.rate_controller.enabled:
+            job.launch_options += ["--sleep", str(self.rate_controller.job_sleep(job.host))]
+        if self.bandwidth.total:
+            job.rate_limit = self.bandwidth_shares(extra_job=job)[job.id]
+            job.launch_options += ["-r", format_byte_rate(job.rate_limit)]
+        if job.launch_options and engine_runs_in_process(job.engine) and not LibraryEngine.supports_launch_options():
+            self.log_to_console(f"[job {job.id}] This gallery-dl cannot take per-job {', '.join(job.launch_options[::2])} in-process; running it as a subprocess")
+            job.engine = ENGINE_SUBPROCESS
+    
+    def bandwidth_shares(self, extra_job=None):
+        """Current budget split over the running jobs (plus extra_job, about to start)."""
+        now = time.monotonic()
+        demands = {}
+        for job in list(self.jobs.values()):
+            if job.status == "running" and job is not extra_job:
+                meter = self.job_meters.get(job.id)
+                demands[job.id] = self.bandwidth.demand(job, meter.bytes_per_second if meter else 0.0, now)
+        if extra_job is not None:
+            demands[extra_job.id] = self.bandwidth.per_job_cap
+        return self.bandwidth.allocate(demands)
+    
+    def rebalance_bandwidth(self):
+        """Restart subprocess jobs whose fair share has moved far from the -r they run with."""
+        now = time.monotonic()
+        if not self.bandwidth.total or now - self.last_rebalance < BANDWIDTH_REBALANCE_SECONDS:
+            return
+        self.last_rebalance = now
+        
+        for job_id, share in self.bandwidth_shares().items():
+            job = self.jobs[job_id]
+            if job.engine == ENGINE_LIBRARY or job.process is None or job.process.poll() is not None:
+                continue
+            if job.rate_limit is None:
+                continue
+            if now - job.launched < BANDWIDTH_MIN_RUN_SECONDS or job.restart_requested:
+                continue
+            ratio = share / job.rate_limit
+            if ratio >= BANDWIDTH_RESTART_FACTOR or ratio <= 1 / BANDWIDTH_RESTART_FACTOR:
+                # gallery-dl skips finished files and resumes .part files, so a restart loses little
+                self.log_to_console(
+                    f"[job {job.id}] Restarting with bandwidth share {format_byte_rate(share)}/s "
+                    f"(was {format_byte_rate(job.rate_limit)}/s)"
                 )
-                
-                for line in process.stdout:
-                    self.log_to_console(line.strip())
-                
-                process.wait()
-                self.log_to_console(f"Process completed with return code {process.returncode}")
-            
-            except Exception as e:
-                self.log_to_console(f"Error: {str(e)}")
+                job.restart_requested = True
+                job.process.terminate()
+    
+    def stop_all_jobs(self):
+        if self.scheduler.is_busy():
+            self.log_to_console("Stopping all jobs...")
+        self.scheduler.cancel_all()
+        # Failed URLs stay queued for Retry Failed, but do not start on their own any more
+        if self.retry_after is not None:
+            self.root.after_cancel(self.retry_after)
+            self.retry_after = None
+        for job in self.indexing_jobs:
+            job.set_status("cancelled")
+        self.indexing_jobs = []
+    
+    def run_job(self, job):
+        """Run one job with its engine. Called on a scheduler worker thread."""
+        # Everything the job prints is also kept in a log file for this job
+        log_path = os.path.join(get_data_dir("logs"), time.strftime(f"job-%Y%m%d-%H%M%S-{job.id}.log"))
+        job_log = JobLog(log_path)
+        job.log_path = log_path
+        self.last_log_path = log_path
+        
+        prefix = f"[job {job.id}]"
+        
+        def emit(line):
+            job_log.write(line)
+            self.log_to_console(f"{prefix} {line}")
+        
+        # Process output is logged (without the machine-output mark) and also parsed into events
+        def output(line, event=None):
+            emit(line[len(OUTPUT_MARK):] if line.startswith(OUTPUT_MARK) else line)
+            self.handle_event(job, event or parse_output_line(line))
+        
+        self.log_to_console(f"{prefix} Logging to {log_path}")
+        
+        job.launched = time.monotonic()
+        if job.started is None:
+            job.started = job.launched
+        job.finished = None
+        job.set_status("running")
+        try:
+            # Stop All flags jobs the scheduler already handed out but that have no process yet
+            if job.cancelled:
+                job.set_status("cancelled")
+                return
+            self.prepare_job(job)
+            if job.engine == ENGINE_LIBRARY:
+                job.returncode = self.run_library_job(job, emit, output)
+            elif job.engine == ENGINE_WARM_POOL:
+                job.returncode = self.run_warm_job(job, emit, output)
+            else:
+                job.returncode = self.run_subprocess_job(job, emit, output)
+            self.log_to_console(f"{prefix} Process completed with return code {job.returncode}")
+            if job.cancelled:
+                job.set_status("cancelled")
+            elif job.restart_requested:
+                job.set_status("queued")
+            else:
+                job.set_status("done" if job.returncode == 0 else "failed")
         
-        # Run the process in a separate thread to avoid blocking the UI
-        threading.Thread(target=run_process, daemon=True).start()
+        except Exception as e:
+            if job.restart_requested and not job.cancelled:
+                # A warm worker killed for a new bandwidth share ends with an error, not an exit code
+                job.set_status("queued")
+            else:
+                self.log_to_console(f"{prefix} Error: {str(e)}")
+                job.set_status("failed")
+        finally:
+            job.finished = time.monotonic()
+            job.changed = True
+            job_log.close()
+            if job.proxy is not None:
+                self.proxy_pool.release(job.proxy)
+                job.proxy = None
+            if job.status == "queued":
+                # Restarted for a new bandwidth share
+                job.restart_requested = False
+                job.process = None
+                job.returncode = None
+                self.scheduler.submit([job])
+            if self.rate_controller.enabled:
+                self.rate_controller.save()
+    
+    def handle_event(self, job, event):
+        job.record_event(event)
+        if event.kind != EVENT_LOG:
+            job.changed = True
+        for listener in self.event_listeners:
+            listener(job, event)
+    
+    def run_subprocess_job(self, job, emit, output):
+        url_file = None
+        url_args = job.urls
+        if len(job.urls) > ARGV_URL_LIMIT:
+            # Long URL lists go through an input file to stay clear of the OS argv limit
+            fd, url_file = tempfile.mkstemp(prefix=f"job-{job.id}-", suffix=".txt", dir=get_data_dir("input"))
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write("".join(url + "\n" for url in job.urls))
+            url_args = ["-i", url_file]
+        
+        command = [self.gallery_dl_path] + MACHINE_OUTPUT_OPTIONS + job.options + job.launch_options + url_args
+        emit("Running command: " + format_command(command))
+        
+        try:
+            job.process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                universal_newlines=True
+            )
+            
+            for line in job.process.stdout:
+                output(line.rstrip())
+            
+            return job.process.wait()
+        finally:
+            if url_file is not None:
+                os.remove(url_file)
+    
+    def library_event_handler(self, job, output):
+        # Library events are already typed; the logged lines match what gallery-dl processes print
+        def on_event(kind, value, info=None):
+            if kind == "file":
+                info = info or {}
+                output("+ " + value, DownloadEvent(
+                    EVENT_FILE, path=value, size=get_file_size(value), url=info.get("url"), expected=info.get("expected")
+                ))
+            elif kind == "skip":
+                output("# " + value, DownloadEvent(EVENT_SKIP, path=value))
+            elif kind == "status":
+                job.url_status[value] = (info or {}).get("status", 0)
+            else:
+                output(value)
+        return on_event
+    
+    def run_library_job(self, job, emit, output):
+        emit("Running in-process: gallery-dl " + format_command(job.options + job.launch_options + job.urls))
+        return self.library_engine.run(job, self.library_event_handler(job, output))
+    
+    def run_warm_job(self, job, emit, output):
+        if LibraryEngine.available():
+            worker = self.warm_pool.acquire()
+            job.process = worker.process
+            emit(f"Running in warm worker {worker.process.pid}: gallery-dl " + format_command(job.options + job.launch_options + job.urls))
+            try:
+                return worker.run(job, self.library_event_handler(job, output))
+            finally:
+                self.warm_pool.release(worker)
+        
+        command = [self.gallery_dl_path] + MACHINE_OUTPUT_OPTIONS + job.options
+        # Only start a replacement if a queued job will be able to use it
+        process = self.standby_pool.take(command, refill=self.scheduler.has_pending(job.options))
+        if process is None:
+            emit("No standby process for these options, starting one")
+            process = self.standby_pool.spawn(command)
+        job.process = process
+        emit(f"Running in standby process {process.pid}: " + format_command(command + job.launch_options + job.urls))
+        
+        # The process parsed its command line long ago; launch options go in as global input-file settings
+        settings = [f"-G {key} = {json.dumps(value)}\n" for key, value in launch_config(job.launch_options).items()]
+        process.stdin.write("".join(settings) + "".join(url + "\n" for url in job.urls))
+        process.stdin.close()
+        for line in process.stdout:
+            output(line.rstrip())
+        return process.wait()
 
 def main():
+    if WARM_WORKER_FLAG in sys.argv[1:]:
+        run_worker()
+        return
+    if sys.argv[1:2] == [BENCH_FILTER_FLAG]:
+        sys.exit(run_filter_benchmark(sys.argv[2:]))
+    
     root = ctk.CTk()
     app = GalleryDLUI(root)
     root.mainloop()
@@ -0,0 +1,361 @@
+"""Tests for the helpers in main.py that do not need a window."""
+
+import ast
+import io
+import os
+import struct
+import sys
+import zipfile
+
+import pytest
+
+import main
+
+
+def test_normalize_url_drops_tracking_and_fragment():
+    assert main.normalize_url("HTTPS://www.Example.com/a?utm_source=x&id=1&fbclid=y#top") == "https://example.com/a?id=1"
+    assert main.normalize_url("https://example.com/a?b=%20&c=1") == "https://example.com/a?b=%20&c=1"
+    assert main.normalize_url("http://example.com") == "http://example.com/"
+
+
+def test_normalize_url_reduces_kemono_paths():
+    assert main.normalize_url("http://kemono.su/Patreon/user/123/post/9/extra") == "https://kemono.su/patreon/user/123/post/9"
+    assert main.normalize_url("https://coomer.st/api/v1/onlyfans/user/abc") == "https://coomer.st/onlyfans/user/abc"
+
+
+def test_normalize_url_rejects_other_schemes():
+    assert main.normalize_url("ftp://example.com/file") is None
+    assert main.normalize_url("not a url") is None
+    assert main.normalize_url("http://[::1") is None
+
+
+def test_bandwidth_allocate_shares_evenly():
+    budget = main.BandwidthBudget(total=3 * 1024 * 1024)
+    assert budget.allocate({"a": None, "b": None, "c": None}) == {key: 1024 * 1024 for key in "abc"}
+
+
+def test_bandwidth_allocate_gives_unused_share_to_others():
+    budget = main.BandwidthBudget(total=3 * 1024 * 1024)
+    shares = budget.allocate({"slow": 512 * 1024, "a": None, "b": None})
+    assert shares["slow"] == 512 * 1024
+    assert shares["a"] == shares["b"] == 1280 * 1024
+
+
+def test_bandwidth_allocate_keeps_a_minimum_share():
+    budget = main.BandwidthBudget(total=100 * 1024)
+    shares = budget.allocate({key: None for key in "abcd"})
+    assert all(share == main.BANDWIDTH_MIN_SHARE for share in shares.values())
+
+
+def make_copies(directory, *names, data=b"same content"):
+    paths = []
+    for number, name in enumerate(names):
+        path = directory / name
+        path.write_bytes(data)
+        # Distinct mtimes make the oldest copy (the one kept) predictable
+        os.utime(path, ns=(1_000_000_000 * (number + 1),) * 2)
+        paths.append(path)
+    return paths
+
+
+def find_duplicates(tmp_path, root):
+    deduplicator = main.Deduplicator(main.HashIndex(str(tmp_path / "hashes.sqlite3")), log=lambda message: None)
+    return deduplicator, deduplicator.find_duplicates(str(root))
+
+
+def test_dedup_deletes_all_but_the_oldest_copy(tmp_path):
+    root = tmp_path / "downloads"
+    root.mkdir()
+    keep, copy = make_copies(root, "a.jpg", "b.jpg")
+    (root / "other.jpg").write_bytes(b"different content")
+    deduplicator, groups = find_duplicates(tmp_path, root)
+    assert [[entry.path for entry in group] for group in groups] == [[str(keep), str(copy)]]
+    assert deduplicator.resolve(groups, main.DEDUP_DELETE) == (1, len(b"same content"))
+    assert keep.exists() and not copy.exists()
+
+
+def test_dedup_hardlinks_copies(tmp_path):
+    root = tmp_path / "downloads"
+    root.mkdir()
+    keep, copy = make_copies(root, "a.jpg", "b.jpg")
+    deduplicator, groups = find_duplicates(tmp_path, root)
+    assert deduplicator.resolve(groups, main.DEDUP_HARDLINK) == (1, len(b"same content"))
+    assert os.path.samefile(keep, copy)
+    assert copy.read_bytes() == b"same content"
+
+
+def test_dedup_skips_files_changed_since_the_scan(tmp_path):
+    root = tmp_path / "downloads"
+    root.mkdir()
+    keep, copy, rewritten = make_copies(root, "a.jpg", "b.jpg", "c.jpg")
+    deduplicator, groups = find_duplicates(tmp_path, root)
+    rewritten.write_bytes(b"new download")
+    assert deduplicator.resolve(groups, main.DEDUP_DELETE) == (1, len(b"same content"))
+    assert not copy.exists()
+    assert rewritten.read_bytes() == b"new download"
+
+
+def test_dedup_skips_everything_if_the_kept_copy_changed(tmp_path):
+    root = tmp_path / "downloads"
+    root.mkdir()
+    keep, copy = make_copies(root, "a.jpg", "b.jpg")
+    deduplicator, groups = find_duplicates(tmp_path, root)
+    os.utime(keep, ns=(5_000_000_000,) * 2)
+    assert deduplicator.resolve(groups, main.DEDUP_HARDLINK) == (0, 0)
+    assert not os.path.samefile(keep, copy)
+
+
+def test_parse_range():
+    assert main.parse_range("1-3,5") == [range(1, 4), range(5, 6)]
+    assert main.parse_range("-2, 10-") == [range(1, 3), range(10, sys.maxsize)]
+    assert main.parse_range("1:10:2") == [range(1, 10, 2)]
+    assert main.parse_range("") == []
+
+
+def test_format_range_round_trips():
+    positions = [1, 2, 3, 5, 8, 9]
+    assert main.format_range(positions) == "1-3,5,8-9"
+    assert [n for n in range(1, 12) if any(n in r for r in main.parse_range(main.format_range(positions)))] == positions
+
+
+def test_compile_filter_evaluates_against_metadata():
+    filter_func = main.compile_filter("extension in ('jpg', 'png') and width >= 1000")
+    assert filter_func({"extension": "jpg", "width": 1200})
+    assert not filter_func({"extension": "gif", "width": 1200})
+
+
+def test_match_files_applies_filter_before_range():
+    files = [{"num": n, "filesize": n * 100} for n in range(1, 11)]
+    match = main.match_files(files, main.compile_filter("num % 2 == 0"), main.parse_range("2-3"), max_size=500)
+    # Range positions count the files that passed the filter: 2, 4, 6, ...
+    assert match.positions == [2]
+    assert match.matched == 1 and match.filtered == 5
+
+
+def test_optimize_filter_merges_tests_on_one_name():
+    plan = main.optimize_filter('extension != "gif" and extension != "webm" and width > 100')
+    assert plan.expression == "extension not in ('gif', 'webm') and width > 100"
+
+
+def test_optimize_filter_keeps_list_fields_working():
+    # Merged tests compare with ==, like the originals, so unhashable values do not raise
+    expression = "tags != 'a' and tags != 'b'"
+    filter_func = main.compile_filter(main.optimize_filter(expression).expression)
+    assert filter_func({"tags": ["a", "b"]})
+
+
+def test_optimize_filter_moves_expensive_clauses_back():
+    plan = main.optimize_filter("re.search('x', title) and width > 100")
+    assert plan.expression == "width > 100 and re.search('x', title)"
+
+
+def test_optimize_filter_keeps_control_clauses_in_place():
+    expression = "re.search('x', title) and (width > 5 or abort()) and height > 1"
+    optimized = main.optimize_filter(expression).expression
+    assert ast.dump(ast.parse(optimized)) == ast.dump(ast.parse(expression))
+
+
+def test_optimize_filter_rejects_invalid_input():
+    with pytest.raises(SyntaxError):
+        main.optimize_filter("width >")
+    with pytest.raises(ValueError):
+        main.optimize_filter("re.match('(', title)")
+
+
+def test_optimized_filter_selects_the_same_files():
+    corpus = [
+        {"extension": extension, "width": width, "title": title, "tags": tags}
+        for extension in ("jpg", "gif", "png")
+        for width in (50, 500)
+        for title in ("a cat", "dog", None)
+        for tags in (["a"], "b")
+    ]
+    expression = ("extension != 'gif' and title.lower().startswith('a') and width >= 100 "
+                  "and extension in ('jpg', 'png') and 'cat' in title.lower() and tags != 'b'")
+    result = main.benchmark_filter(expression, corpus, repeat=1)
+    assert result.mismatches == 0
+    assert result.matches == 2
+
+
+def test_known_files_answers_from_the_destination_index(tmp_path):
+    root = tmp_path / "downloads"
+    (root / "gallery").mkdir(parents=True)
+    (root / "gallery" / "done.jpg").write_bytes(b"x" * 100)
+    (root / "gallery" / "partial.jpg").write_bytes(b"x" * 10)
+    (root / "gallery" / "resuming.jpg").write_bytes(b"x" * 100)
+    (root / "gallery" / "resuming.jpg.part").write_bytes(b"x" * 50)
+    index = main.DestinationIndex(str(tmp_path / "index.sqlite3"))
+    index.refresh(str(root))
+    known = main.KnownFiles(index.path)
+    try:
+        assert known.exists(str(root / "gallery" / "done.jpg")) is True
+        assert known.exists(str(root / "gallery" / "done.jpg"), expected_size=100) is True
+        assert known.exists(str(root / "gallery" / "missing.jpg")) is False
+        # Smaller than its metadata says: downloaded again
+        assert known.exists(str(root / "gallery" / "partial.jpg"), expected_size=100) is False
+        # Unindexed directories and files with a .part beside them are checked on disk
+        assert known.exists(str(tmp_path / "elsewhere" / "done.jpg")) is None
+        assert known.exists(str(root / "gallery" / "resuming.jpg")) is None
+    finally:
+        known.close()
+
+
+def write_tag_index(tmp_path, rows):
+    index = main.TagIndex(str(tmp_path / "tags.idx"))
+    index.write(sorted(rows))
+    return index
+
+
+def test_tag_index_round_trip(tmp_path):
+    index = write_tag_index(tmp_path, [
+        ("blue_sky", "Blue Sky", 7), ("blue", "blue", 30), ("bluebird", "bluebird", 2), ("cat", "cat", 12),
+        ("café", "Café", 4),
+    ])
+    try:
+        assert index.count == 5
+        assert index.complete("Blue") == [("blue", 30), ("Blue Sky", 7), ("bluebird", 2)]
+        assert index.complete("caf") == [("Café", 4)]
+        assert index.complete("dog") == []
+        assert index.exists("blue sky") and not index.exists("blue_s")
+        assert index.suggest("bleu") == [("blue", 30)]
+    finally:
+        index.close()
+    # A second instance maps the file written by the first
+    reopened = main.TagIndex(str(tmp_path / "tags.idx"))
+    try:
+        assert reopened.count == 5
+        assert reopened.entry(reopened.span("cat")[0]) == ("cat", 12)
+    finally:
+        reopened.close()
+
+
+def test_tag_index_treats_a_damaged_file_as_empty(tmp_path):
+    index = write_tag_index(tmp_path, [("tag_%03d" % n, "tag %03d" % n, n) for n in range(100)])
+    index.close()
+    path = tmp_path / "tags.idx"
+    path.write_bytes(path.read_bytes()[:200])
+    damaged = main.TagIndex(str(path))
+    assert damaged.count == 0
+    assert damaged.complete("tag") == []
+    # Every tag is accepted until the index is rebuilt
+    assert damaged.exists("anything")
+    damaged.write([("fresh", "fresh", 1)])
+    assert damaged.complete("fr") == [("fresh", 1)]
+    damaged.close()
+
+
+@pytest.mark.skipif(not main.ARCHIVE_RAW_DEFLATE, reason="raw deflate path is off on this Python")
+def test_append_zip_entry_round_trip(tmp_path):
+    source = tmp_path / "notes.txt"
+    source.write_bytes(b"hello archive\n" * 5000)
+    path = tmp_path / "gallery.zip"
+    with zipfile.ZipFile(path, "w") as zfile:
+        zfile.writestr("first.txt", "written by zipfile")
+    # Appended to an existing archive, like ArchiveStage does
+    with zipfile.ZipFile(path, "a") as zfile:
+        spool, crc, size = main.deflate_file(str(source))
+        with spool:
+            zinfo = zipfile.ZipInfo.from_file(str(source), "notes.txt")
+            zinfo.CRC, zinfo.file_size = crc, size
+            zinfo.compress_size = len(spool.read())
+            spool.seek(0)
+            main.append_zip_entry(zfile, zinfo, spool)
+        zfile.writestr("last.txt", "after the raw entry")
+    with zipfile.ZipFile(path) as zfile:
+        assert zfile.testzip() is None
+        assert zfile.namelist() == ["first.txt", "notes.txt", "last.txt"]
+        assert zfile.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert zfile.read("notes.txt") == source.read_bytes()
+
+
+@pytest.mark.parametrize("raw_deflate", [
+    pytest.param(True, marks=pytest.mark.skipif(not main.ARCHIVE_RAW_DEFLATE, reason="raw deflate path is off on this Python")),
+    False,
+])
+def test_archive_stage_round_trip(tmp_path, monkeypatch, raw_deflate):
+    monkeypatch.setattr(main, "ARCHIVE_RAW_DEFLATE", raw_deflate)
+    # Fewer open archives than directories, so some are closed and reopened mid-run
+    monkeypatch.setattr(main, "ARCHIVE_OPEN_LIMIT", 2)
+    contents = {}
+    for number in range(5):
+        directory = tmp_path / f"gallery{number}"
+        directory.mkdir()
+        for name, data in (("page.txt", b"text %d\n" % number * 1000), ("image.jpg", os.urandom(2000))):
+            (directory / name).write_bytes(data)
+            contents[str(directory / name)] = data
+    with zipfile.ZipFile(tmp_path / "gallery0.zip", "w") as zfile:
+        zfile.writestr("page.txt", "already archived")
+
+    stage = main.ArchiveStage(log=lambda message: None)
+    stage.start([".zip"], workers=3)
+    for path in contents:
+        stage.on_event(None, main.DownloadEvent(main.EVENT_FILE, path=path))
+    stats = stage.finish()
+
+    assert stats["archives"] == 5 and stats["duplicates"] == 1
+    for number in range(5):
+        with zipfile.ZipFile(tmp_path / f"gallery{number}.zip") as zfile:
+            assert zfile.testzip() is None
+            assert sorted(zfile.namelist()) == ["image.jpg", "page.txt"]
+            assert zfile.getinfo("image.jpg").compress_type == zipfile.ZIP_STORED
+            assert zfile.read("image.jpg") == contents[str(tmp_path / f"gallery{number}" / "image.jpg")]
+            if number:
+                assert zfile.getinfo("page.txt").compress_type == zipfile.ZIP_DEFLATED
+                assert zfile.read("page.txt") == contents[str(tmp_path / f"gallery{number}" / "page.txt")]
+    # Archived sources are deleted with their emptied directories; a name already taken stays on disk
+    assert sorted(os.listdir(tmp_path)) == ["gallery0"] + [f"gallery{number}.zip" for number in range(5)]
+    assert os.listdir(tmp_path / "gallery0") == ["page.txt"]
+
+
+def mp4_box(box_type, payload=b""):
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def check_mp4(data):
+    return main.check_mp4_boxes(io.BytesIO(data), len(data))
+
+
+def test_check_mp4_boxes_accepts_a_complete_file():
+    assert check_mp4(mp4_box(b"ftyp", b"isom") + mp4_box(b"moov", b"x" * 20) + mp4_box(b"mdat", b"y" * 100)) is None
+    # A 64-bit box size, and a last box that runs to the end of the file
+    large = struct.pack(">I4sQ", 1, b"mdat", 16 + 50) + b"y" * 50
+    assert check_mp4(mp4_box(b"ftyp") + mp4_box(b"moov") + large) is None
+    assert check_mp4(mp4_box(b"ftyp") + mp4_box(b"moov") + struct.pack(">I4s", 0, b"mdat") + b"y" * 10) is None
+
+
+def test_check_mp4_boxes_finds_truncation():
+    data = mp4_box(b"ftyp", b"isom") + mp4_box(b"moov", b"x" * 20) + mp4_box(b"mdat", b"y" * 100)
+    assert check_mp4(data[:-10]) == f"MP4 truncated ({len(data) - 10:,} of {len(data):,} bytes)"
+    assert check_mp4(data + b"\0\0\0") == "truncated MP4 box header"
+    assert check_mp4(mp4_box(b"ftyp") + mp4_box(b"mdat", b"y" * 10)) == "MP4 has no moov box"
+    assert check_mp4(mp4_box(b"ftyp") + struct.pack(">I4s", 4, b"moov")) == "invalid MP4 box size at offset 8"
+
+
+def test_retry_queue_backs_off_exponentially():
+    retries = main.RetryQueue(base_delay=10, max_delay=60, max_attempts=5)
+    delays = [retries.add("https://example.com/a", [], "engine", 1, now=0).due for _ in range(5)]
+    # Jitter keeps each delay between half and all of 10, 20, 40, 60 and 60 seconds
+    for due, delay in zip(delays, (10, 20, 40, 60, 60)):
+        assert delay / 2 <= due <= delay
+    assert retries.add("https://example.com/a", [], "engine", 1, now=0).due is None
+    retries.succeeded("https://example.com/a")
+    assert retries.add("https://example.com/a", [], "engine", 1, now=0).attempt == 1
+
+
+def test_retry_queue_never_schedules_permanent_errors():
+    retries = main.RetryQueue()
+    assert retries.add("https://example.com/gone", [], "engine", 64, now=0).due is None
+    assert retries.next_due() is None
+    assert retries.pop_due(now=10 ** 9) == []
+    assert [item.url for item in retries.pop_all()] == ["https://example.com/gone"]
+
+
+def test_retry_queue_releases_a_hosts_urls_together():
+    retries = main.RetryQueue(base_delay=100, max_delay=100)
+    retries.add("https://a.example/1", [], "engine", 1, now=0)
+    retries.add("https://a.example/2", [], "engine", 1, now=main.RETRY_GROUP_WINDOW)
+    retries.add("https://b.example/1", [], "engine", 1, now=0)
+    assert retries.pop_due(now=49) == []
+    due = retries.pop_due(now=100)
+    assert {item.url for item in due} == {"https://a.example/1", "https://a.example/2", "https://b.example/1"}
+    assert len(retries) == 0